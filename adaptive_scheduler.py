@@ -0,0 +1,234 @@
+import random
+import threading
+import time
+import logging
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+from singleflight import SingleFlight
+from log_utils import error_limiter
+from metrics import POLL_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Статусы задания, при которых принтер считается свободным
+IDLE_JOB_STATUSES = {'', 'ready', 'idle', 'completed', 'complete', 'finished',
+                     'cancel', 'canceled', 'cancelled', 'stopped'}
+PAUSED_JOB_STATUSES = {'paused', 'pause', 'pausing'}
+
+
+class PollPolicy:
+    """Интервалы опроса принтера в зависимости от его состояния (сек)"""
+
+    def __init__(self, printing: float = 30.0, active: float = 10.0, paused: float = 60.0,
+                 idle: float = 300.0, offline_max: float = 600.0,
+                 camera_printing: float = 60.0, camera_idle: float = 600.0,
+                 near_completion_minutes: float = 10.0, heating_margin: float = 3.0):
+        self.printing = printing
+        self.active = active
+        self.paused = paused
+        self.idle = idle
+        self.offline_max = offline_max
+        self.camera_printing = camera_printing
+        self.camera_idle = camera_idle
+        self.near_completion_minutes = near_completion_minutes
+        self.heating_margin = heating_margin
+
+    def is_heating(self, record: Dict[str, Any]) -> bool:
+        """Нагрев: целевая температура задана и еще не достигнута"""
+        for key in ('extruder_temp', 'bed_temp'):
+            temp = record.get(key) or {}
+            target = temp.get('target') or 0
+            if target > 0 and (temp.get('current') or 0) < target - self.heating_margin:
+                return True
+        return False
+
+    def classify(self, record: Optional[Dict[str, Any]], failures: int) -> str:
+        """Состояние принтера для выбора интервала"""
+        if failures or not record:
+            return 'offline'
+        if self.is_heating(record):
+            return 'heating'
+        job_status = str(record.get('job_status') or '').lower()
+        if job_status in IDLE_JOB_STATUSES:
+            return 'idle'
+        if job_status in PAUSED_JOB_STATUSES:
+            return 'paused'
+        estimate = record.get('estimate_minutes') or 0
+        if 0 < estimate <= self.near_completion_minutes or (record.get('progress_percent') or 0) >= 97:
+            return 'finishing'
+        return 'printing'
+
+    def status_interval(self, state: str, failures: int) -> float:
+        if state == 'offline':
+            # Экспоненциальное увеличение интервала для недоступного принтера
+            return min(self.offline_max, self.printing * 2 ** max(failures, 1))
+        return {
+            'heating': self.active,
+            'finishing': self.active,
+            'printing': self.printing,
+            'paused': self.paused,
+            'idle': self.idle,
+        }[state]
+
+    def camera_interval(self, state: str) -> Optional[float]:
+        """Интервал снепшотов камеры; None - не запрашивать (принтер недоступен)"""
+        if state == 'offline':
+            return None
+        if state in ('printing', 'finishing', 'heating'):
+            return self.camera_printing
+        return self.camera_idle
+
+
+class PrinterSchedule:
+    """Расписание опроса одного принтера"""
+
+    __slots__ = ('state', 'failures', 'interval', 'next_status', 'next_camera')
+
+    def __init__(self, next_status: float):
+        self.state = 'unknown'
+        self.failures = 0
+        self.interval = 0.0
+        self.next_status = next_status
+        self.next_camera: Optional[float] = None
+
+
+class AdaptivePoller:
+    """Опрос принтеров с индивидуальным интервалом вместо общего расписания.
+
+    Планировщик вызывает tick() раз в несколько секунд; за тик опрашиваются
+    только принтеры, у которых подошло время, одним параллельным пакетом.
+    Интервалы зависят от состояния принтера (PollPolicy), а случайное
+    отклонение jitter разносит опросы во времени, чтобы большой парк не
+    обращался к облаку одновременно.
+
+    Все запросы статусов (плановые и ручные) идут через SingleFlight, поэтому
+    ручное обновление присоединяется к уже выполняющемуся опросу принтера.
+    """
+
+    def __init__(self, fleet, policy: Optional[PollPolicy] = None, jitter: float = 0.2,
+                 max_batch: Optional[int] = None,
+                 camera_callback: Optional[Callable[[str], None]] = None):
+        self.fleet = fleet
+        self.policy = policy or PollPolicy()
+        self.jitter = jitter
+        self.max_batch = max_batch
+        self.camera_callback = camera_callback
+        self._lock = threading.Lock()
+        self._schedules: Dict[str, PrinterSchedule] = {}
+        self.flight = SingleFlight('GetPrinterStatus')
+        self.polls_total = 0
+
+    def _spread(self, interval: float) -> float:
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _schedule(self, registration_code: str, now: float) -> PrinterSchedule:
+        schedule = self._schedules.get(registration_code)
+        if schedule is None:
+            # Новый принтер: первый опрос в случайный момент ближайшего интервала
+            schedule = PrinterSchedule(now + random.uniform(0, self.policy.printing))
+            self._schedules[registration_code] = schedule
+        return schedule
+
+    def due(self, now: Optional[float] = None) -> Tuple[List[str], List[str]]:
+        """Принтеры, которым пора обновить статус и снепшот камеры"""
+        now = time.time() if now is None else now
+        codes = self.fleet.codes
+        with self._lock:
+            for code in list(self._schedules):
+                if code not in codes:
+                    del self._schedules[code]
+            schedules = {code: self._schedule(code, now) for code in codes}
+            status_due = sorted((s.next_status, code) for code, s in schedules.items() if s.next_status <= now)
+            camera_due = [code for code, s in schedules.items()
+                          if s.next_camera is not None and s.next_camera <= now]
+
+        if self.max_batch:
+            # Самые просроченные первыми, остальные - в следующий тик
+            status_due = status_due[:self.max_batch]
+        for next_status, code in status_due:
+            POLL_LAG_SECONDS.observe(now - next_status, code)
+        return [code for _, code in status_due], camera_due
+
+    def refresh(self, codes: List[str], min_age: float = 0.0,
+                timeout: Optional[float] = None) -> Dict[str, Tuple[Optional[Dict[str, Any]], str]]:
+        """Обновление статусов с объединением запросов: {код: (статус, источник)}.
+
+        Статус моложе min_age секунд берется из последнего опроса без обращения к облаку.
+        """
+        if not codes:
+            return {}
+        return self.flight.do_many(codes, self._fetch, min_age, timeout)
+
+    def poll(self, codes: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Опрос принтеров и пересчет их расписания"""
+        return {code: status for code, (status, _) in self.refresh(codes).items()}
+
+    def _fetch(self, codes: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        statuses = self.fleet.update_many(codes)
+        now = time.time()
+        with self._lock:
+            self.polls_total += len(codes)
+            for code in codes:
+                schedule = self._schedule(code, now)
+                if code not in statuses:
+                    # Опрос пропущен разомкнутым выключателем: о принтере ничего нового не известно
+                    schedule.next_status = now + self._spread(schedule.interval or self.policy.printing)
+                    continue
+                status = statuses[code]
+                schedule.failures = 0 if status else schedule.failures + 1
+                state = self.policy.classify(status, schedule.failures)
+                schedule.state = state
+                schedule.interval = self.policy.status_interval(state, schedule.failures)
+                schedule.next_status = now + self._spread(schedule.interval)
+
+                camera_interval = self.policy.camera_interval(state)
+                if camera_interval is None:
+                    schedule.next_camera = None
+                elif schedule.next_camera is None or schedule.next_camera - now > camera_interval:
+                    # Камера опрашивается не реже, чем требует текущее состояние
+                    schedule.next_camera = now + self._spread(camera_interval) * 0.5
+        return statuses
+
+    def update_cameras(self, codes: List[str]):
+        if not self.camera_callback:
+            return
+        for code in codes:
+            with self._lock:
+                schedule = self._schedules.get(code)
+                if schedule is None:
+                    continue
+                camera_interval = self.policy.camera_interval(schedule.state)
+                schedule.next_camera = time.time() + self._spread(camera_interval) if camera_interval else None
+            try:
+                self.camera_callback(code)
+            except Exception as e:
+                error_limiter.log(logger, logging.ERROR, ('camera_update', code),
+                                  "Ошибка обновления камеры принтера %s: %s", code, e)
+
+    def tick(self):
+        """Задача планировщика: опрос принтеров, у которых подошло время"""
+        status_codes, camera_codes = self.due()
+        if status_codes:
+            self.poll(status_codes)
+            logger.debug("Адаптивный опрос: %s принтеров", len(status_codes))
+        self.update_cameras(camera_codes)
+
+    def stats(self) -> Dict[str, Any]:
+        """Текущее расписание: состояние, интервал и время до следующего опроса по принтерам"""
+        now = time.time()
+        with self._lock:
+            printers = {
+                code: {
+                    'state': s.state,
+                    'failures': s.failures,
+                    'interval': round(s.interval, 1),
+                    'next_status_in': round(max(0.0, s.next_status - now), 1),
+                    'next_camera_in': round(max(0.0, s.next_camera - now), 1) if s.next_camera is not None else None,
+                }
+                for code, s in self._schedules.items()
+            }
+            polls_total = self.polls_total
+        states: Dict[str, int] = {}
+        for info in printers.values():
+            states[info['state']] = states.get(info['state'], 0) + 1
+        return {'polls_total': polls_total, 'requests': self.flight.stats(), 'states': states, 'printers': printers}
@@ -1,10 +1,33 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, render_template, jsonify, request, stream_with_context, g
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+from datetime import datetime, timedelta
+import os
 import threading
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from sz3dp_client import SZ3DPCloudClient
+from session_cache import SessionCache
+from fleet import PrinterFleet
+from snapshots import SnapshotStore, snapshot_url, parse_variant_sizes
+from stream import StatusBroadcaster
+from state_store import create_state_store, StoreWatcher
+from telemetry import TelemetryStore, TELEMETRY_FIELDS
+from rollup import RollupStore
+from snapshot_archive import SnapshotArchive, MJPEG_BOUNDARY
+from adaptive_scheduler import AdaptivePoller, PollPolicy
+from singleflight import SingleFlight, SOURCE_CACHE
+from viewers import ViewerTracker
+from events import EventDetector, EventDispatcher, create_sinks
+from circuit_breaker import CircuitOpenError
+from compression import ResponseCompressor
+from camera import CameraManager, thread_timer, READY as CAMERA_READY, WARMING as CAMERA_WARMING, OPENING as CAMERA_OPENING
+from log_utils import configure_logging, error_limiter
+from metrics import (REGISTRY as metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE, SCHEDULER_LAG_SECONDS,
+                     SCHEDULER_OVERRUNS, SNAPSHOT_BYTES, HTTP_SECONDS)
 from config import Config
 
 # Настройка логирования
@@ -13,187 +36,734 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config.from_object(Config)
-
-# Глобальные переменные для хранения данных
-printer_data = {
-    'model_name': 'Загрузка...',
-    'progress_percent': 0,
-    'time_remaining': 'Загрузка...',
-    'extruder_temp': {'current': 0, 'target': 0},
-    'bed_temp': {'current': 0, 'target': 0},
-    'enclosure_status': 'Загрузка...',
-    'filament_status': 'Загрузка...',
-    'last_update': 'Не обновлено',
-    'connection_status': 'Отключено',
-    'camera_snapshot': None,
-    'camera_enabled': False,
-    'snapshot_last_update': 'Не обновлено'
-}
+configure_logging(app.config['LOG_LEVEL'], app.config['LOG_ERROR_INTERVAL'])
 
 # Инициализация клиента
 client = SZ3DPCloudClient(
     email=app.config['EMAIL'],
     password=app.config['PASSWORD'],
-    base_url=app.config['API_BASE_URL']
+    base_url=app.config['API_BASE_URL'],
+    session_cache=SessionCache(app.config['SESSION_CACHE_FILE'], app.config['SESSION_CACHE_TTL'])
+    if app.config['SESSION_CACHE_FILE'] else None,
+    max_retries=app.config['REQUEST_RETRIES'],
+    backoff_base=app.config['REQUEST_BACKOFF_BASE'],
+    backoff_max=app.config['REQUEST_BACKOFF_MAX'],
+    pool_connections=app.config['HTTP_POOL_CONNECTIONS'],
+    pool_maxsize=app.config['HTTP_POOL_MAXSIZE'],
+    pool_block=app.config['HTTP_POOL_BLOCK'],
+    connect_timeout=app.config['HTTP_CONNECT_TIMEOUT'],
+    read_timeout=app.config['HTTP_READ_TIMEOUT'],
+    connect_retries=app.config['HTTP_CONNECT_RETRIES'],
+    tcp_keepalive=app.config['HTTP_TCP_KEEPALIVE'],
+    keep_raw_status=app.config['STATUS_KEEP_RAW'],
+    breaker_threshold=app.config['CIRCUIT_FAILURE_THRESHOLD'],
+    breaker_recovery=app.config['CIRCUIT_RECOVERY_TIMEOUT']
+)
+
+# Хранилище состояния: в памяти процесса или общее для веб-воркеров и опросчика
+state_store = create_state_store(app.config['STATE_BACKEND'], app.config['STATE_DB_PATH'])
+
+# Парк принтеров: одна авторизованная сессия опрашивает все принтеры
+fleet = PrinterFleet(
+    client,
+    app.config['PRINTER_CODES'],
+    max_workers=app.config['POLL_MAX_WORKERS'],
+    request_timeout=app.config['POLL_REQUEST_TIMEOUT'],
+    store=state_store
+)
+
+# Снепшоты камер хранятся декодированными и отдаются отдельным бинарным endpoint
+snapshots = SnapshotStore(
+    state_store,
+    variant_sizes=parse_variant_sizes(app.config['SNAPSHOT_VARIANTS']),
+    quality=app.config['SNAPSHOT_VARIANT_QUALITY']
+)
+
+# История телеметрии: каждый полученный статус дописывается в файл принтера
+# и по мере записи сворачивается в агрегаты 1 мин / 15 мин / 1 ч (пишет только
+# опрашивающий процесс, см. start_polling)
+telemetry = TelemetryStore(app.config['TELEMETRY_DIR']) if app.config['TELEMETRY_DIR'] else None
+rollups = RollupStore(telemetry) if telemetry is not None else None
+
+# События принтеров: сравнение каждого статуса с предыдущим и доставка получателям
+event_detector = EventDetector(
+    offline_after=app.config['EVENT_OFFLINE_AFTER'],
+    stall_timeout=app.config['EVENT_STALL_TIMEOUT'],
+    temp_tolerance=app.config['EVENT_TEMP_TOLERANCE'],
+    temp_grace=app.config['EVENT_TEMP_GRACE']
 )
+events = EventDispatcher(
+    create_sinks(
+        webhook_url=app.config['EVENTS_WEBHOOK_URL'],
+        file_path=app.config['EVENTS_FILE'],
+        email_to=app.config['EVENTS_EMAIL_TO'],
+        smtp_host=app.config['SMTP_HOST'],
+        smtp_port=app.config['SMTP_PORT'],
+        smtp_user=app.config['SMTP_USER'],
+        smtp_password=app.config['SMTP_PASSWORD'],
+        smtp_from=app.config['SMTP_FROM'],
+        smtp_tls=app.config['SMTP_TLS']
+    ),
+    dedup_window=app.config['EVENTS_DEDUP_WINDOW'],
+    rate_limit=app.config['EVENTS_RATE_LIMIT'],
+    rate_interval=app.config['EVENTS_RATE_INTERVAL'],
+    store=state_store
+)
+
+def record_events(code, status):
+    """Обработчик статусов парка: события перехода от предыдущего статуса"""
+    events.publish(event_detector.detect(code, status))
+
+# Архив снепшотов для таймлапсов: одинаковые кадры хранятся один раз
+archive = SnapshotArchive(app.config['SNAPSHOT_ARCHIVE_DIR'], app.config['SNAPSHOT_RETENTION_DAYS']) \
+    if app.config['SNAPSHOT_ARCHIVE_DIR'] else None
+
+# Рассылка изменений статусов через Server-Sent Events (/api/stream)
+broadcaster = StatusBroadcaster(keepalive=app.config['STREAM_KEEPALIVE'])
+
+def publish_changes(code, changes, version):
+    """Отправка изменений записи принтера подписчикам потока"""
+    broadcaster.publish(code, 'diff', {'regcode': code, 'version': version, 'changes': changes})
+
+if state_store.shared:
+    # Изменения может записать другой процесс (опросчик), поэтому поток
+    # питается из хранилища; наблюдатель запускается с первым подписчиком
+    store_watcher = StoreWatcher(state_store, publish_changes, app.config['STATE_WATCH_INTERVAL'])
+else:
+    store_watcher = None
+    fleet.add_listener(publish_changes)
 
 def update_printer_data():
-    """Функция обновления данных принтера"""
-    global printer_data
-    
-    try:
-        logger.info("Обновление данных принтера...")
-        status = client.get_printer_status("ULJMGV")  # Используем код принтера из curl
-        
-        if status:
-            printer_data.update({
-                'model_name': status.get('model_name', 'Неизвестная модель'),
-                'progress_percent': status.get('progress_percent', 0),
-                'time_remaining': status.get('time_remaining', 'Неизвестно'),
-                'extruder_temp': status.get('extruder_temp', {'current': 0, 'target': 0}),
-                'bed_temp': status.get('bed_temp', {'current': 0, 'target': 0}),
-                'enclosure_status': status.get('enclosure_status', 'Неизвестно'),
-                'filament_status': status.get('filament_status', 'Неизвестно'),
-                'printer_name': status.get('printer_name', ''),
-                'registration_code': status.get('registration_code', ''),
-                'firmware_version': status.get('firmware_version', ''),
-                'printer_type': status.get('printer_type', ''),
-                'measure': status.get('measure', ''),
-                'job_status': status.get('job_status', ''),
-                'duration': status.get('duration', 0),
-                'last_update': time.strftime('%H:%M:%S'),
-                'connection_status': 'Подключено'
-            })
-            logger.info("Данные успешно обновлены")
-            logger.info(f"Принтер: {status.get('printer_name', 'Unknown')} - {status.get('job_status', 'Unknown')}")
-        else:
-            printer_data['connection_status'] = 'Ошибка подключения'
-            printer_data['last_update'] = time.strftime('%H:%M:%S')
-            logger.warning("Не удалось получить данные принтера")
-            
-    except Exception as e:
-        logger.error(f"Ошибка при обновлении данных: {e}")
-        printer_data['connection_status'] = f'Ошибка: {str(e)}'
-        printer_data['last_update'] = time.strftime('%H:%M:%S')
+    """Функция обновления данных всех принтеров парка"""
+    logger.debug("Обновление данных принтеров...")
+    if not fleet.codes:
+        fleet.discover()
+    statuses = poller.poll(fleet.codes)
+    updated = sum(1 for status in statuses.values() if status)
+    logger.debug("Данные обновлены: %s из %s принтеров", updated, len(fleet.codes))
 
-def update_camera_snapshot():
-    """Функция обновления снепшота камеры"""
-    global printer_data
+# Одновременные обновления снепшота одного принтера объединяются в один запрос
+camera_flight = SingleFlight('GetPrinterSnapshot')
+
+def update_camera_snapshot(registration_code=None):
+    """Функция обновления снепшота камеры (одного принтера или всех)"""
+    codes = [registration_code] if registration_code else fleet.codes
+    for code in codes:
+        refresh_camera(code)
+
+def refresh_camera(registration_code, min_age=0.0, timeout=None):
+    """Обновление снепшота через объединение запросов: (кадр, источник)"""
+    return camera_flight.do(registration_code, lambda: update_printer_camera(registration_code),
+                            min_age, timeout)
+
+def update_printer_camera(registration_code):
+    """Функция обновления снепшота камеры одного принтера, возвращает кадр или None.
+
+    Снепшот запрашивается только для принтеров, которые кто-то смотрит. Пока камера
+    прогревается, снепшот не запрашивается - его запросит обработчик готовности.
+    """
+    if fleet.get(registration_code) is None:
+        return None
+    if not viewers.active(registration_code):
+        logger.debug("У принтера %s нет зрителей, снепшот не запрашиваем", registration_code)
+        return None
+    
+    state = camera.ensure_open(registration_code)
+    if state != CAMERA_READY:
+        logger.debug("Камера принтера %s не готова (%s), снепшот не запрашиваем", registration_code, state)
+        return None
     
     try:
-        logger.info("=== ОБНОВЛЕНИЕ СНЕПШОТА КАМЕРЫ ===")
-        logger.info(f"Текущий статус камеры: {printer_data.get('camera_enabled', False)}")
+        logger.debug("Запрашиваем снепшот с камеры принтера %s...", registration_code)
+        snapshot_data = client.get_printer_snapshot(registration_code)
         
-        # Если камера еще не включена, пробуем включить
-        if not printer_data.get('camera_enabled', False):
-            logger.info("Камера не включена, пробуем включить...")
-            camera_result = client.open_camera("ULJMGV")
-            logger.info(f"Результат включения камеры: {camera_result}")
+        frame = snapshots.put(registration_code, snapshot_data) if snapshot_data else None
+        if frame:
+            logger.debug("✅ Получен снепшот принтера %s размером %s байт", registration_code, frame.size)
+            SNAPSHOT_BYTES.observe(frame.size, registration_code)
+            if archive is not None and polling:
+                archive.add(registration_code, frame.data, frame.updated_at)
             
-            if camera_result:
-                printer_data['camera_enabled'] = True
-                logger.info("✅ Камера успешно включена")
-                # Небольшая задержка после включения камеры
-                time.sleep(2)
-            else:
-                logger.warning("❌ Не удалось включить камеру")
-                printer_data['camera_enabled'] = False
-                printer_data['snapshot_last_update'] = time.strftime('%H:%M:%S')
-                return
-        else:
-            logger.info("Камера уже включена, получаем снепшот...")
-        
-        # Получаем снепшот
-        logger.info("Запрашиваем снепшот с камеры...")
-        snapshot_data = client.get_printer_snapshot("ULJMGV")
+            fleet.set_fields(registration_code,
+                             snapshot_url=snapshot_url(registration_code, frame),
+                             snapshot_version=frame.etag,
+                             snapshot_last_update=time.strftime('%H:%M:%S'))
+            return frame
         
-        if snapshot_data:
-            # Проверяем размер данных
-            data_size = len(snapshot_data)
-            logger.info(f"✅ Получен снепшот размером {data_size} символов")
-            logger.info(f"Первые 100 символов: {snapshot_data[:100]}...")
-            
-            printer_data['camera_snapshot'] = snapshot_data
-            printer_data['snapshot_last_update'] = time.strftime('%H:%M:%S')
-            logger.info("✅ Снепшот камеры успешно сохранен")
-        else:
-            logger.warning("❌ Не удалось получить снепшот камеры (пустые данные)")
-            printer_data['snapshot_last_update'] = time.strftime('%H:%M:%S')
-            
+        # Камера могла выключиться в облаке: при следующем обновлении она будет включена заново
+        error_limiter.log(logger, logging.WARNING, ('snapshot', registration_code),
+                          "❌ Не удалось получить снепшот камеры %s (пустые данные)", registration_code)
+        camera.mark_failed(registration_code, 'Пустой снепшот')
+    except CircuitOpenError as e:
+        # Облако недоступно: камера не считается выключившейся, последний кадр остается
+        logger.debug("Снепшот принтера %s не запрошен: %s", registration_code, e)
+        return None
     except Exception as e:
-        logger.error(f"❌ Ошибка при обновлении снепшота камеры: {e}")
-        import traceback
-        logger.error(f"Трассировка: {traceback.format_exc()}")
-        printer_data['snapshot_last_update'] = time.strftime('%H:%M:%S')
+        error_limiter.log(logger, logging.ERROR, ('snapshot', registration_code),
+                          "❌ Ошибка при обновлении снепшота камеры %s: %s", registration_code, e)
+        camera.mark_failed(registration_code, str(e))
+    fleet.set_fields(registration_code, snapshot_last_update=time.strftime('%H:%M:%S'))
+    return None
+
+def defer_call(delay, callback):
+    """Отложенный вызов: задачей планировщика, если он запущен, иначе в фоновом таймере"""
+    if scheduler.running:
+        scheduler.add_job(callback, trigger=DateTrigger(run_date=datetime.now() + timedelta(seconds=delay)),
+                          misfire_grace_time=30)
+    else:
+        thread_timer(delay, callback)
+
+def camera_state_changed(registration_code, state):
+    """Отражение состояния сессии камеры в записи принтера"""
+    fleet.set_fields(registration_code,
+                     camera_state=state,
+                     camera_enabled=state in (CAMERA_WARMING, CAMERA_READY))
+
+# Зрители принтеров: подписчики потока и недавние запросы снепшотов
+viewers = ViewerTracker(state_store, grace=app.config['VIEWER_GRACE_PERIOD'])
+
+# Сессии камер: включение без блокировки на время прогрева и продление до истечения
+camera = CameraManager(
+    client,
+    viewers,
+    warmup=app.config['CAMERA_WARMUP'],
+    session_ttl=app.config['CAMERA_SESSION_TTL'],
+    reopen_margin=app.config['CAMERA_REOPEN_MARGIN'],
+    defer=defer_call,
+    on_ready=lambda code: refresh_camera(code),
+    on_change=camera_state_changed
+)
+
+def maintain_cameras():
+    """Обслуживание камер: сессии по зрителям, снепшот для новых зрителей
+    и освобождение кадров принтеров, которые никто не смотрит"""
+    codes = fleet.codes
+    camera.maintain(codes)
+    for code in codes:
+        record = fleet.get(code) or {}
+        if viewers.active(code):
+            if not record.get('snapshot_url') and camera.state(code) == CAMERA_READY:
+                refresh_camera(code)
+        else:
+            # Последний результат объединения запросов тоже держит кадр принтера
+            camera_flight.forget(code)
+            if snapshots.evict(code):
+                logger.info("У принтера %s нет зрителей, снепшот освобожден", code)
+                fleet.set_fields(code, snapshot_url=None, snapshot_version=None)
+
+def prune_snapshot_archive():
+    """Функция очистки архива снепшотов по сроку хранения"""
+    try:
+        archive.prune()
+    except OSError as e:
+        logger.error("Ошибка очистки архива снепшотов: %s", e)
+
+def versioned_response(version, build_payload):
+    """JSON ответ с версией состояния: ETag/If-None-Match (304) и дельта ?since=<версия>
+
+    build_payload(since) вызывается только если ответ действительно нужен;
+    since равен None для полного ответа.
+    """
+    etag = f'v{version}'
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        since = request.args.get('since', type=int)
+        payload = build_payload(since)
+        if since is not None:
+            payload = {'version': version, 'since': since, 'changes': payload}
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['X-State-Version'] = str(version)
+    response.cache_control.no_cache = True
+    return response
 
-# Настройка планировщика задач
+def requested_printer_code():
+    """Код принтера из параметра ?regcode= или принтер по умолчанию"""
+    return request.args.get('regcode') or fleet.default_code
+
+def requested_time_range(default_span=24 * 3600):
+    """Интервал из параметров ?from=&to= (unix время, сек), по умолчанию последние сутки"""
+    end = request.args.get('to', type=float) or time.time()
+    start = request.args.get('from', type=float)
+    if start is None:
+        start = end - default_span
+    return start, end
+
+# Адаптивный опрос: интервал каждого принтера зависит от его состояния
+poller = AdaptivePoller(
+    fleet,
+    PollPolicy(
+        printing=app.config['POLL_INTERVAL_PRINTING'],
+        active=app.config['POLL_INTERVAL_ACTIVE'],
+        paused=app.config['POLL_INTERVAL_PAUSED'],
+        idle=app.config['POLL_INTERVAL_IDLE'],
+        offline_max=app.config['POLL_INTERVAL_OFFLINE_MAX'],
+        camera_printing=app.config['CAMERA_INTERVAL_PRINTING'],
+        camera_idle=app.config['CAMERA_INTERVAL_IDLE']
+    ),
+    jitter=app.config['POLL_JITTER'],
+    max_batch=app.config['POLL_MAX_BATCH'],
+    camera_callback=refresh_camera
+)
+
+# Настройка планировщика задач: частый тик, опрашиваются только принтеры, которым пора
 scheduler = BackgroundScheduler()
 scheduler.add_job(
-    func=update_printer_data,
-    trigger=IntervalTrigger(seconds=30),
-    id='update_printer_data',
-    name='Обновление данных принтера каждые 30 секунд',
+    func=poller.tick,
+    trigger=IntervalTrigger(seconds=app.config['POLL_TICK']),
+    id='adaptive_poll',
+    name='Адаптивный опрос принтеров и камер',
+    max_instances=1,
+    coalesce=True,
     replace_existing=True
 )
 
-# Планировщик для обновления снепшота камеры (реже, чем основные данные)
+# Продление сессий просматриваемых камер, включение камер, у которых появились зрители,
+# и освобождение снепшотов принтеров без зрителей
 scheduler.add_job(
-    func=update_camera_snapshot,
-    trigger=IntervalTrigger(seconds=60),  # Каждую минуту
-    id='update_camera_snapshot',
-    name='Обновление снепшота камеры каждые 60 секунд',
+    func=maintain_cameras,
+    trigger=IntervalTrigger(seconds=10),
+    id='camera_maintenance',
+    name='Обслуживание сессий камер',
+    max_instances=1,
+    coalesce=True,
     replace_existing=True
 )
 
+# Очистка архива снепшотов раз в час
+if archive is not None:
+    scheduler.add_job(
+        func=prune_snapshot_archive,
+        trigger=IntervalTrigger(hours=1),
+        id='prune_snapshot_archive',
+        name='Очистка архива снепшотов каждый час',
+        replace_existing=True
+    )
+
+# Обновления, запрошенные веб-воркерами через общее хранилище (см. delegates_refresh)
+REFRESH_STATUS = 'status'
+REFRESH_CAMERA = 'camera'
+REFRESH_CAMERA_ENABLE = 'camera_enable'
+
+def serve_refresh_requests():
+    """Выполнение обновлений, запрошенных веб-воркерами (код '' - все принтеры)"""
+    for code, action in state_store.take_refresh_requests():
+        if code and code not in fleet:
+            continue
+        try:
+            if action == REFRESH_STATUS:
+                poller.refresh([code] if code else fleet.codes, min_age=app.config['REFRESH_MIN_FRESHNESS'],
+                               timeout=app.config['REFRESH_WAIT_TIMEOUT'])
+            elif action == REFRESH_CAMERA:
+                refresh_camera(code, min_age=app.config['REFRESH_MIN_FRESHNESS'],
+                               timeout=app.config['REFRESH_WAIT_TIMEOUT'])
+            elif action == REFRESH_CAMERA_ENABLE:
+                camera.ensure_open(code, force=True)
+        except Exception as e:
+            logger.error("Ошибка обновления %s по запросу веб-воркера для %s: %s", action, code or 'всех', e)
+
+if state_store.shared:
+    scheduler.add_job(
+        func=serve_refresh_requests,
+        trigger=IntervalTrigger(seconds=app.config['STATE_WATCH_INTERVAL']),
+        id='refresh_requests',
+        name='Обновления по запросам веб-воркеров',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+
+# Периодические задачи; отложенные вызовы (defer_call) учитываются в метриках как 'deferred'
+SCHEDULED_JOBS = {'adaptive_poll', 'camera_maintenance', 'prune_snapshot_archive', 'refresh_requests'}
+
+def record_scheduler_event(event):
+    """Метрики планировщика: задержка запуска задач и пропущенные запуски"""
+    job = event.job_id if event.job_id in SCHEDULED_JOBS else 'deferred'
+    if event.code == EVENT_JOB_SUBMITTED:
+        now = time.time()
+        for run_time in event.scheduled_run_times:
+            SCHEDULER_LAG_SECONDS.observe(max(0.0, now - run_time.timestamp()), job)
+    elif event.code == EVENT_JOB_MAX_INSTANCES:
+        # Предыдущий запуск еще выполняется
+        SCHEDULER_OVERRUNS.inc(job, 'running')
+    else:
+        SCHEDULER_OVERRUNS.inc(job, 'missed')
+
+scheduler.add_listener(record_scheduler_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+
+# Опрашивает ли облако этот процесс (--mode all или poller)
+polling = False
+
+def start_polling():
+    """Запуск опроса облака в этом процессе.
+
+    Телеметрию, агрегаты, события и архив снепшотов записывает только опрашивающий
+    процесс: их состояние (последние замеры, дедупликация событий) хранится в памяти
+    процесса, а веб-воркеры (--mode web) читают результат из файлов и общего хранилища.
+    """
+    global polling
+    if polling:
+        return
+    polling = True
+    if telemetry is not None:
+        fleet.add_status_listener(telemetry.record_status)
+        telemetry.add_listener(rollups.add_sample)
+    fleet.add_status_listener(record_events)
+    
+    # Первоначальное обновление данных и снепшотов просматриваемых камер
+    update_printer_data()
+    update_camera_snapshot()
+    scheduler.start()
+    logger.info("Планировщик задач запущен")
+
+def delegates_refresh():
+    """Веб-воркер с общим хранилищем не обращается к облаку: с облаком работает
+    только опросчик, обновления по запросу передаются ему через хранилище"""
+    return state_store.shared and not polling
+
+def queued_response(message, **fields):
+    """Ответ 202 на обновление, переданное опросчику; результат придет в поток изменений"""
+    return jsonify({'status': 'queued', 'message': message, **fields}), 202
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    """Время обработки запросов API (для потоков - до начала передачи)"""
+    started = g.pop('request_started', None)
+    if started is not None and request.endpoint and request.endpoint.startswith('api_'):
+        HTTP_SECONDS.observe(time.perf_counter() - started, request.endpoint)
+    return response
+
+# Сжатие JSON ответов, страницы и статики (потоки SSE не сжимаются)
+compressor = ResponseCompressor(
+    min_size=app.config['COMPRESS_MIN_SIZE'],
+    level=app.config['COMPRESS_LEVEL'],
+    brotli_quality=app.config['COMPRESS_BROTLI_QUALITY']
+) if app.config['COMPRESS_RESPONSES'] else None
+
+@app.after_request
+def compress_response(response):
+    if compressor is None:
+        return response
+    return compressor.process(request, response)
+
 @app.route('/')
 def index():
     """Главная страница"""
-    return render_template('index.html', data=printer_data)
+    data = fleet.get_default()
+    if data.get('registration_code'):
+        viewers.touch(data['registration_code'])
+    return render_template('index.html', data=data)
 
 @app.route('/api/status')
 def api_status():
-    """API endpoint для получения статуса принтера"""
-    return jsonify(printer_data)
+    """API endpoint для получения статуса принтера по умолчанию"""
+    code = fleet.default_code
+    if not code:
+        return jsonify(fleet.get_default())
+    return printer_status_response(code)
+
+@app.route('/api/printers')
+def api_printers():
+    """API endpoint для получения статусов всех принтеров парка"""
+    def build_payload(since):
+        if since is None:
+            printers = fleet.all()
+            return {'count': len(printers), 'printers': printers}
+        changes = {code: fleet.changes_since(code, since) for code in fleet.codes}
+        return {code: fields for code, fields in changes.items() if fields}
+    
+    return versioned_response(fleet.version, build_payload)
+
+@app.route('/api/printers/<regcode>/status')
+def api_printer_status(regcode):
+    """API endpoint для получения статуса конкретного принтера"""
+    if regcode not in fleet:
+        return jsonify({'status': 'error', 'message': f'Принтер {regcode} не найден'}), 404
+    return printer_status_response(regcode)
+
+def printer_status_response(regcode):
+    """Статус принтера с версией (полный или только изменения после ?since=)"""
+    def build_payload(since):
+        if since is None:
+            return fleet.get(regcode) or {}
+        return fleet.changes_since(regcode, since)
+    
+    return versioned_response(fleet.printer_version(regcode), build_payload)
+
+@app.route('/api/printers/<regcode>/history')
+def api_printer_history(regcode):
+    """История телеметрии принтера: ?from=&to= (unix время, сек), ?fields=поле1,поле2,
+    ?resolution=auto|raw|1m|15m|1h и ?max_points= - бюджет точек для выбора разрешения"""
+    if telemetry is None:
+        return jsonify({'status': 'error', 'message': 'История телеметрии отключена'}), 404
+    if regcode not in fleet:
+        return jsonify({'status': 'error', 'message': f'Принтер {regcode} не найден'}), 404
+    
+    start, end = requested_time_range()
+    fields = [field for field in request.args.get('fields', '').split(',') if field] or list(TELEMETRY_FIELDS)
+    unknown = [field for field in fields if field not in TELEMETRY_FIELDS]
+    if unknown:
+        return jsonify({'status': 'error', 'message': f'Неизвестные поля: {", ".join(unknown)}',
+                        'fields': list(TELEMETRY_FIELDS)}), 400
+    
+    resolution = request.args.get('resolution', 'auto')
+    if resolution == 'auto':
+        max_points = request.args.get('max_points', type=int) or app.config['HISTORY_MAX_POINTS']
+        resolution = rollups.choose_resolution(regcode, start, end, max(1, max_points))
+    elif resolution != 'raw' and resolution not in rollups.resolutions:
+        return jsonify({'status': 'error', 'message': f'Неизвестное разрешение: {resolution}',
+                        'resolutions': ['auto', 'raw', *rollups.resolutions]}), 400
+    
+    if resolution == 'raw':
+        series = telemetry.read(regcode, start, end, fields)
+    else:
+        series = rollups.read(regcode, resolution, start, end, fields)
+    return jsonify({'regcode': regcode, 'from': start, 'to': end, 'fields': fields,
+                    'resolution': resolution, **series.to_dict()})
+
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events: полный статус при подключении, затем только изменившиеся поля"""
+    regcode = request.args.get('regcode')
+    if regcode and regcode not in fleet:
+        return jsonify({'status': 'error', 'message': f'Принтер {regcode} не найден'}), 404
+    
+    # Подписка оформляется до чтения начального статуса: изменение, записанное между
+    # ними, придет дельтой поверх полного статуса, а не потеряется
+    if store_watcher is not None:
+        store_watcher.start()
+    subscription = broadcaster.subscribe(regcode)
+    if regcode:
+        initial = [('status', {'regcode': regcode, 'data': fleet.get(regcode) or {}})]
+    else:
+        initial = [('status', {'regcode': code, 'data': data}) for code, data in fleet.all().items()]
+    response = Response(
+        stream_with_context(viewers.watching(broadcaster.events(subscription, initial),
+                                             [regcode] if regcode else fleet.codes)),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Обновления по запросу веб-интерфейса выполняются в отдельном пуле: веб-поток
+# не ждет недоступное облако дольше REFRESH_WAIT_TIMEOUT секунд
+refresh_executor = ThreadPoolExecutor(max_workers=app.config['REFRESH_WORKERS'], thread_name_prefix='refresh')
+
+def run_bounded(fn, *args, **kwargs):
+    """Результат fn в пуле обновлений; по истечении REFRESH_WAIT_TIMEOUT - TimeoutError.
+
+    Запрос к облаку при этом продолжается в фоне, и его результат попадет в запись
+    принтера и поток изменений.
+    """
+    future = refresh_executor.submit(fn, *args, **kwargs)
+    try:
+        return future.result(timeout=app.config['REFRESH_WAIT_TIMEOUT'])
+    except FutureTimeoutError:
+        raise TimeoutError("Облако не ответило за время ожидания") from None
 
 @app.route('/api/refresh')
 def api_refresh():
-    """API endpoint для принудительного обновления данных"""
-    update_printer_data()
-    return jsonify({'status': 'success', 'message': 'Данные обновлены'})
+    """API endpoint для принудительного обновления данных (всех принтеров или ?regcode=).
+
+    Одновременные запросы присоединяются к уже выполняющемуся опросу, а данные
+    моложе REFRESH_MIN_FRESHNESS секунд возвращаются без обращения к облаку.
+    Если облако не отвечает, возвращаются последние полученные данные (status: stale).
+    """
+    regcode = request.args.get('regcode')
+    if regcode and regcode not in fleet:
+        return jsonify({'status': 'error', 'message': f'Принтер {regcode} не найден'}), 404
+    if delegates_refresh():
+        state_store.request_refresh(regcode or '', REFRESH_STATUS)
+        return queued_response('Обновление запрошено у опросчика')
+
+    def refresh():
+        if not fleet.codes:
+            fleet.discover()
+        codes = [regcode] if regcode else fleet.codes
+        return poller.refresh(codes, min_age=app.config['REFRESH_MIN_FRESHNESS'],
+                              timeout=app.config['REFRESH_WAIT_TIMEOUT'])
+
+    try:
+        results = run_bounded(refresh)
+    except TimeoutError:
+        return jsonify({'status': 'pending', 'message': 'Обновление уже выполняется'}), 202
+    
+    sources = {}
+    for _, source in results.values():
+        sources[source] = sources.get(source, 0) + 1
+    updated = sum(1 for status, _ in results.values() if status)
+    if results and not updated:
+        return jsonify({'status': 'stale', 'message': 'Облако не отвечает, показаны последние полученные данные',
+                        'updated': 0, 'sources': sources,
+                        'retry_in': round(client.breakers.get('GetPrinterStatus').retry_in(), 1)})
+    return jsonify({'status': 'success', 'message': 'Данные обновлены', 'updated': updated, 'sources': sources})
 
 @app.route('/api/camera/refresh')
 def api_camera_refresh():
-    """API endpoint для принудительного обновления снепшота камеры"""
-    update_camera_snapshot()
-    return jsonify({'status': 'success', 'message': 'Снепшот камеры обновлен'})
+    """API endpoint для принудительного обновления снепшота камеры (с объединением запросов)"""
+    registration_code = requested_printer_code()
+    viewers.touch(registration_code)
+    if delegates_refresh():
+        if registration_code not in fleet:
+            return jsonify({'status': 'error', 'message': f'Принтер {registration_code} не найден'}), 404
+        state_store.request_refresh(registration_code, REFRESH_CAMERA)
+        return queued_response('Снепшот запрошен у опросчика',
+                               camera_state=(fleet.get(registration_code) or {}).get('camera_state'))
+    try:
+        frame, source = run_bounded(refresh_camera, registration_code,
+                                    min_age=app.config['REFRESH_MIN_FRESHNESS'],
+                                    timeout=app.config['REFRESH_WAIT_TIMEOUT'])
+    except TimeoutError:
+        return jsonify({'status': 'pending', 'message': 'Обновление снепшота уже выполняется'}), 202
+    if frame is None:
+        state = camera.state(registration_code)
+        if state in (CAMERA_OPENING, CAMERA_WARMING):
+            return jsonify({'status': 'pending', 'camera_state': state,
+                            'message': 'Камера включается, снепшот появится после прогрева'}), 202
+        return jsonify({'status': 'error', 'camera_state': state, 'message': 'Не удалось получить снепшот камеры'})
+    message = 'Снепшот камеры актуален' if source == SOURCE_CACHE else 'Снепшот камеры обновлен'
+    return jsonify({'status': 'success', 'message': message, 'source': source})
+
+@app.route('/api/camera/<regcode>/snapshot.jpg')
+def api_camera_snapshot(regcode):
+    """Бинарный снепшот камеры с поддержкой ETag/Last-Modified и ответа 304.
+
+    ?size=thumb|medium - уменьшенный вариант кадра (full или без параметра - исходный).
+    """
+    size = request.args.get('size', 'full')
+    if size != 'full' and size not in snapshots.variant_sizes:
+        return jsonify({'status': 'error', 'message': f'Неизвестный размер снепшота: {size}'}), 400
+    if regcode in fleet:
+        viewers.touch(regcode)
+    frame = snapshots.get(regcode, None if size == 'full' else size)
+    if frame is None:
+        return jsonify({'status': 'error', 'message': f'Нет снепшота для принтера {regcode}'}), 404
+    
+    response = Response(frame.data, mimetype='image/jpeg')
+    response.set_etag(frame.etag)
+    response.last_modified = frame.last_modified
+    # Браузер хранит кадр, но перепроверяет его актуальность при каждом запросе
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/api/camera/<regcode>/archive')
+def api_camera_archive(regcode):
+    """Статистика архива снепшотов принтера"""
+    if archive is None:
+        return jsonify({'status': 'error', 'message': 'Архив снепшотов отключен'}), 404
+    return jsonify({'regcode': regcode, **archive.stats(regcode)})
+
+@app.route('/api/camera/<regcode>/timelapse.mjpeg')
+def api_camera_timelapse_mjpeg(regcode):
+    """Таймлапс из архива в виде MJPEG потока (?from=&to=, ?fps=)"""
+    if archive is None:
+        return jsonify({'status': 'error', 'message': 'Архив снепшотов отключен'}), 404
+    start, end = requested_time_range()
+    fps = request.args.get('fps', default=10.0, type=float)
+    return Response(
+        stream_with_context(archive.iter_mjpeg(regcode, start, end, fps)),
+        mimetype=f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}'
+    )
+
+@app.route('/api/camera/<regcode>/timelapse.zip')
+def api_camera_timelapse_zip(regcode):
+    """Таймлапс из архива в виде zip архива кадров (?from=&to=), формируется на лету"""
+    if archive is None:
+        return jsonify({'status': 'error', 'message': 'Архив снепшотов отключен'}), 404
+    start, end = requested_time_range()
+    response = Response(stream_with_context(archive.iter_zip(regcode, start, end)), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="timelapse_{regcode}.zip"'
+    return response
 
 @app.route('/api/camera/enable')
 def api_camera_enable():
     """API endpoint для принудительного включения камеры"""
-    global printer_data
-    try:
-        logger.info("=== ПРИНУДИТЕЛЬНОЕ ВКЛЮЧЕНИЕ КАМЕРЫ ===")
-        result = client.open_camera("ULJMGV")
-        if result:
-            printer_data['camera_enabled'] = True
-            logger.info("✅ Камера включена через API")
-            return jsonify({'status': 'success', 'message': 'Камера включена'})
-        else:
-            logger.warning("❌ Не удалось включить камеру через API")
-            return jsonify({'status': 'error', 'message': 'Не удалось включить камеру'})
-    except Exception as e:
-        logger.error(f"❌ Ошибка при включении камеры через API: {e}")
-        return jsonify({'status': 'error', 'message': f'Ошибка: {str(e)}'})
+    registration_code = requested_printer_code()
+    if registration_code not in fleet:
+        return jsonify({'status': 'error', 'message': f'Принтер {registration_code} не найден'}), 404
+    
+    logger.info("=== ПРИНУДИТЕЛЬНОЕ ВКЛЮЧЕНИЕ КАМЕРЫ %s ===", registration_code)
+    viewers.touch(registration_code)
+    if delegates_refresh():
+        state_store.request_refresh(registration_code, REFRESH_CAMERA_ENABLE)
+        return queued_response('Включение камеры запрошено у опросчика',
+                               camera_state=(fleet.get(registration_code) or {}).get('camera_state'))
+    state = camera.ensure_open(registration_code, force=True)
+    if state in (CAMERA_OPENING, CAMERA_WARMING, CAMERA_READY):
+        logger.info("✅ Камера включена через API (%s)", state)
+        return jsonify({'status': 'success', 'camera_state': state, 'message': 'Камера включена'})
+    logger.warning("❌ Не удалось включить камеру через API")
+    return jsonify({'status': 'error', 'camera_state': state,
+                    'message': camera.stats().get(registration_code, {}).get('last_error') or 'Не удалось включить камеру'})
+
+@app.route('/api/camera/stats')
+def api_camera_stats():
+    """API endpoint для состояния сессий камер"""
+    return jsonify(camera.stats())
+
+@app.route('/api/viewers')
+def api_viewers():
+    """Зрители принтеров: открытые потоки в этом процессе и время до окончания отметки"""
+    return jsonify(viewers.stats(fleet.codes))
+
+@app.route('/api/events')
+def api_events():
+    """API endpoint для последних событий принтеров (?printer=<код>, ?limit=)"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'events': events.recent(max(1, min(limit, 200)), request.args.get('printer')),
+        'stats': events.stats()
+    })
+
+@app.route('/api/poller/stats')
+def api_poller_stats():
+    """API endpoint для расписания адаптивного опроса принтеров"""
+    return jsonify(poller.stats())
+
+@app.route('/api/client/stats')
+def api_client_stats():
+    """API endpoint для метрик пула HTTP соединений клиента"""
+    return jsonify({
+        'client_authenticated': client.is_authenticated,
+        'login_method': client.login_method,
+        'pool': client.pool_stats(),
+        'circuits': client.breakers.stats()
+    })
+
+@app.route('/api/server/stats')
+def api_server_stats():
+    """API endpoint для состояния веб-процесса: подписчики потока и сжатие ответов"""
+    return jsonify({
+        'pid': os.getpid(),
+        'threads': threading.active_count(),
+        'stream_subscribers': broadcaster.subscriber_count,
+        'compression': compressor.stats() if compressor is not None else None
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/api/camera/debug')
 def api_camera_debug():
     """API endpoint для отладочной информации о камере"""
-    global printer_data
+    registration_code = requested_printer_code()
+    printer_data = fleet.get(registration_code) or {}
+    frame = snapshots.get(registration_code) if registration_code else None
     try:
         debug_info = {
+            'registration_code': printer_data.get('registration_code', ''),
             'camera_enabled': printer_data.get('camera_enabled', False),
-            'camera_snapshot_exists': bool(printer_data.get('camera_snapshot')),
-            'camera_snapshot_size': len(printer_data.get('camera_snapshot', '')) if printer_data.get('camera_snapshot') else 0,
+            'camera_snapshot_exists': frame is not None,
+            'camera_snapshot_size': frame.size if frame else 0,
+            'camera_snapshot_url': printer_data.get('snapshot_url'),
             'snapshot_last_update': printer_data.get('snapshot_last_update', 'Не обновлено'),
             'last_update': printer_data.get('last_update', 'Не обновлено'),
             'connection_status': printer_data.get('connection_status', 'Неизвестно'),
@@ -202,25 +772,25 @@ def api_camera_debug():
         }
         
         logger.info("=== ОТЛАДОЧНАЯ ИНФОРМАЦИЯ КАМЕРЫ ===")
-        logger.info(f"Debug info: {debug_info}")
+        logger.info("Debug info: %s", debug_info)
         
         return jsonify(debug_info)
     except Exception as e:
-        logger.error(f"❌ Ошибка при получении отладочной информации: {e}")
+        logger.error("❌ Ошибка при получении отладочной информации: %s", e)
         return jsonify({'error': str(e)})
 
+def shutdown():
+    """Остановка планировщика, потоков и хранилища при завершении процесса"""
+    if scheduler.running:
+        scheduler.shutdown()
+    broadcaster.close()
+    events.close()
+    state_store.close()
+
 if __name__ == '__main__':
     try:
-        # Первоначальное обновление данных
-        update_printer_data()
-        
-        # Первоначальная попытка включить камеру
-        logger.info("Попытка включить камеру при запуске...")
-        update_camera_snapshot()
-        
-        # Запуск планировщика
-        scheduler.start()
-        logger.info("Планировщик задач запущен")
+        # Первоначальное обновление данных и запуск планировщика
+        start_polling()
         
         # Запуск Flask приложения
         app.run(
@@ -233,5 +803,5 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         logger.info("Остановка приложения...")
     finally:
-        scheduler.shutdown()
+        shutdown()
         logger.info("Планировщик остановлен")
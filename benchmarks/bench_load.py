@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк клиента и веб-приложения на локальной заглушке облака.
+
+  client - опрос парка принтеров через SZ3DPCloudClient.get_printer_statuses
+  web    - зрители, одновременно запрашивающие /api/status, /api/printers,
+           /api/refresh и /api/camera/refresh у работающего приложения
+  serve  - приложение, запущенное через run.py встроенным сервером Flask и
+           gunicorn (gthread, gevent), держит открытыми N потоков /api/stream,
+           пока зрители запрашивают /api/status; выводятся подключившиеся
+           потоки, задержки /api/status и число потоков ОС сервера, затем
+           размеры ответов без сжатия, с gzip и brotli
+
+Для каждого размера парка и числа зрителей выводятся пропускная способность,
+p50/p99 задержки и пиковая память процесса. Облако не используется: задержку,
+ошибки, истечение сессии и размер снепшотов задают параметры заглушки.
+
+Запуск из корня проекта:
+  python benchmarks/bench_load.py client --printers 1,10,100,500
+  python benchmarks/bench_load.py web --printers 1,100,500 --viewers 1,10,50,200
+  python benchmarks/bench_load.py serve --printers 100 --viewers 20 --streams 0,100,500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cloud_stub import CloudStubServer  # noqa: E402
+
+# Эндпоинты, которые по очереди запрашивает зритель
+WEB_ENDPOINTS = ('/api/status', '/api/printers', '/api/refresh', '/api/camera/refresh')
+
+
+def int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def peak_memory_mb() -> float:
+    """Пиковый RSS процесса (МБ)"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает килобайты, macOS - байты
+    return usage / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def simulator(args) -> CloudStubServer:
+    return CloudStubServer(latency=args.latency, error_rate=args.error_rate,
+                           api_error_rate=args.api_error_rate, session_ttl=args.session_ttl,
+                           snapshot_size=args.snapshot_size, seed=1)
+
+
+def printer_codes(count: int) -> List[str]:
+    return [f'P{number:05d}' for number in range(count)]
+
+
+def report(label: str, requests_total: int, elapsed: float, latencies: List[float], errors: int):
+    print(f"{label:<28} {requests_total:>8} {requests_total / elapsed:>10.1f} "
+          f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+          f"{errors:>7} {peak_memory_mb():>8.1f}")
+
+
+def print_header():
+    print(f"{'сценарий':<28} {'запросов':>8} {'запр/с':>10} {'p50 мс':>8} {'p99 мс':>8} "
+          f"{'ошибок':>7} {'RSS МБ':>8}")
+
+
+def bench_client(args):
+    """Опрос парка: каждый раунд - один get_printer_statuses по всем принтерам"""
+    import logging
+    from sz3dp_client import SZ3DPCloudClient
+
+    logging.disable(logging.WARNING)
+
+    print_header()
+    for count in args.printers:
+        with simulator(args) as stub:
+            client = SZ3DPCloudClient('bench@example.com', 'bench', stub.base_url,
+                                      pool_maxsize=args.workers, backoff_base=0.01)
+            latencies: List[float] = []
+            lock = threading.Lock()
+            get_printer_status = client.get_printer_status
+
+            def timed(code, timeout=None):
+                start = time.perf_counter()
+                try:
+                    return get_printer_status(code, timeout)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+
+            # get_printer_statuses вызывает метод экземпляра - замеряем каждый запрос
+            client.get_printer_status = timed
+            codes = printer_codes(count)
+            errors = 0
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                statuses = client.get_printer_statuses(codes, max_workers=args.workers)
+                errors += sum(1 for status in statuses.values() if status is None)
+            elapsed = time.perf_counter() - start
+            client.session.close()
+            report(f'client {count} принтеров', len(latencies), elapsed, latencies, errors)
+
+
+def bench_web(args):
+    """Каждый размер парка - отдельный процесс, чтобы память не накапливалась между замерами"""
+    print_header()
+    for count in args.printers:
+        command = [sys.executable, os.path.abspath(__file__), 'web-run', '--printers', str(count),
+                   '--viewers', ','.join(map(str, args.viewers)), '--requests', str(args.requests),
+                   '--latency', str(args.latency), '--error-rate', str(args.error_rate),
+                   '--api-error-rate', str(args.api_error_rate), '--session-ttl', str(args.session_ttl),
+                   '--snapshot-size', str(args.snapshot_size)] + (['--verbose'] if args.verbose else [])
+        subprocess.run(command, check=True, cwd=ROOT)
+
+
+def bench_web_run(args):
+    """Приложение с парком из args.printers[0] принтеров под нагрузкой зрителей"""
+    import logging
+    import requests
+    from werkzeug.serving import make_server
+
+    count = args.printers[0]
+    with simulator(args) as stub:
+        os.environ.update(
+            API_BASE_URL=stub.base_url,
+            PRINTER_CODES=','.join(printer_codes(count)),
+            SESSION_CACHE_FILE='',
+            TELEMETRY_DIR='',
+            SNAPSHOT_ARCHIVE_DIR='',
+            POLL_MAX_WORKERS='32',
+            HTTP_POOL_MAXSIZE='32',
+        )
+        logging.disable(logging.WARNING)
+        import app as web
+        web.update_printer_data()
+
+        server = make_server('127.0.0.1', 0, web.app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+
+        for viewers in args.viewers:
+            latencies: List[float] = []
+            errors = [0]
+            lock = threading.Lock()
+
+            def viewer(number: int):
+                session = requests.Session()
+                local: List[float] = []
+                failed = 0
+                for index in range(args.requests):
+                    path = WEB_ENDPOINTS[(number + index) % len(WEB_ENDPOINTS)]
+                    start = time.perf_counter()
+                    try:
+                        response = session.get(base_url + path, timeout=60)
+                        if response.status_code >= 400:
+                            failed += 1
+                    except requests.RequestException:
+                        failed += 1
+                    local.append(time.perf_counter() - start)
+                with lock:
+                    latencies.extend(local)
+                    errors[0] += failed
+
+            threads = [threading.Thread(target=viewer, args=(number,)) for number in range(viewers)]
+            start = time.perf_counter()
+            for item in threads:
+                item.start()
+            for item in threads:
+                item.join()
+            elapsed = time.perf_counter() - start
+            report(f'web {count} принт. {viewers} зрит.', len(latencies), elapsed, latencies, errors[0])
+
+        server.shutdown()
+        if args.verbose:
+            print(json.dumps(stub.command_counts, ensure_ascii=False))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_threads(pid: int) -> int:
+    """Потоки ОС процесса и его дочерних процессов (воркеров gunicorn); Linux"""
+    total = 0
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as file:
+                fields = file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        # fields[1] - родительский процесс, fields[17] - число потоков
+        if int(entry) == pid or int(fields[1]) == pid:
+            total += int(fields[17])
+    return total
+
+
+def start_server(args, stub: CloudStubServer, server: str, port: int) -> subprocess.Popen:
+    """run.py --mode all с заданным сервером; gthread и gevent - классы воркеров gunicorn"""
+    env = dict(
+        os.environ,
+        API_BASE_URL=stub.base_url,
+        PRINTER_CODES=','.join(printer_codes(args.printers[0])),
+        SESSION_CACHE_FILE='',
+        TELEMETRY_DIR='',
+        SNAPSHOT_ARCHIVE_DIR='',
+        LOG_LEVEL='WARNING',
+        SERVER_HOST='127.0.0.1',
+        SERVER_PORT=str(port),
+        SERVER='dev' if server == 'dev' else 'production',
+        SERVER_WORKER_CLASS='gthread' if server == 'dev' else server,
+        SERVER_THREADS=str(args.threads),
+    )
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'run.py'), '--mode', 'all'],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    import requests
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/api/status', timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Сервер {server} не запустился")
+
+
+async def hold_streams(session, base_url: str, count: int, timeout: float):
+    """Открытие count потоков /api/stream; подключенным считается поток, приславший первое сообщение"""
+    import aiohttp
+
+    async def open_stream():
+        try:
+            response = await session.get(base_url + '/api/stream', timeout=aiohttp.ClientTimeout(total=None))
+            await asyncio.wait_for(response.content.readline(), timeout)
+            return response
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    tasks = [asyncio.ensure_future(open_stream()) for _ in range(count)]
+    done, pending = await asyncio.wait(tasks, timeout=timeout) if tasks else (set(), set())
+    # Потоки, которые не успели подключиться, остаются открытыми и продолжают занимать сервер
+    return [task.result() for task in done if task.result() is not None], pending
+
+
+async def status_load(session, base_url: str, args):
+    """args.viewers[0] зрителей, по args.requests запросов /api/status каждый"""
+    import aiohttp
+    latencies: List[float] = []
+    errors = 0
+    remaining = [args.viewers[0] * args.requests]
+
+    async def viewer():
+        nonlocal errors
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                async with session.get(base_url + '/api/status',
+                                       timeout=aiohttp.ClientTimeout(total=args.request_timeout)) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(viewer() for _ in range(args.viewers[0])))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def serve_scenario(base_url: str, pid: int, streams: int, args):
+    import aiohttp
+    connector = aiohttp.TCPConnector(limit=0, force_close=False)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        connected, pending = await hold_streams(session, base_url, streams, args.connect_timeout)
+        latencies, errors, elapsed = await status_load(session, base_url, args)
+        threads = process_threads(pid)
+        for response in connected:
+            response.close()
+        for task in pending:
+            task.cancel()
+    return len(connected), latencies, errors, elapsed, threads
+
+
+def compression_sizes(base_url: str) -> List[str]:
+    """Размер ответов в байтах без сжатия, с gzip и brotli"""
+    import requests
+    lines = [f"{'ответ':<28} {'identity':>10} {'gzip':>10} {'br':>10}"]
+    for path in ('/api/printers', '/api/status', '/static/js/script.js', '/static/css/style.css'):
+        sizes = []
+        for encoding in ('identity', 'gzip', 'br'):
+            response = requests.get(base_url + path, headers={'Accept-Encoding': encoding}, stream=True)
+            body = response.raw.read(decode_content=False)
+            sizes.append(f"{len(body)}{'' if response.headers.get('Content-Encoding', 'identity') == encoding else '*'}")
+        lines.append(f"{path:<28} {sizes[0]:>10} {sizes[1]:>10} {sizes[2]:>10}")
+    lines.append("* - кодировка не поддерживается сервером, ответ без сжатия")
+    return lines
+
+
+def bench_serve(args):
+    """Одни и те же сценарии для каждого сервера: потоки SSE и параллельные запросы статуса"""
+    print(f"{'сервер':<8} {'потоков SSE':>12} {'запр/с':>8} {'p50 мс':>8} {'p99 мс':>8} "
+          f"{'ошибок':>7} {'потоков ОС':>11}")
+    sizes: List[str] = []
+    with simulator(args) as stub:
+        for server in args.servers.split(','):
+            server = server.strip()
+            port = free_port()
+            process = start_server(args, stub, server, port)
+            base_url = f'http://127.0.0.1:{port}'
+            try:
+                if not sizes:
+                    sizes = compression_sizes(base_url)
+                for streams in args.streams:
+                    connected, latencies, errors, elapsed, threads = asyncio.run(
+                        serve_scenario(base_url, process.pid, streams, args))
+                    print(f"{server:<8} {f'{connected}/{streams}':>12} {len(latencies) / elapsed:>8.1f} "
+                          f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+                          f"{errors:>7} {threads:>11}")
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+    print()
+    print('\n'.join(sizes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк на локальной заглушке облака")
+    parser.add_argument('mode', choices=['client', 'web', 'web-run', 'serve'])
+    parser.add_argument('--printers', type=int_list, default=[1, 10, 100, 500], help="размеры парка через запятую")
+    parser.add_argument('--viewers', type=int_list, default=[1, 10, 50, 200], help="числа зрителей через запятую")
+    parser.add_argument('--rounds', type=int, default=5, help="раундов опроса парка (client)")
+    parser.add_argument('--workers', type=int, default=16, help="потоков опроса (client)")
+    parser.add_argument('--requests', type=int, default=20, help="запросов на зрителя (web)")
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка заглушки, сек")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов HTTP 500")
+    parser.add_argument('--api-error-rate', type=float, default=0.0, help="доля ответов с ErrorCode 500")
+    parser.add_argument('--session-ttl', type=float, default=0.0, help="время жизни сессии заглушки, сек")
+    parser.add_argument('--snapshot-size', type=int, default=200_000, help="размер снепшота, байт")
+    parser.add_argument('--servers', default='dev,gthread,gevent', help="серверы через запятую (serve)")
+    parser.add_argument('--streams', type=int_list, default=[0, 100, 500],
+                        help="открытых потоков /api/stream через запятую (serve)")
+    parser.add_argument('--threads', type=int, default=16, help="потоков воркера gthread (serve)")
+    parser.add_argument('--connect-timeout', type=float, default=5.0, help="ожидание подключения потоков, сек (serve)")
+    parser.add_argument('--request-timeout', type=float, default=10.0, help="таймаут запроса статуса, сек (serve)")
+    parser.add_argument('--verbose', action='store_true', help="выводить число команд, полученных заглушкой")
+    args = parser.parse_args()
+
+    if args.mode == 'client':
+        bench_client(args)
+    elif args.mode == 'web':
+        bench_web(args)
+    elif args.mode == 'serve':
+        bench_serve(args)
+    else:
+        bench_web_run(args)
+
+
+if __name__ == '__main__':
+    main()
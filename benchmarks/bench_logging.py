@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк стоимости логирования в цикле опроса.
+
+Цикл опроса - статусы всех принтеров парка, включение камеры и снепшот каждого
+принтера через SZ3DPCloudClient на локальной заглушке облака. Лог пишется
+обработчиком в поток, который только считает байты, поэтому замер показывает
+стоимость форматирования и записи сообщений без диска и консоли.
+
+Режимы:
+  disabled - логирование отключено (logging.disable), нижняя граница
+  info     - текущие сообщения клиента на уровне INFO
+  debug    - уровень DEBUG с фрагментами ответов облака
+  legacy   - INFO с прежними сообщениями клиента: f-строки с телом запроса,
+             заголовками и текстом ответа на каждую команду
+
+Для каждого режима выводятся время цикла и объем лога за цикл; --api-error-rate
+показывает действие ограничения повторяющихся ошибок.
+
+Запуск из корня проекта:
+  python benchmarks/bench_logging.py --printers 10,100 --cycles 5
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cloud_stub import CloudStubServer  # noqa: E402
+from log_utils import error_limiter  # noqa: E402
+from sz3dp_client import SZ3DPCloudClient, PRINTER_ENDPOINT  # noqa: E402
+
+MODES = ('disabled', 'info', 'debug', 'legacy')
+
+
+class CountingStream(io.TextIOBase):
+    """Поток, который отбрасывает записанный текст и считает его объем"""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, text: str) -> int:
+        self.bytes += len(text.encode('utf-8'))
+        return len(text)
+
+
+def int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def legacy_logging(client: SZ3DPCloudClient):
+    """Сообщения прежней версии клиента, которые писались на каждую команду"""
+    logger = logging.getLogger('sz3dp_client')
+    post = client.session.post
+
+    def logged_post(url, data=None, headers=None, **kwargs):
+        if not url.endswith(PRINTER_ENDPOINT):
+            return post(url, data=data, headers=headers, **kwargs)
+        body = json.loads(data)
+        cmd, code = body['Cmd'], body['Parameters']['RegistrationCode']
+        if cmd == 'GetPrinterStatus':
+            logger.info(f"Запрос статуса принтера {code}")
+            return post(url, data=data, headers=headers, **kwargs)
+
+        title = 'ВКЛЮЧЕНИЕ КАМЕРЫ' if cmd == 'OpenCamera' else 'ПОЛУЧЕНИЕ СНЕПШОТА'
+        logger.info(f"=== {title} ===")
+        logger.info(f"Принтер: {code}")
+        logger.info(f"URL: {url}")
+        logger.info(f"Данные запроса: {data}")
+        response = post(url, data=data, headers=headers, **kwargs)
+        logger.info(f"Статус ответа: {response.status_code}")
+        if cmd == 'OpenCamera':
+            logger.info(f"Заголовки ответа: {dict(response.headers)}")
+            logger.info(f"Текст ответа: {response.text[:500]}...")
+            logger.info(f"JSON ответ: {response.json()}")
+        else:
+            logger.info(f"Размер ответа: {len(response.text)} символов")
+            api_data = response.json()
+            logger.info(f"JSON структура ответа: {list(api_data.keys())}")
+            logger.info(f"Начало данных: {api_data.get('Snapshot', '')[:50]}...")
+        return response
+
+    client.session.post = logged_post
+
+
+def configure(mode: str, stream: CountingStream):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.StreamHandler(stream))
+    logging.disable(logging.NOTSET)
+    if mode == 'disabled':
+        logging.disable(logging.CRITICAL)
+    root.setLevel(logging.DEBUG if mode == 'debug' else logging.INFO)
+
+
+def bench(args, count: int, mode: str):
+    codes = [f'P{number:05d}' for number in range(count)]
+    with CloudStubServer(latency=0.0, api_error_rate=args.api_error_rate,
+                         snapshot_size=args.snapshot_size, seed=1) as stub:
+        client = SZ3DPCloudClient('bench@example.com', 'bench', stub.base_url,
+                                  pool_maxsize=args.workers, backoff_base=0.001)
+        if mode == 'legacy':
+            legacy_logging(client)
+        # Прогрев: авторизация и соединения пула без записи в лог
+        logging.disable(logging.CRITICAL)
+        client.get_printer_statuses(codes, max_workers=args.workers)
+
+        stream = CountingStream()
+        configure(mode, stream)
+        error_limiter.interval = args.error_interval
+        error_limiter._state.clear()
+        start = time.perf_counter()
+        for _ in range(args.cycles):
+            client.get_printer_statuses(codes, max_workers=args.workers)
+            for code in codes:
+                client.open_camera(code)
+                client.get_printer_snapshot(code)
+        elapsed = time.perf_counter() - start
+        logging.disable(logging.CRITICAL)
+        client.session.close()
+
+    per_cycle = elapsed / args.cycles
+    print(f"{count:>9} {mode:<9} {per_cycle * 1000:>10.1f} {per_cycle / count * 1e6:>12.0f} "
+          f"{stream.bytes / args.cycles / 1024:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость логирования в цикле опроса")
+    parser.add_argument('--printers', type=int_list, default=[10, 100], help="размеры парка через запятую")
+    parser.add_argument('--cycles', type=int, default=5, help="циклов опроса на замер")
+    parser.add_argument('--workers', type=int, default=8, help="потоков опроса статусов")
+    parser.add_argument('--modes', default=','.join(MODES), help="режимы через запятую")
+    parser.add_argument('--api-error-rate', type=float, default=0.0, help="доля ответов с ErrorCode 500")
+    parser.add_argument('--error-interval', type=float, default=60.0, help="интервал повторов ошибок, сек")
+    parser.add_argument('--snapshot-size', type=int, default=50_000, help="размер снепшота, байт")
+    args = parser.parse_args()
+
+    print(f"{'принтеров':>9} {'режим':<9} {'цикл мс':>10} {'мкс/принтер':>12} {'лог КБ/цикл':>12}")
+    for count in args.printers:
+        for mode in args.modes.split(','):
+            bench(args, count, mode.strip())
+
+
+if __name__ == '__main__':
+    main()
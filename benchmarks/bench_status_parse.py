@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк разбора статуса принтера: время разбора ответа GetPrinterStatus
+и память, занимаемая статусами парка принтеров.
+
+Запуск из корня проекта: python benchmarks/bench_status_parse.py [--printers 1000]
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cloud_stub import stub_printer_detail  # noqa: E402
+from printer_status import parse_printer_status, format_time, orjson  # noqa: E402
+
+
+def legacy_parse(api_data):
+    """Прежний разбор: новый словарь со всеми полями и полным ответом облака"""
+    detail = api_data.get('Detail', {})
+    cur_temps = detail.get('CurTemps', [0, 0])
+    target_temps = detail.get('TargetTemps', [0, 0])
+    estimate_time = detail.get('EstimateTime', 0)
+    return {
+        'model_name': detail.get('GcodeName', '').replace('.gcode', ''),
+        'progress_percent': round(detail.get('PrintProgress', 0) * 100, 2),
+        'time_remaining': format_time(estimate_time),
+        'estimate_minutes': estimate_time,
+        'extruder_temp': {'current': cur_temps[0] if cur_temps else 0,
+                          'target': target_temps[0] if target_temps else 0},
+        'bed_temp': {'current': detail.get('PlatformCurTemp', 0),
+                     'target': detail.get('PlatformTargetTemp', 0)},
+        'enclosure_status': "закрыт" if detail.get('Door', 0) == 0 else "открыт",
+        'filament_status': "нормальный" if detail.get('Filament', 0) == 0 else "проблема",
+        'printer_name': detail.get('PrinterName', ''),
+        'registration_code': detail.get('RegistrationCode', ''),
+        'firmware_version': detail.get('FirmwareVersion', ''),
+        'printer_type': detail.get('PrinterType', ''),
+        'measure': detail.get('Measure', ''),
+        'job_status': detail.get('JobStatus', ''),
+        'duration': detail.get('Duration', 0),
+        'raw_data': api_data,
+    }
+
+
+def payload(number: int) -> bytes:
+    """Тело ответа GetPrinterStatus для принтера с номером number"""
+    code = f'P{number:05d}'
+    return json.dumps({'ErrorCode': 200, 'Message': 'ok',
+                       'Detail': stub_printer_detail(code, time.time() - number)}).encode()
+
+
+def time_per_call(fn, bodies, repeat: int) -> float:
+    """Среднее время одного вызова fn(тело) в микросекундах"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for body in bodies:
+            fn(body)
+    return (time.perf_counter() - start) / (repeat * len(bodies)) * 1e6
+
+
+def memory_per_printer(parse, bodies, loads) -> float:
+    """Память на статус одного принтера (байт), удерживаемая после разбора"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    statuses = [parse(loads(body)) for body in bodies]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del statuses
+    return (after - before) / len(bodies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора статуса принтера")
+    parser.add_argument('--printers', type=int, default=1000, help="число принтеров в парке")
+    parser.add_argument('--repeat', type=int, default=20, help="повторов замера времени")
+    args = parser.parse_args()
+
+    bodies = [payload(number) for number in range(args.printers)]
+    decoders = {'json': json.loads}
+    if orjson is not None:
+        decoders['orjson'] = orjson.loads
+    parsers = {
+        'dict + raw_data (прежний)': legacy_parse,
+        'PrinterStatus': parse_printer_status,
+        'PrinterStatus + raw_data': lambda data: parse_printer_status(data, keep_raw=True),
+    }
+
+    print(f"Принтеров: {args.printers}, размер ответа: {len(bodies[0])} байт")
+    print(f"{'декодер':<8} {'разбор':<28} {'мкс/статус':>11} {'байт/принтер':>13}")
+    for decoder_name, loads in decoders.items():
+        for parser_name, parse in parsers.items():
+            elapsed = time_per_call(lambda body: parse(loads(body)), bodies, args.repeat)
+            memory = memory_per_printer(parse, bodies, loads)
+            print(f"{decoder_name:<8} {parser_name:<28} {elapsed:>11.2f} {memory:>13.0f}")
+
+
+if __name__ == '__main__':
+    main()
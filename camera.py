@@ -0,0 +1,220 @@
+import threading
+import time
+import logging
+from typing import Dict, Any, Callable, Iterable, Optional
+
+from log_utils import error_limiter
+from circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Состояния сессии камеры
+CLOSED = 'closed'
+OPENING = 'opening'
+WARMING = 'warming'
+READY = 'ready'
+EXPIRED = 'expired'
+
+
+def thread_timer(delay: float, callback: Callable[[], None]):
+    """Отложенный вызов по умолчанию: threading.Timer в фоновом потоке"""
+    timer = threading.Timer(delay, callback)
+    timer.daemon = True
+    timer.start()
+
+
+class CameraSession:
+    """Сессия камеры одного принтера"""
+
+    __slots__ = ('state', 'opened_at', 'ready_at', 'expires_at', 'last_error', 'opens_total')
+
+    def __init__(self):
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.ready_at = 0.0
+        self.expires_at = 0.0
+        self.last_error: Optional[str] = None
+        self.opens_total = 0
+
+
+class CameraManager:
+    """Жизненный цикл камер принтеров: closed -> opening -> warming -> ready -> expired.
+
+    OpenCamera вызывается только для камер, у которых есть зрители (ViewerTracker
+    ведет их учет и виден процессу-опросчику через StateStore). Прогрев после
+    включения не блокирует поток: по его окончании через defer(задержка, callback)
+    вызывается on_ready(код). Сессия камеры, которую смотрят, продлевается
+    повторным OpenCamera до истечения; остальные сессии истекают сами.
+    """
+
+    def __init__(self, client, viewers, warmup: float = 2.0, session_ttl: float = 300.0,
+                 reopen_margin: float = 30.0,
+                 defer: Callable[[float, Callable[[], None]], None] = thread_timer,
+                 on_ready: Optional[Callable[[str], None]] = None,
+                 on_change: Optional[Callable[[str, str], None]] = None):
+        self.client = client
+        self.viewers = viewers
+        self.warmup = warmup
+        self.session_ttl = session_ttl
+        self.reopen_margin = reopen_margin
+        self.defer = defer
+        self.on_ready = on_ready
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, CameraSession] = {}
+
+    def _session(self, registration_code: str) -> CameraSession:
+        session = self._sessions.get(registration_code)
+        if session is None:
+            session = self._sessions[registration_code] = CameraSession()
+        return session
+
+    @staticmethod
+    def _set_state(session: CameraSession, state: str) -> bool:
+        """Смена состояния (вызывается под self._lock); уведомление - после выхода из блокировки"""
+        changed = session.state != state
+        session.state = state
+        return changed
+
+    def _notify(self, registration_code: str, state: str):
+        if self.on_change:
+            try:
+                self.on_change(registration_code, state)
+            except Exception as e:
+                logger.error("Ошибка обработчика состояния камеры %s: %s", registration_code, e)
+
+    # Состояние
+
+    def state(self, registration_code: str) -> str:
+        """Текущее состояние с учетом окончания прогрева и истечения сессии"""
+        now = time.time()
+        with self._lock:
+            session = self._session(registration_code)
+            state = self._advance(session, now)
+            changed = self._set_state(session, state)
+        if changed:
+            self._notify(registration_code, state)
+        return state
+
+    def _advance(self, session: CameraSession, now: float) -> str:
+        if session.state in (WARMING, READY) and now >= session.expires_at:
+            return EXPIRED
+        if session.state == WARMING and now >= session.ready_at:
+            return READY
+        return session.state
+
+    def ensure_open(self, registration_code: str, force: bool = False) -> str:
+        """Включение камеры, если она закрыта или истекла; не ждет прогрева.
+
+        Без force камера включается только при наличии зрителей.
+        """
+        state = self.state(registration_code)
+        if state in (OPENING, WARMING, READY) and not force:
+            return state
+        if not force and not self.viewers.active(registration_code):
+            return state
+        return self._open(registration_code, reopen=state == READY)
+
+    def _open(self, registration_code: str, reopen: bool = False) -> str:
+        with self._lock:
+            session = self._session(registration_code)
+            if session.state == OPENING:
+                # Камеру уже включает другой поток
+                return OPENING
+            previous = session.state
+            session.state = OPENING
+        if previous != OPENING:
+            self._notify(registration_code, OPENING)
+
+        try:
+            opened = bool(self.client.open_camera(registration_code))
+            error = None if opened else 'OpenCamera вернул ошибку'
+        except CircuitOpenError:
+            # Облако недоступно, камера не вызывалась: состояние сессии не меняется
+            with self._lock:
+                self._session(registration_code).state = previous
+            self._notify(registration_code, previous)
+            return previous
+        except Exception as e:
+            opened, error = False, str(e)
+
+        now = time.time()
+        with self._lock:
+            session = self._session(registration_code)
+            session.last_error = error
+            if not opened:
+                state = EXPIRED if previous in (READY, WARMING) else CLOSED
+                session.state = state
+            else:
+                session.opens_total += 1
+                session.opened_at = now
+                session.expires_at = now + self.session_ttl
+                if reopen and previous == READY:
+                    # Продление работающей сессии: прогрев не нужен
+                    state = session.state = READY
+                else:
+                    session.ready_at = now + self.warmup
+                    state = session.state = WARMING
+        self._notify(registration_code, state)
+
+        if state == WARMING:
+            logger.info("Камера принтера %s включена, прогрев %s с", registration_code, self.warmup)
+            self.defer(self.warmup, lambda: self._warmed_up(registration_code))
+        elif not opened:
+            error_limiter.log(logger, logging.WARNING, ('camera', registration_code),
+                              "Не удалось включить камеру принтера %s: %s", registration_code, error)
+        return state
+
+    def _warmed_up(self, registration_code: str):
+        if self.state(registration_code) == READY and self.on_ready:
+            try:
+                self.on_ready(registration_code)
+            except Exception as e:
+                logger.error("Ошибка обработчика готовности камеры %s: %s", registration_code, e)
+
+    def mark_failed(self, registration_code: str, error: str):
+        """Снепшот не получен: вероятно, камера выключилась в облаке - сессия считается истекшей"""
+        with self._lock:
+            session = self._session(registration_code)
+            session.last_error = error
+            changed = self._set_state(session, EXPIRED)
+        if changed:
+            self._notify(registration_code, EXPIRED)
+
+    def maintain(self, codes: Optional[Iterable[str]] = None):
+        """Задача планировщика: включение камер, у которых появились зрители,
+        продление сессий просматриваемых камер и закрытие остальных"""
+        now = time.time()
+        with self._lock:
+            known = list(self._sessions)
+        for code in dict.fromkeys([*known, *(codes or [])]):
+            state = self.state(code)
+            watched = self.viewers.active(code)
+            with self._lock:
+                expires_at = self._sessions[code].expires_at
+            if state == READY and watched and now >= expires_at - self.reopen_margin:
+                self._open(code, reopen=True)
+            elif state in (CLOSED, EXPIRED) and watched:
+                self._open(code)
+            elif state == EXPIRED:
+                with self._lock:
+                    changed = self._set_state(self._sessions[code], CLOSED)
+                if changed:
+                    self._notify(code, CLOSED)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            codes = list(self._sessions)
+        result = {}
+        for code in codes:
+            state = self.state(code)
+            session = self._sessions[code]
+            result[code] = {
+                'state': state,
+                'watched': self.viewers.active(code),
+                'expires_in': round(max(0.0, session.expires_at - now), 1) if state in (WARMING, READY) else None,
+                'opens_total': session.opens_total,
+                'last_error': session.last_error,
+            }
+        return result
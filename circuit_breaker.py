@@ -0,0 +1,151 @@
+import threading
+import time
+import logging
+from typing import Dict, Any
+
+from metrics import CIRCUIT_REJECTIONS, CIRCUIT_TRANSITIONS
+
+logger = logging.getLogger(__name__)
+
+# Состояния выключателя
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Запрос пропущен разомкнутым выключателем: облако не вызывалось"""
+
+    def __init__(self, command: str, retry_in: float):
+        super().__init__(f"{command}: облако недоступно, повтор через {retry_in:.0f} с")
+        self.command = command
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Автоматический выключатель запросов к одной команде облака.
+
+    После failure_threshold сбоев подряд выключатель размыкается, и запросы
+    отклоняются сразу, без обращения к облаку. Через recovery_timeout секунд
+    пропускается не более half_open_probes пробных запросов: успех замыкает
+    выключатель, сбой снова размыкает его на recovery_timeout.
+    failure_threshold <= 0 отключает выключатель.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_probes: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_at = 0.0
+        self.rejected_total = 0
+        self.opened_total = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.recovery_timeout:
+            self._transition(HALF_OPEN)
+            self._probes = 0
+        return self._state
+
+    def _transition(self, state: str):
+        self._state = state
+        CIRCUIT_TRANSITIONS.inc(self.name, state)
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос; в полуоткрытом состоянии занимает слот пробы"""
+        if self.failure_threshold <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state == CLOSED:
+                return True
+            # Проба, результат которой не записан за recovery_timeout, считается потерянной
+            if state == HALF_OPEN and (self._probes < self.half_open_probes
+                                       or now - self._probe_at >= self.recovery_timeout):
+                if self._probes >= self.half_open_probes:
+                    self._probes = 0
+                self._probes += 1
+                self._probe_at = now
+                return True
+            self.rejected_total += 1
+        CIRCUIT_REJECTIONS.inc(self.name)
+        return False
+
+    def check(self):
+        """allow(), но вместо отказа - исключение CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+                self._probes = 0
+                logger.info("Облако отвечает на %s, выключатель замкнут", self.name)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and 0 < self.failure_threshold <= self._failures):
+                self._transition(OPEN)
+                self._opened_at = time.monotonic()
+                self._probes = 0
+                self.opened_total += 1
+                logger.warning("%s: %s сбоев подряд, запросы приостановлены на %.0f с",
+                               self.name, self._failures, self.recovery_timeout)
+
+    def retry_in(self) -> float:
+        """Секунд до пробного запроса (0 - запросы разрешены)"""
+        with self._lock:
+            if self._current_state(time.monotonic()) != OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+    def stats(self) -> Dict[str, Any]:
+        retry_in = self.retry_in()
+        with self._lock:
+            return {
+                'state': self._state,
+                'failures': self._failures,
+                'retry_in': round(retry_in, 1),
+                'opened_total': self.opened_total,
+                'rejected_total': self.rejected_total,
+            }
+
+
+class CircuitBreakers:
+    """Выключатели по командам облака с общими настройками"""
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_probes: int = 1):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(
+                    name, self.failure_threshold, self.recovery_timeout, self.half_open_probes)
+            return breaker
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.stats() for name, breaker in breakers.items()}
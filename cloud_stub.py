@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка API cloud.sz3dp.com для проверки клиентов без облака.
+
+Заглушка может имитировать поведение облака под нагрузкой: задержку ответа,
+долю ошибок HTTP и ошибок API, истечение сессии и размер снепшотов.
+"""
+
+import argparse
+import base64
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional
+
+# Минимальный корректный JPEG 16x12 в base64 (ответ на GetPrinterSnapshot)
+STUB_SNAPSHOT = (
+    '/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9PDkzODdASFxOQERXRTc4UG1RV19iZ2hnPk1xeXBkeFxlZ2P/'
+    '2wBDARESEhgVGC8aGi9jQjhCY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2P/wAARCAAMABADASIAAhEBAxEB/8QA'
+    'HwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkK'
+    'FhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXG'
+    'x8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAEC'
+    'AxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOE'
+    'hYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwCpRRRXQYn/2Q=='
+)
+
+
+_snapshot_cache: Dict[int, str] = {}
+
+
+def stub_snapshot(size: int = 0) -> str:
+    """Снепшот в base64 размером не меньше size байт (корректный JPEG).
+
+    JPEG дополняется комментариями (маркер COM) сразу после SOI, поэтому
+    кадр открывается декодерами как обычное изображение.
+    """
+    if size <= 0:
+        return STUB_SNAPSHOT
+    cached = _snapshot_cache.get(size)
+    if cached is None:
+        data = base64.b64decode(STUB_SNAPSHOT)
+        padding = []
+        missing = size - len(data)
+        while missing > 0:
+            chunk = min(missing, 65533)
+            padding.append(b'\xff\xfe' + struct.pack('>H', chunk + 2) + b'\x00' * chunk)
+            missing -= chunk + 4
+        cached = _snapshot_cache[size] = base64.b64encode(data[:2] + b''.join(padding) + data[2:]).decode()
+    return cached
+
+
+def stub_printer_detail(registration_code: str, started_at: float) -> Dict[str, Any]:
+    """Детали статуса принтера в формате ответа GetPrinterStatus"""
+    # Печать длительностью 2 часа, прогресс зависит от времени работы заглушки
+    elapsed = (time.time() - started_at) / 60
+    progress = min(elapsed / 120, 1.0)
+    return {
+        'RegistrationCode': registration_code,
+        'PrinterName': f'Stub {registration_code}',
+        'PrinterType': 'Flashforge 5m',
+        'FirmwareVersion': '3.1.3',
+        'Measure': '220x220x220',
+        'GcodeName': 'voron_design_cube.gcode',
+        'JobStatus': 'printing' if progress < 1.0 else 'completed',
+        'PrintProgress': round(progress, 4),
+        'EstimateTime': max(0, round(120 - elapsed, 1)),
+        'Duration': int(elapsed * 60),
+        'CurTemps': [219.5, 0],
+        'TargetTemps': [220, 0],
+        'PlatformCurTemp': 59.8,
+        'PlatformTargetTemp': 60,
+        'Door': 0,
+        'Filament': 0,
+    }
+
+
+class CloudStubHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов заглушки: /, /user/login, /user/printer, /logout"""
+
+    server_version = 'SZ3DPStub/1.0'
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело ответа пишутся отдельно: без TCP_NODELAY каждый ответ
+    # keep-alive соединения ждет отложенного ACK клиента (~40 мс)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        self._send(200, json.dumps(data).encode('utf-8'), 'application/json; charset=utf-8', headers)
+
+    def _read_body(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            return json.loads(raw or b'{}')
+        except ValueError:
+            return {}
+
+    def do_GET(self):
+        if self.path == '/':
+            # Главная страница проверяет cookies при входе: начинается новая сессия
+            self.server.start_session()
+            html = b'<html><body><a href="/logout">logout</a> dashboard</body></html>'
+            self._send(200, html, 'text/html; charset=utf-8')
+        else:
+            self._send(404, b'not found', 'text/plain')
+
+    def do_POST(self):
+        self.server.count_request()
+        body = self._read_body()
+
+        if self.path == '/user/login':
+            self.server.start_session()
+            self._send_json({'ErrorCode': 200, 'Message': 'ok'},
+                            {'Set-Cookie': 'goSessionid=stub-session; Path=/'})
+        elif self.path == '/user/printer':
+            self._handle_command(body)
+        elif self.path == '/logout':
+            self._send_json({'ErrorCode': 200})
+        else:
+            self._send(404, b'not found', 'text/plain')
+
+    def _handle_command(self, body: Dict[str, Any]):
+        cmd = body.get('Cmd')
+        code = (body.get('Parameters') or {}).get('RegistrationCode', '')
+        server = self.server
+        server.count_command(cmd)
+
+        delay = server.response_delay()
+        if delay:
+            time.sleep(delay)
+        if server.session_expired():
+            self._send_json({'ErrorCode': 401, 'Message': 'Session expired'})
+            return
+        if server.error_rate and server.random.random() < server.error_rate:
+            if server.proxy_errors:
+                self._send(502, b'<html><body><h1>502 Bad Gateway</h1></body></html>', 'text/html')
+            else:
+                self._send(500, b'internal error', 'text/plain')
+            return
+        if server.api_error_rate and server.random.random() < server.api_error_rate:
+            self._send_json({'ErrorCode': 500, 'Message': 'Printer offline'})
+            return
+
+        if cmd == 'GetPrinterStatus':
+            detail = stub_printer_detail(code, self.server.started_at)
+            self._send_json({'ErrorCode': 200, 'Message': 'ok', 'Detail': detail})
+        elif cmd == 'OpenCamera':
+            self._send_json({'ErrorCode': 200, 'Message': 'ok'})
+        elif cmd == 'GetPrinterSnapshot':
+            self._send_json({'ErrorCode': 200, 'Message': 'ok', 'Snapshot': stub_snapshot(server.snapshot_size)})
+        else:
+            self._send_json({'ErrorCode': 400, 'Message': f'Unknown command {cmd}'})
+
+
+class CloudStubServer(ThreadingHTTPServer):
+    """Многопоточный HTTP сервер заглушки, запускаемый в фоне.
+
+    latency - средняя задержка ответа на команду (сек), latency_jitter - ее
+    случайное отклонение (доля); error_rate - доля ответов HTTP 500 (при
+    proxy_errors - HTML страница 502, как у прокси перед облаком),
+    api_error_rate - доля ответов с ErrorCode 500; session_ttl - время жизни
+    сессии после входа (сек, 0 - бессрочно), по истечении команды получают
+    ErrorCode 401 до нового входа; snapshot_size - размер снепшота (байт).
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, verbose: bool = False,
+                 latency: float = 0.0, latency_jitter: float = 0.5, error_rate: float = 0.0,
+                 api_error_rate: float = 0.0, session_ttl: float = 0.0, snapshot_size: int = 0,
+                 seed: Optional[int] = None, proxy_errors: bool = False):
+        super().__init__((host, port), CloudStubHandler)
+        self.verbose = verbose
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.proxy_errors = proxy_errors
+        self.api_error_rate = api_error_rate
+        self.session_ttl = session_ttl
+        self.snapshot_size = snapshot_size
+        self.random = random.Random(seed)
+        self.started_at = time.time()
+        self.session_started_at = self.started_at
+        self.request_count = 0
+        self.command_counts: Dict[str, int] = {}
+        self.logins = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start_session(self):
+        with self._lock:
+            self.session_started_at = time.time()
+            self.logins += 1
+
+    def session_expired(self) -> bool:
+        return bool(self.session_ttl) and time.time() - self.session_started_at > self.session_ttl
+
+    def response_delay(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        spread = self.latency * self.latency_jitter
+        return max(0.0, self.random.uniform(self.latency - spread, self.latency + spread))
+
+    def count_request(self):
+        with self._lock:
+            self.request_count += 1
+
+    def count_command(self, cmd: Optional[str]):
+        with self._lock:
+            self.command_counts[cmd or ''] = self.command_counts.get(cmd or '', 0) + 1
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'CloudStubServer':
+        self._thread = threading.Thread(target=self.serve_forever, name='cloud-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> 'CloudStubServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальная заглушка API cloud.sz3dp.com')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', type=float, default=0.0, help="средняя задержка ответа, сек")
+    parser.add_argument('--latency-jitter', type=float, default=0.5, help="отклонение задержки, доля")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов HTTP 500")
+    parser.add_argument('--proxy-errors', action='store_true', help="сбои как HTML страница 502 прокси")
+    parser.add_argument('--api-error-rate', type=float, default=0.0, help="доля ответов с ErrorCode 500")
+    parser.add_argument('--session-ttl', type=float, default=0.0, help="время жизни сессии, сек (0 - бессрочно)")
+    parser.add_argument('--snapshot-size', type=int, default=0, help="размер снепшота, байт")
+    args = parser.parse_args()
+
+    server = CloudStubServer(args.host, args.port, verbose=True, latency=args.latency,
+                             latency_jitter=args.latency_jitter, error_rate=args.error_rate,
+                             api_error_rate=args.api_error_rate, session_ttl=args.session_ttl,
+                             snapshot_size=args.snapshot_size, proxy_errors=args.proxy_errors)
+    print(f"Заглушка API запущена: {server.base_url}")
+    print(f"Укажите API_BASE_URL={server.base_url} для работы приложения с заглушкой")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него ответы сжимаются только gzip
+    brotli = None
+
+# Типы содержимого, которые сжимаются; потоки (text/event-stream, MJPEG, ZIP) и
+# изображения отдаются как есть
+COMPRESSIBLE_TYPES = frozenset({
+    'application/json', 'application/javascript', 'application/manifest+json',
+    'text/html', 'text/css', 'text/javascript', 'text/plain', 'image/svg+xml',
+})
+
+
+class ResponseCompressor:
+    """Сжатие ответов Flask (brotli или gzip) по заголовку Accept-Encoding.
+
+    Сжимаются только ответы, тело которых известно целиком: JSON API, страница и
+    статические файлы. Потоковые ответы (SSE /api/stream, таймлапсы) не
+    буферизуются и отдаются без сжатия. Результат для ответа с ETag кешируется по
+    (путь с параметрами, ETag, кодировка): один и тот же статус или файл сжимается один раз,
+    сколько бы зрителей его ни запросили.
+    """
+
+    def __init__(self, min_size: int = 500, level: int = 6, brotli_quality: int = 5,
+                 cache_size: int = 256):
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache: 'OrderedDict[Tuple[str, str, str], bytes]' = OrderedDict()
+        self.compressed_total = 0
+        self.cache_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def choose_encoding(self, accept_encodings) -> Optional[str]:
+        """Кодировка из Accept-Encoding клиента (werkzeug Accept): br, gzip или None"""
+        if brotli is not None and accept_encodings.quality('br') > 0:
+            return 'br'
+        if accept_encodings.quality('gzip') > 0:
+            return 'gzip'
+        return None
+
+    def compressible(self, request, response) -> bool:
+        if request.method != 'GET' or response.status_code != 200:
+            return False
+        if response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers:
+            return False
+        # Генераторы (SSE и другие потоки) не буферизуются; файлы send_file читаются целиком
+        if response.is_streamed and not response.direct_passthrough:
+            return False
+        length = response.content_length
+        return length is None or length >= self.min_size
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def process(self, request, response):
+        """Обработчик after_request: сжатие ответа, если клиент это поддерживает"""
+        if not self.compressible(request, response):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        etag, _ = response.get_etag()
+        key = (request.full_path, etag, encoding) if etag else None
+        with self._lock:
+            body = self._cache.get(key) if key else None
+            if body is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+        if body is not None:
+            # Тело из кеша заменяет файл send_file: файл закрывается вместе с ответом
+            close = getattr(response.response, 'close', None)
+            if close is not None:
+                response.call_on_close(close)
+        else:
+            response.direct_passthrough = False
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            body = self.compress(data, encoding)
+            with self._lock:
+                self.compressed_total += 1
+                self.bytes_in += len(data)
+                self.bytes_out += len(body)
+                if key:
+                    self._cache[key] = body
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            # Сжатое представление не совпадает побайтно с исходным
+            response.set_etag(etag, weak=True)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'brotli': brotli is not None,
+                'compressed_total': self.compressed_total,
+                'cache_hits': self.cache_hits,
+                'cache_entries': len(self._cache),
+                'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+            }
@@ -8,3 +8,127 @@ class Config:
     PASSWORD = os.getenv('PASSWORD')
     API_BASE_URL = os.getenv('API_BASE_URL', 'https://cloud.sz3dp.com')
     DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
+    # Коды регистрации принтеров через запятую; пустое значение - загрузить список из облака
+    PRINTER_CODES = [code.strip() for code in os.getenv('PRINTER_CODES', 'ULJMGV').split(',') if code.strip()]
+    # Параллельный опрос принтеров: число потоков и таймаут одного запроса (сек)
+    POLL_MAX_WORKERS = int(os.getenv('POLL_MAX_WORKERS', '8'))
+    POLL_REQUEST_TIMEOUT = float(os.getenv('POLL_REQUEST_TIMEOUT', '10'))
+    # Интервал keepalive-сообщений потока /api/stream (сек)
+    STREAM_KEEPALIVE = float(os.getenv('STREAM_KEEPALIVE', '15'))
+    # Кеш авторизованной сессии между перезапусками; пустое значение отключает кеш
+    SESSION_CACHE_FILE = os.getenv('SESSION_CACHE_FILE', '.sz3dp_session.json')
+    SESSION_CACHE_TTL = float(os.getenv('SESSION_CACHE_TTL', str(12 * 3600)))
+    # Повторы чтений при временных сбоях облака: число повторов и границы задержки (сек)
+    REQUEST_RETRIES = int(os.getenv('REQUEST_RETRIES', '2'))
+    REQUEST_BACKOFF_BASE = float(os.getenv('REQUEST_BACKOFF_BASE', '0.5'))
+    REQUEST_BACKOFF_MAX = float(os.getenv('REQUEST_BACKOFF_MAX', '8'))
+    # Пул HTTP соединений к облаку: размер пула (не меньше POLL_MAX_WORKERS), таймауты (сек),
+    # повторы ошибок соединения и TCP keep-alive
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '16'))
+    HTTP_POOL_BLOCK = os.getenv('HTTP_POOL_BLOCK', 'False').lower() == 'true'
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '15'))
+    HTTP_CONNECT_RETRIES = int(os.getenv('HTTP_CONNECT_RETRIES', '2'))
+    HTTP_TCP_KEEPALIVE = os.getenv('HTTP_TCP_KEEPALIVE', 'True').lower() == 'true'
+    # Сохранять полный ответ GetPrinterStatus в статусе (raw_data) - только для отладки
+    STATUS_KEEP_RAW = os.getenv('STATUS_KEEP_RAW', 'False').lower() == 'true'
+    # Хранилище состояния: memory (один процесс) или sqlite (общее для веб-воркеров
+    # и отдельного опросчика run.py --mode poller), путь к файлу базы и период
+    # проверки изменений для потока /api/stream в веб-воркерах (сек)
+    STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory').lower()
+    STATE_DB_PATH = os.getenv('STATE_DB_PATH', 'sz3dp_state.db')
+    STATE_WATCH_INTERVAL = float(os.getenv('STATE_WATCH_INTERVAL', '1'))
+    # Каталог истории телеметрии (температуры, прогресс); пустое значение отключает запись
+    TELEMETRY_DIR = os.getenv('TELEMETRY_DIR', 'telemetry')
+    # Бюджет точек ответа /api/printers/<regcode>/history: при превышении выбираются агрегаты
+    HISTORY_MAX_POINTS = int(os.getenv('HISTORY_MAX_POINTS', '1000'))
+    # Архив снепшотов для таймлапсов (пустое значение отключает) и срок хранения кадров (дни)
+    SNAPSHOT_ARCHIVE_DIR = os.getenv('SNAPSHOT_ARCHIVE_DIR', 'snapshot_archive')
+    SNAPSHOT_RETENTION_DAYS = float(os.getenv('SNAPSHOT_RETENTION_DAYS', '7'))
+    # Уменьшенные варианты снепшота (имя:наибольшая сторона в пикселях) и качество их JPEG;
+    # варианты готовятся только при установленном Pillow
+    SNAPSHOT_VARIANTS = os.getenv('SNAPSHOT_VARIANTS', 'thumb:160,medium:640')
+    SNAPSHOT_VARIANT_QUALITY = int(os.getenv('SNAPSHOT_VARIANT_QUALITY', '70'))
+    # Адаптивный опрос (сек): печать, нагрев и завершение печати, пауза, простой,
+    # максимальный интервал для недоступного принтера, снепшоты камеры при печати и простое
+    POLL_INTERVAL_PRINTING = float(os.getenv('POLL_INTERVAL_PRINTING', '30'))
+    POLL_INTERVAL_ACTIVE = float(os.getenv('POLL_INTERVAL_ACTIVE', '10'))
+    POLL_INTERVAL_PAUSED = float(os.getenv('POLL_INTERVAL_PAUSED', '60'))
+    POLL_INTERVAL_IDLE = float(os.getenv('POLL_INTERVAL_IDLE', '300'))
+    POLL_INTERVAL_OFFLINE_MAX = float(os.getenv('POLL_INTERVAL_OFFLINE_MAX', '600'))
+    CAMERA_INTERVAL_PRINTING = float(os.getenv('CAMERA_INTERVAL_PRINTING', '60'))
+    CAMERA_INTERVAL_IDLE = float(os.getenv('CAMERA_INTERVAL_IDLE', '600'))
+    # Период проверки расписания, случайное отклонение интервалов (доля) и
+    # максимальное число принтеров за один тик (0 - без ограничения)
+    POLL_TICK = float(os.getenv('POLL_TICK', '2'))
+    POLL_JITTER = float(os.getenv('POLL_JITTER', '0.2'))
+    POLL_MAX_BATCH = int(os.getenv('POLL_MAX_BATCH', '0'))
+    # Ручное обновление: данные моложе REFRESH_MIN_FRESHNESS секунд возвращаются из кеша,
+    # ожидание уже выполняющегося запроса ограничено REFRESH_WAIT_TIMEOUT секундами
+    REFRESH_MIN_FRESHNESS = float(os.getenv('REFRESH_MIN_FRESHNESS', '10'))
+    REFRESH_WAIT_TIMEOUT = float(os.getenv('REFRESH_WAIT_TIMEOUT', '20'))
+    # Сессии камер: прогрев после включения, время жизни сессии в облаке и запас для
+    # продления до истечения (сек)
+    CAMERA_WARMUP = float(os.getenv('CAMERA_WARMUP', '2'))
+    CAMERA_SESSION_TTL = float(os.getenv('CAMERA_SESSION_TTL', '300'))
+    CAMERA_REOPEN_MARGIN = float(os.getenv('CAMERA_REOPEN_MARGIN', '30'))
+    # Сколько секунд принтер считается просматриваемым после последнего обращения зрителя;
+    # без зрителей снепшоты не запрашиваются, а последний кадр освобождается
+    VIEWER_GRACE_PERIOD = float(os.getenv('VIEWER_GRACE_PERIOD', '120'))
+    # Уровень логирования (DEBUG включает фрагменты ответов облака) и интервал (сек),
+    # в течение которого повторы одной ошибки принтера не пишутся в лог
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_ERROR_INTERVAL = float(os.getenv('LOG_ERROR_INTERVAL', '60'))
+    # Порт HTTP сервера метрик (/metrics) в режиме опросчика (run.py --mode poller);
+    # 0 - не запускать. Веб-приложение отдает /metrics на своем порту
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+    # События принтеров (завершение печати, дверь, филамент, температура, зависание, связь):
+    # получатели - webhook (POST JSON), файл JSON Lines и почта; пустое значение отключает
+    EVENTS_WEBHOOK_URL = os.getenv('EVENTS_WEBHOOK_URL', '')
+    EVENTS_FILE = os.getenv('EVENTS_FILE', '')
+    EVENTS_EMAIL_TO = os.getenv('EVENTS_EMAIL_TO', '')
+    SMTP_HOST = os.getenv('SMTP_HOST', '')
+    SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+    SMTP_USER = os.getenv('SMTP_USER', '')
+    SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '')
+    SMTP_FROM = os.getenv('SMTP_FROM', '')
+    SMTP_TLS = os.getenv('SMTP_TLS', 'True').lower() == 'true'
+    # Повтор того же события принтера в течение EVENTS_DEDUP_WINDOW секунд отбрасывается;
+    # каждому получателю - не более EVENTS_RATE_LIMIT событий за EVENTS_RATE_INTERVAL секунд
+    EVENTS_DEDUP_WINDOW = float(os.getenv('EVENTS_DEDUP_WINDOW', '300'))
+    EVENTS_RATE_LIMIT = int(os.getenv('EVENTS_RATE_LIMIT', '20'))
+    EVENTS_RATE_INTERVAL = float(os.getenv('EVENTS_RATE_INTERVAL', '60'))
+    # Пороги событий: неудачных опросов до «недоступен», секунд без изменения прогресса
+    # до «зависла», допустимое отклонение температуры (°C) и время на нагрев (сек)
+    EVENT_OFFLINE_AFTER = int(os.getenv('EVENT_OFFLINE_AFTER', '3'))
+    EVENT_STALL_TIMEOUT = float(os.getenv('EVENT_STALL_TIMEOUT', '900'))
+    EVENT_TEMP_TOLERANCE = float(os.getenv('EVENT_TEMP_TOLERANCE', '10'))
+    EVENT_TEMP_GRACE = float(os.getenv('EVENT_TEMP_GRACE', '900'))
+    # Выключатель команд облака: после CIRCUIT_FAILURE_THRESHOLD сбоев подряд (ошибки сети,
+    # таймауты, HTTP 429/5xx) запросы не выполняются CIRCUIT_RECOVERY_TIMEOUT секунд, затем
+    # пробный запрос; 0 - отключить. Пока облако недоступно, отдаются последние данные
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+    CIRCUIT_RECOVERY_TIMEOUT = float(os.getenv('CIRCUIT_RECOVERY_TIMEOUT', '30'))
+    # Потоки для обновлений, запрошенных из веб-интерфейса (/api/refresh, /api/camera/refresh)
+    REFRESH_WORKERS = int(os.getenv('REFRESH_WORKERS', '4'))
+    # Веб-сервер: dev - встроенный сервер Flask, production - gunicorn (run.py --server production
+    # или gunicorn -c gunicorn.conf.py app:app). Класс воркеров: gevent - соединения обслуживаются
+    # greenlet'ами (до SERVER_WORKER_CONNECTIONS на воркер, поток SSE не занимает поток ОС),
+    # gthread - SERVER_THREADS потоков на воркер, auto - gevent, если он установлен, иначе gthread
+    SERVER = os.getenv('SERVER', 'dev')
+    SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+    SERVER_PORT = int(os.getenv('SERVER_PORT', '5000'))
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', '1'))
+    SERVER_WORKER_CLASS = os.getenv('SERVER_WORKER_CLASS', 'gevent')
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', '16'))
+    SERVER_WORKER_CONNECTIONS = int(os.getenv('SERVER_WORKER_CONNECTIONS', '1000'))
+    # Перезапуск зависшего воркера (сек) и время удержания keep-alive соединения (сек)
+    SERVER_TIMEOUT = int(os.getenv('SERVER_TIMEOUT', '60'))
+    SERVER_KEEPALIVE = int(os.getenv('SERVER_KEEPALIVE', '5'))
+    # Сжатие ответов gzip/brotli (brotli - если установлен): ответы меньше COMPRESS_MIN_SIZE
+    # байт не сжимаются; уровень gzip (1-9) и качество brotli (0-11)
+    COMPRESS_RESPONSES = os.getenv('COMPRESS_RESPONSES', 'True').lower() == 'true'
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '500'))
+    COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', '5'))
@@ -0,0 +1,469 @@
+import json
+import queue
+import smtplib
+import threading
+import time
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from email.message import EmailMessage
+from typing import Dict, Any, List, Optional, Iterable, Sequence, Tuple
+
+import requests
+
+from adaptive_scheduler import IDLE_JOB_STATUSES, PAUSED_JOB_STATUSES
+from log_utils import error_limiter
+from metrics import EVENTS_TOTAL, EVENT_DELIVERIES
+from state_store import StateStore, MemoryStateStore
+
+logger = logging.getLogger(__name__)
+
+# Типы событий
+JOB_FINISHED = 'job_finished'
+JOB_FAILED = 'job_failed'
+DOOR_OPENED = 'door_opened'
+DOOR_CLOSED = 'door_closed'
+FILAMENT_PROBLEM = 'filament_problem'
+FILAMENT_OK = 'filament_ok'
+TEMPERATURE_DEVIATION = 'temperature_deviation'
+TEMPERATURE_OK = 'temperature_ok'
+PRINT_STALLED = 'print_stalled'
+PRINTER_OFFLINE = 'printer_offline'
+PRINTER_ONLINE = 'printer_online'
+
+# Статусы задания: завершено успешно и прервано
+FINISHED_JOB_STATUSES = {'completed', 'complete', 'finished'}
+FAILED_JOB_STATUSES = {'failed', 'error', 'fault', 'aborted',
+                       'cancel', 'canceled', 'cancelled', 'stopped'}
+
+# Датчики температуры: поле статуса и название для сообщений
+TEMPERATURE_SENSORS = (('extruder_temp', 'экструдер'), ('bed_temp', 'стол'))
+
+
+class Event:
+    """Событие принтера: тип, уровень, сообщение и данные перехода"""
+
+    __slots__ = ('type', 'printer', 'severity', 'message', 'data', 'timestamp')
+
+    def __init__(self, type: str, printer: str, severity: str, message: str,
+                 data: Optional[Dict[str, Any]] = None, timestamp: Optional[float] = None):
+        self.type = type
+        self.printer = printer
+        self.severity = severity
+        self.message = message
+        self.data = data or {}
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    @property
+    def key(self) -> Tuple[str, ...]:
+        """Ключ дедупликации: принтер, тип и датчик (для температуры)"""
+        return (self.printer, self.type, str(self.data.get('sensor', '')))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'type': self.type,
+            'printer': self.printer,
+            'severity': self.severity,
+            'message': self.message,
+            'data': self.data,
+            'timestamp': self.timestamp,
+        }
+
+    def __repr__(self) -> str:
+        return f'Event({self.type!r}, {self.printer!r})'
+
+
+class _PrinterState:
+    """Последнее известное состояние принтера для сравнения со следующим статусом"""
+
+    __slots__ = ('job_status', 'door_open', 'filament_problem', 'progress', 'progress_at',
+                 'stalled', 'failures', 'offline', 'temperatures')
+
+    def __init__(self):
+        self.job_status: Optional[str] = None
+        self.door_open: Optional[bool] = None
+        self.filament_problem: Optional[bool] = None
+        self.progress = 0.0
+        self.progress_at = 0.0
+        self.stalled = False
+        self.failures = 0
+        self.offline = False
+        # датчик -> [цель, время выхода за допуск или None, цель достигнута, событие отправлено]
+        self.temperatures: Dict[str, list] = {}
+
+
+class EventDetector:
+    """Обнаружение событий по переходам между последовательными статусами принтера.
+
+    Для каждого принтера хранится только последнее состояние, поэтому каждый
+    статус обрабатывается за постоянное время без просмотра истории. Первый
+    статус принтера задает исходное состояние и событий не порождает.
+    """
+
+    def __init__(self, offline_after: int = 3, stall_timeout: float = 900.0,
+                 temp_tolerance: float = 10.0, temp_grace: float = 900.0):
+        # Число неудачных опросов подряд, после которого принтер считается недоступным
+        self.offline_after = offline_after
+        # Сколько секунд прогресс печати может не меняться
+        self.stall_timeout = stall_timeout
+        # Допустимое отклонение от целевой температуры и время на нагрев до нее
+        self.temp_tolerance = temp_tolerance
+        self.temp_grace = temp_grace
+        self._lock = threading.Lock()
+        self._states: Dict[str, _PrinterState] = {}
+
+    def detect(self, registration_code: str, status: Optional[Dict[str, Any]],
+               now: Optional[float] = None) -> List[Event]:
+        """События перехода к новому статусу (None - опрос не удался)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._states.get(registration_code)
+            if state is None:
+                state = self._states[registration_code] = _PrinterState()
+            if not status:
+                return self._failed(registration_code, state, now)
+            return self._changed(registration_code, state, status, now)
+
+    def forget(self, registration_code: str):
+        with self._lock:
+            self._states.pop(registration_code, None)
+
+    def _failed(self, code: str, state: _PrinterState, now: float) -> List[Event]:
+        state.failures += 1
+        if state.offline or state.failures < self.offline_after:
+            return []
+        state.offline = True
+        return [Event(PRINTER_OFFLINE, code, 'critical',
+                      f"Принтер {code} недоступен ({state.failures} опросов без ответа)",
+                      {'failures': state.failures}, now)]
+
+    def _changed(self, code: str, state: _PrinterState, status: Dict[str, Any], now: float) -> List[Event]:
+        events: List[Event] = []
+        name = status.get('printer_name') or code
+        state.failures = 0
+        if state.offline:
+            state.offline = False
+            events.append(Event(PRINTER_ONLINE, code, 'info', f"Принтер {name} снова на связи", {}, now))
+
+        job_status = str(status.get('job_status') or '').lower()
+        if state.job_status is not None and job_status != state.job_status:
+            data = {'job_status': job_status, 'previous': state.job_status,
+                    'model_name': status.get('model_name', '')}
+            if job_status in FINISHED_JOB_STATUSES:
+                events.append(Event(JOB_FINISHED, code, 'info',
+                                    f"{name}: печать завершена ({data['model_name']})", data, now))
+            elif job_status in FAILED_JOB_STATUSES and state.job_status not in FAILED_JOB_STATUSES:
+                events.append(Event(JOB_FAILED, code, 'critical',
+                                    f"{name}: печать прервана ({job_status})", data, now))
+        state.job_status = job_status
+
+        door_open = status.get('enclosure_status') == 'открыт'
+        if state.door_open is not None and door_open != state.door_open:
+            events.append(Event(DOOR_OPENED, code, 'warning', f"{name}: дверь открыта", {}, now) if door_open
+                          else Event(DOOR_CLOSED, code, 'info', f"{name}: дверь закрыта", {}, now))
+        state.door_open = door_open
+
+        filament_problem = status.get('filament_status') not in (None, 'нормальный')
+        if state.filament_problem is not None and filament_problem != state.filament_problem:
+            events.append(Event(FILAMENT_PROBLEM, code, 'critical', f"{name}: проблема с филаментом", {}, now)
+                          if filament_problem else
+                          Event(FILAMENT_OK, code, 'info', f"{name}: филамент в норме", {}, now))
+        state.filament_problem = filament_problem
+
+        events.extend(self._temperatures(code, name, state, status, now))
+        events.extend(self._progress(code, name, state, status, job_status, now))
+        return events
+
+    def _temperatures(self, code: str, name: str, state: _PrinterState,
+                      status: Dict[str, Any], now: float) -> List[Event]:
+        events = []
+        for key, title in TEMPERATURE_SENSORS:
+            temp = status.get(key) or {}
+            current = temp.get('current') or 0
+            target = temp.get('target') or 0
+            sensor = state.temperatures.get(key)
+            if sensor is None or sensor[0] != target:
+                # Новая цель: нагрев до нее не считается отклонением
+                sensor = state.temperatures[key] = [target, None, False, False]
+            if target <= 0:
+                continue
+
+            deviation = abs(current - target)
+            if deviation <= self.temp_tolerance:
+                sensor[1] = None
+                sensor[2] = True
+                if sensor[3]:
+                    sensor[3] = False
+                    events.append(Event(TEMPERATURE_OK, code, 'info',
+                                        f"{name}: температура ({title}) вернулась к {target:g}°",
+                                        {'sensor': key, 'current': current, 'target': target}, now))
+                continue
+
+            if sensor[1] is None:
+                sensor[1] = now
+            # До первого достижения цели отклонение допускается temp_grace секунд
+            if not sensor[3] and (sensor[2] or now - sensor[1] >= self.temp_grace):
+                sensor[3] = True
+                events.append(Event(TEMPERATURE_DEVIATION, code, 'warning',
+                                    f"{name}: температура ({title}) {current:g}° при цели {target:g}°",
+                                    {'sensor': key, 'current': current, 'target': target}, now))
+        return events
+
+    def _progress(self, code: str, name: str, state: _PrinterState, status: Dict[str, Any],
+                  job_status: str, now: float) -> List[Event]:
+        progress = status.get('progress_percent') or 0
+        active = job_status not in IDLE_JOB_STATUSES and job_status not in PAUSED_JOB_STATUSES \
+            and job_status not in FAILED_JOB_STATUSES
+        if not active or progress != state.progress or not state.progress_at:
+            state.progress = progress
+            state.progress_at = now
+            state.stalled = False
+            return []
+        if state.stalled or now - state.progress_at < self.stall_timeout:
+            return []
+        state.stalled = True
+        minutes = (now - state.progress_at) / 60
+        return [Event(PRINT_STALLED, code, 'warning',
+                      f"{name}: прогресс печати {progress}% не меняется {minutes:.0f} мин",
+                      {'progress_percent': progress, 'stalled_seconds': round(now - state.progress_at)}, now)]
+
+
+# Получатели событий
+
+class EventSink(ABC):
+    """Получатель событий; send() вызывается из потока доставки и может блокироваться"""
+
+    name = 'sink'
+
+    @abstractmethod
+    def send(self, event: Event):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class WebhookSink(EventSink):
+    """POST события в формате JSON на URL"""
+
+    name = 'webhook'
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def send(self, event: Event):
+        response = self.session.post(self.url, json=event.to_dict(), timeout=self.timeout)
+        response.raise_for_status()
+
+    def close(self):
+        self.session.close()
+
+
+class EmailSink(EventSink):
+    """Письмо на каждое событие через SMTP"""
+
+    name = 'email'
+
+    def __init__(self, host: str, port: int, sender: str, recipients: Sequence[str],
+                 username: str = '', password: str = '', use_tls: bool = True, timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = list(recipients)
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+    def send(self, event: Event):
+        message = EmailMessage()
+        message['Subject'] = f"[SZ3DP] {event.message}"
+        message['From'] = self.sender
+        message['To'] = ', '.join(self.recipients)
+        message.set_content(f"{event.message}\n\n"
+                            f"Принтер: {event.printer}\n"
+                            f"Событие: {event.type}\n"
+                            f"Время: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event.timestamp))}\n"
+                            f"Данные: {json.dumps(event.data, ensure_ascii=False)}\n")
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+class FileSink(EventSink):
+    """Запись событий в файл, по одному JSON объекту на строку"""
+
+    name = 'file'
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, event: Event):
+        line = json.dumps(event.to_dict(), ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(line)
+
+
+class QueueSink(EventSink):
+    """Передача событий в очередь процесса для собственных обработчиков"""
+
+    name = 'queue'
+
+    def __init__(self, target: Optional[queue.Queue] = None, maxsize: int = 1000):
+        self.queue = target if target is not None else queue.Queue(maxsize=maxsize)
+
+    def send(self, event: Event):
+        self.queue.put_nowait(event)
+
+
+def create_sinks(webhook_url: str = '', file_path: str = '', email_to: str = '',
+                 smtp_host: str = '', smtp_port: int = 587, smtp_user: str = '',
+                 smtp_password: str = '', smtp_from: str = '', smtp_tls: bool = True) -> List[EventSink]:
+    """Получатели событий из конфигурации; пустой параметр отключает получателя"""
+    sinks: List[EventSink] = []
+    if webhook_url:
+        sinks.append(WebhookSink(webhook_url))
+    if file_path:
+        sinks.append(FileSink(file_path))
+    recipients = [address.strip() for address in email_to.split(',') if address.strip()]
+    if recipients:
+        if not smtp_host:
+            raise ValueError("Для отправки событий по почте нужен SMTP_HOST")
+        sinks.append(EmailSink(smtp_host, smtp_port, smtp_from or smtp_user, recipients,
+                               smtp_user, smtp_password, smtp_tls))
+    return sinks
+
+
+class EventDispatcher:
+    """Доставка событий получателям в фоновом потоке.
+
+    Повтор события с тем же ключом в течение dedup_window секунд отбрасывается.
+    Каждому получателю доставляется не более rate_limit событий за rate_interval
+    секунд, остальные отбрасываются. publish() не блокируется: при переполнении
+    очереди доставки события отбрасываются.
+
+    Последние history событий записываются в хранилище состояния (recent()), поэтому
+    при общем хранилище их видят и веб-воркеры, которые сами не опрашивают облако.
+    """
+
+    def __init__(self, sinks: Iterable[EventSink] = (), dedup_window: float = 300.0,
+                 rate_limit: int = 20, rate_interval: float = 60.0,
+                 queue_size: int = 1000, history: int = 200, store: Optional[StateStore] = None):
+        self.sinks = list(sinks)
+        self.dedup_window = dedup_window
+        self.rate_limit = rate_limit
+        self.rate_interval = rate_interval
+        self.history = history
+        self.store = store if store is not None else MemoryStateStore()
+        self._lock = threading.Lock()
+        self._last_sent: Dict[Tuple[str, ...], float] = {}
+        # Время доставок по получателям в пределах rate_interval
+        self._deliveries: Dict[str, deque] = {sink.name: deque() for sink in self.sinks}
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self.published_total = 0
+        self.duplicates_total = 0
+        self.dropped_total = 0
+
+    def add_sink(self, sink: EventSink):
+        with self._lock:
+            self.sinks.append(sink)
+            self._deliveries.setdefault(sink.name, deque())
+
+    def publish(self, events: Iterable[Event]):
+        for event in events:
+            with self._lock:
+                last = self._last_sent.get(event.key)
+                if last is not None and event.timestamp - last < self.dedup_window:
+                    self.duplicates_total += 1
+                    continue
+                self._last_sent[event.key] = event.timestamp
+                self.published_total += 1
+            EVENTS_TOTAL.inc(event.type)
+            try:
+                self.store.add_event(event.to_dict(), self.history)
+            except Exception as e:
+                error_limiter.log(logger, logging.ERROR, ('events', 'store'),
+                                  "Ошибка записи события %s в хранилище: %s", event.type, e)
+            logger.info("Событие %s: %s", event.type, event.message)
+            if not self.sinks:
+                continue
+            self._start()
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                with self._lock:
+                    self.dropped_total += 1
+                error_limiter.log(logger, logging.WARNING, ('events', 'queue'),
+                                  "Очередь доставки событий переполнена, событие %s отброшено", event.type)
+
+    def recent(self, limit: int = 50, registration_code: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Последние события из хранилища состояния, новые первыми"""
+        return self.store.recent_events(limit, registration_code)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'sinks': [sink.name for sink in self.sinks],
+                'published_total': self.published_total,
+                'duplicates_total': self.duplicates_total,
+                'dropped_total': self.dropped_total,
+                'queued': self._queue.qsize(),
+            }
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='event-delivery', daemon=True)
+            self._thread.start()
+
+    def _allowed(self, sink: EventSink, now: float) -> bool:
+        with self._lock:
+            deliveries = self._deliveries[sink.name]
+            while deliveries and now - deliveries[0] >= self.rate_interval:
+                deliveries.popleft()
+            if self.rate_limit and len(deliveries) >= self.rate_limit:
+                return False
+            deliveries.append(now)
+            return True
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            for sink in list(self.sinks):
+                if not self._allowed(sink, time.monotonic()):
+                    EVENT_DELIVERIES.inc(sink.name, 'rate_limited')
+                    error_limiter.log(logger, logging.WARNING, ('events', sink.name, 'rate'),
+                                      "Превышен лимит событий для получателя %s, событие %s отброшено",
+                                      sink.name, event.type)
+                    continue
+                try:
+                    sink.send(event)
+                    EVENT_DELIVERIES.inc(sink.name, 'sent')
+                except Exception as e:
+                    EVENT_DELIVERIES.inc(sink.name, 'error')
+                    error_limiter.log(logger, logging.ERROR, ('events', sink.name),
+                                      "Ошибка доставки события %s получателю %s: %s", event.type, sink.name, e)
+
+    def close(self, timeout: float = 5.0):
+        """Доставка оставшихся событий и остановка потока"""
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                logger.warning("Очередь доставки событий не освободилась, остаток не доставлен")
+            thread.join(timeout)
+        for sink in self.sinks:
+            sink.close()
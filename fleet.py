@@ -0,0 +1,266 @@
+import time
+import logging
+from typing import Dict, Any, List, Optional, Iterable, Callable
+
+from state_store import StateStore, MemoryStateStore
+from log_utils import error_limiter
+from circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Поля статуса, которые копируются из ответа клиента в запись принтера
+STATUS_FIELDS = {
+    'model_name': 'Неизвестная модель',
+    'progress_percent': 0,
+    'time_remaining': 'Неизвестно',
+    'estimate_minutes': 0,
+    'extruder_temp': {'current': 0, 'target': 0},
+    'bed_temp': {'current': 0, 'target': 0},
+    'enclosure_status': 'Неизвестно',
+    'filament_status': 'Неизвестно',
+    'printer_name': '',
+    'registration_code': '',
+    'firmware_version': '',
+    'printer_type': '',
+    'measure': '',
+    'job_status': '',
+    'duration': 0,
+}
+
+
+def default_printer_record(registration_code: str) -> Dict[str, Any]:
+    """Начальная запись принтера до первого обновления"""
+    return {
+        'model_name': 'Загрузка...',
+        'progress_percent': 0,
+        'time_remaining': 'Загрузка...',
+        'extruder_temp': {'current': 0, 'target': 0},
+        'bed_temp': {'current': 0, 'target': 0},
+        'enclosure_status': 'Загрузка...',
+        'filament_status': 'Загрузка...',
+        'registration_code': registration_code,
+        'last_update': 'Не обновлено',
+        'connection_status': 'Отключено',
+        'status_updated_at': None,
+        'stale': False,
+        'snapshot_url': None,
+        'snapshot_version': None,
+        'camera_enabled': False,
+        'camera_state': 'closed',
+        'snapshot_last_update': 'Не обновлено'
+    }
+
+
+def extract_registration_codes(printers: Any) -> List[str]:
+    """Извлечение кодов регистрации из ответа get_printers_list()"""
+    if isinstance(printers, dict):
+        # Список может быть вложен в ответ API
+        for key in ('Printers', 'Detail', 'Data', 'List', 'printers', 'data'):
+            if isinstance(printers.get(key), list):
+                printers = printers[key]
+                break
+        else:
+            printers = [printers]
+
+    codes = []
+    if not isinstance(printers, list):
+        return codes
+
+    for item in printers:
+        if isinstance(item, str):
+            code = item
+        elif isinstance(item, dict):
+            code = (item.get('RegistrationCode') or item.get('regcode')
+                    or item.get('registration_code') or '')
+        else:
+            continue
+        code = str(code).strip()
+        if code and code not in codes:
+            codes.append(code)
+    return codes
+
+
+class PrinterFleet:
+    """Парк принтеров, опрашиваемых через одну авторизованную сессию клиента.
+
+    Записи принтеров и их версии хранятся в StateStore: в памяти процесса или
+    в общем хранилище, которое читают веб-воркеры без собственного опросчика.
+    """
+
+    def __init__(self, client, registration_codes: Optional[Iterable[str]] = None,
+                 max_workers: int = 8, request_timeout: Optional[float] = 10.0,
+                 store: Optional[StateStore] = None):
+        self.client = client
+        self.max_workers = max_workers
+        self.request_timeout = request_timeout
+        self.store = store if store is not None else MemoryStateStore()
+        self._listeners: List[Callable[[str, Dict[str, Any], int], None]] = []
+        self._status_listeners: List[Callable[[str, Optional[Dict[str, Any]]], None]] = []
+        self._configured_codes = [code for code in (registration_codes or []) if code]
+        for code in self._configured_codes:
+            self.store.add_printer(code, default_printer_record(code))
+
+    @property
+    def codes(self) -> List[str]:
+        """Коды регистрации всех принтеров парка"""
+        return self.store.codes()
+
+    @property
+    def default_code(self) -> Optional[str]:
+        """Код принтера, отображаемого на главной странице"""
+        codes = self.codes
+        return codes[0] if codes else None
+
+    def discover(self) -> List[str]:
+        """Загрузка списка принтеров из облака, если коды не заданы в конфигурации"""
+        if self._configured_codes:
+            return self.codes
+
+        logger.info("Коды принтеров не заданы, запрашиваем список из облака...")
+        codes = extract_registration_codes(self.client.get_printers_list() or [])
+        if not codes:
+            logger.warning("Не удалось получить список принтеров")
+            return self.codes
+
+        for code in codes:
+            self.store.add_printer(code, default_printer_record(code))
+        logger.info("Найдено принтеров: %s", len(codes))
+        return self.codes
+
+    def __contains__(self, registration_code: str) -> bool:
+        return registration_code in self.store.codes()
+
+    def get(self, registration_code: str) -> Optional[Dict[str, Any]]:
+        """Копия записи принтера или None, если принтер не входит в парк"""
+        return self.store.get(registration_code)
+
+    def get_default(self) -> Dict[str, Any]:
+        """Запись принтера по умолчанию (для главной страницы и /api/status)"""
+        code = self.default_code
+        record = self.get(code) if code else None
+        return record if record is not None else default_printer_record(code or '')
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        """Копии записей всех принтеров парка"""
+        return self.store.all()
+
+    @property
+    def version(self) -> int:
+        """Версия состояния всего парка"""
+        return self.store.version
+
+    def printer_version(self, registration_code: str) -> int:
+        """Версия последнего изменения записи принтера"""
+        return self.store.printer_version(registration_code)
+
+    def changes_since(self, registration_code: str, since: int) -> Dict[str, Any]:
+        """Поля записи принтера, изменившиеся после версии since"""
+        return self.store.changes_since(registration_code, since)
+
+    def set_fields(self, registration_code: str, **fields):
+        """Обновление отдельных полей записи принтера"""
+        self.update_record(registration_code, fields)
+
+    def add_listener(self, callback: Callable[[str, Dict[str, Any], int], None]):
+        """Подписка на изменения: callback(код, {поле: новое значение}, версия)"""
+        self._listeners.append(callback)
+
+    def add_status_listener(self, callback: Callable[[str, Optional[Dict[str, Any]]], None]):
+        """Подписка на каждый результат опроса: callback(код, статус или None при ошибке)"""
+        self._status_listeners.append(callback)
+
+    def update_record(self, registration_code: str, fields: Dict[str, Any]):
+        """Обновление записи принтера словарем полей"""
+        changes, version = self.store.update(registration_code, fields)
+        if not changes:
+            return
+
+        for callback in self._listeners:
+            try:
+                callback(registration_code, changes, version)
+            except Exception as e:
+                logger.error("Ошибка обработчика изменений принтера %s: %s", registration_code, e)
+
+    def mark_failed(self, registration_code: str, connection_status: str = 'Ошибка подключения'):
+        """Неудачный опрос: ранее полученный статус остается и помечается устаревшим.
+
+        Время последнего успешного опроса (last_update, status_updated_at) не меняется,
+        поэтому по нему видно, насколько устарели данные.
+        """
+        record = self.store.get(registration_code)
+        if record is not None and record.get('status_updated_at'):
+            fields = {'connection_status': 'Данные устарели', 'stale': True}
+        else:
+            fields = {'connection_status': connection_status, 'last_update': time.strftime('%H:%M:%S')}
+        self.update_record(registration_code, fields)
+
+    def mark_skipped(self, registration_code: str):
+        """Опрос пропущен разомкнутым выключателем: облако недоступно, о самом принтере
+        ничего не известно. Статус помечается устаревшим, обработчики статусов (события)
+        не вызываются."""
+        self.mark_failed(registration_code, 'Облако недоступно')
+
+    def apply_status(self, registration_code: str, status: Optional[Dict[str, Any]]):
+        """Сохранение результата get_printer_status() в запись принтера"""
+        if status:
+            fields = {key: status.get(key, default) for key, default in STATUS_FIELDS.items()}
+            fields['registration_code'] = fields['registration_code'] or registration_code
+            fields['last_update'] = time.strftime('%H:%M:%S')
+            fields['status_updated_at'] = round(time.time(), 1)
+            fields['stale'] = False
+            fields['connection_status'] = 'Подключено'
+            self.update_record(registration_code, fields)
+        else:
+            self.mark_failed(registration_code)
+
+        for callback in self._status_listeners:
+            try:
+                callback(registration_code, status)
+            except Exception as e:
+                logger.error("Ошибка обработчика статуса принтера %s: %s", registration_code, e)
+
+    def update_status(self, registration_code: str) -> bool:
+        """Обновление статуса одного принтера"""
+        try:
+            status = self.client.get_printer_status(registration_code)
+            self.apply_status(registration_code, status)
+            if status:
+                logger.debug("Принтер %s: %s - %s", registration_code, status.get('printer_name', 'Unknown'), status.get('job_status', 'Unknown'))
+                return True
+            error_limiter.log(logger, logging.WARNING, ('status', registration_code),
+                              "Не удалось получить данные принтера %s", registration_code)
+        except CircuitOpenError:
+            self.mark_skipped(registration_code)
+        except Exception as e:
+            error_limiter.log(logger, logging.ERROR, ('status', registration_code),
+                              "Ошибка при обновлении данных принтера %s: %s", registration_code, e)
+            self.mark_failed(registration_code, f'Ошибка: {str(e)}')
+        return False
+
+    def update_many(self, codes: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Параллельное обновление статусов выбранных принтеров; возвращает статусы (None при ошибке).
+
+        Принтеры, опрос которых пропущен разомкнутым выключателем, в результат не входят.
+        """
+        codes = list(codes)
+        try:
+            statuses = self.client.get_printer_statuses(
+                codes, max_workers=self.max_workers, timeout=self.request_timeout
+            )
+        except Exception as e:
+            logger.error("Ошибка при обновлении данных принтеров: %s", e)
+            for code in codes:
+                self.mark_failed(code, f'Ошибка: {str(e)}')
+            return {code: None for code in codes}
+
+        for code in codes:
+            if code in statuses:
+                self.apply_status(code, statuses[code])
+            else:
+                self.mark_skipped(code)
+        return {code: statuses[code] for code in codes if code in statuses}
+
+    def update_all(self) -> int:
+        """Параллельное обновление статусов всех принтеров, возвращает число успешных"""
+        statuses = self.update_many(self.codes)
+        return sum(1 for status in statuses.values() if status)
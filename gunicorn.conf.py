@@ -0,0 +1,21 @@
+"""
+Настройки gunicorn для веб-воркеров:
+
+  gunicorn -c gunicorn.conf.py app:app
+
+Параметры берутся из переменных окружения SERVER_* (config.py). Воркеры только
+отдают веб-интерфейс: облако опрашивает отдельный процесс run.py --mode poller,
+состояние передается через общее хранилище (STATE_BACKEND=sqlite).
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config  # noqa: E402
+from server import gunicorn_options, shutdown_worker  # noqa: E402
+
+globals().update(gunicorn_options(Config))
+
+worker_exit = shutdown_worker
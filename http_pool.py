@@ -0,0 +1,112 @@
+import socket
+import threading
+import time
+import logging
+from typing import Dict, Any, List, Tuple
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+def tcp_keepalive_options(idle: int = 60, interval: int = 15, count: int = 4) -> List[Tuple[int, int, int]]:
+    """Опции сокета для TCP keep-alive (параметры задаются там, где ОС их поддерживает)"""
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle))
+    elif hasattr(socket, 'TCP_KEEPALIVE'):
+        # macOS
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle))
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval))
+    if hasattr(socket, 'TCP_KEEPCNT'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count))
+    return options
+
+
+def connect_retry_policy(retries: int, backoff_factor: float = 0.2) -> Retry:
+    """Повторы только для ошибок установки соединения: запрос еще не отправлен,
+    поэтому это безопасно и для POST. Ошибки чтения и HTTP статусы не повторяются -
+    ими занимается слой команд клиента."""
+    return Retry(
+        total=retries,
+        connect=retries,
+        read=False,
+        status=False,
+        other=0,
+        redirect=False,
+        backoff_factor=backoff_factor,
+        raise_on_status=False,
+    )
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter с TCP keep-alive и учетом использования пула соединений"""
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 10, max_retries=0,
+                 pool_block: bool = False, tcp_keepalive: bool = True):
+        self.tcp_keepalive = tcp_keepalive
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+        self.errors_total = 0
+        self.busy_seconds = 0.0
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                         max_retries=max_retries, pool_block=pool_block)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.tcp_keepalive:
+            pool_kwargs['socket_options'] = HTTPConnection.default_socket_options + tcp_keepalive_options()
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+
+    def send(self, request, **kwargs):
+        with self._stats_lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.monotonic()
+        try:
+            return super().send(request, **kwargs)
+        except Exception:
+            with self._stats_lock:
+                self.errors_total += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            with self._stats_lock:
+                self.in_flight -= 1
+                self.requests_total += 1
+                self.busy_seconds += elapsed
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Использование пула: запросы в работе, пик, открытые и свободные соединения по хостам"""
+        hosts = []
+        pools = self.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts.append({
+                'host': f'{pool.scheme}://{pool.host}:{pool.port}',
+                'connections_created': pool.num_connections,
+                'requests': pool.num_requests,
+                # Очередь пула заполнена заглушками None; считаем только открытые соединения
+                'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None)
+                if pool.pool is not None else 0,
+            })
+
+        with self._stats_lock:
+            return {
+                'pool_connections': self._pool_connections,
+                'pool_maxsize': self._pool_maxsize,
+                'pool_block': self._pool_block,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'utilization': round(self.in_flight / self._pool_maxsize, 3) if self._pool_maxsize else 0,
+                'requests_total': self.requests_total,
+                'errors_total': self.errors_total,
+                'busy_seconds': round(self.busy_seconds, 3),
+                'hosts': hosts,
+            }
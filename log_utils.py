@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple, Union
+
+
+class Excerpt:
+    """Отложенный фрагмент данных для сообщения лога.
+
+    Значение (или результат вызова функции) преобразуется в строку и обрезается
+    только при форматировании записи, то есть если уровень записи включен.
+    """
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value: Union[Any, Callable[[], Any]], limit: int = 500):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        value = self.value() if callable(self.value) else self.value
+        text = value if isinstance(value, str) else repr(value)
+        if len(text) <= self.limit:
+            return text
+        return f'{text[:self.limit]}... ({len(text)} символов)'
+
+
+class ErrorRateLimiter:
+    """Ограничение частоты повторяющихся сообщений по ключу (принтер, операция).
+
+    Первое сообщение по ключу пишется сразу, повторы в течение interval секунд
+    подавляются и подсчитываются; следующее записанное сообщение сообщает,
+    сколько повторов было пропущено.
+    """
+
+    def __init__(self, interval: float = 60.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        # ключ -> (время последней записи, число подавленных повторов)
+        self._state: Dict[Hashable, Tuple[float, int]] = {}
+
+    def acquire(self, key: Hashable) -> Tuple[bool, int]:
+        """(писать ли сообщение, сколько повторов подавлено с прошлой записи)"""
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._state.get(key, (float('-inf'), 0))
+            if self.interval > 0 and now - last < self.interval:
+                self._state[key] = (last, suppressed + 1)
+                return False, suppressed + 1
+            self._state[key] = (now, 0)
+            return True, suppressed
+
+    def reset(self, key: Hashable):
+        """Сброс после успешной операции: следующая ошибка будет записана сразу"""
+        with self._lock:
+            self._state.pop(key, None)
+
+    def log(self, logger: logging.Logger, level: int, key: Hashable, msg: str, *args, **kwargs):
+        """Запись сообщения с ограничением частоты по ключу"""
+        if not logger.isEnabledFor(level):
+            return
+        allowed, suppressed = self.acquire(key)
+        if not allowed:
+            return
+        if suppressed:
+            msg += ' (пропущено повторов: %d)'
+            args = (*args, suppressed)
+        logger.log(level, msg, *args, **kwargs)
+
+
+# Общий ограничитель для ошибок опроса принтеров
+error_limiter = ErrorRateLimiter()
+
+
+def configure_logging(level: str = 'INFO', error_interval: float = 60.0):
+    """Уровень корневого логгера и интервал повторов ошибок из конфигурации"""
+    logging.getLogger().setLevel(getattr(logging, level.upper(), logging.INFO))
+    error_limiter.interval = error_interval
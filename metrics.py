@@ -0,0 +1,209 @@
+import bisect
+import threading
+import logging
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Тип содержимого текстового формата Prometheus
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы корзин гистограмм: задержки (сек) и размеры (байт)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Набор метрик процесса, выводимый в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: List['Metric'] = []
+
+    def register(self, metric: 'Metric'):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+# Метрики приложения регистрируются здесь и выводятся на /metrics
+REGISTRY = MetricsRegistry()
+
+
+class Metric(ABC):
+    """Метрика с метками; значения хранятся в словаре по кортежу значений меток.
+
+    Значения меток передаются позиционно в порядке labelnames, без создания
+    дочерних объектов, поэтому запись - это поиск в словаре под блокировкой.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[MetricsRegistry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in values]
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными корзинами, суммой и числом наблюдений"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Optional[MetricsRegistry] = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики корзин (последняя - +Inf), сумма]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            entry = self._values.get(labels)
+            return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        names = self.labelnames + ('le',)
+        lines = []
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(names, (*labels, _format_value(bound)))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+# Запросы к облаку: длительность каждой попытки и ответы по коду
+# (ErrorCode ответа API, http_<статус> или network при ошибке соединения)
+UPSTREAM_SECONDS = Histogram('sz3dp_upstream_request_seconds',
+                             'Длительность запроса команды к облаку', ('command', 'printer'))
+UPSTREAM_RESPONSES = Counter('sz3dp_upstream_responses_total',
+                             'Ответы облака на команды по коду ошибки', ('command', 'printer', 'code'))
+LOGIN_ATTEMPTS = Counter('sz3dp_login_attempts_total',
+                         'Попытки входа в облако', ('result',))
+# Выключатели команд облака: переходы между состояниями и отклоненные запросы
+CIRCUIT_TRANSITIONS = Counter('sz3dp_circuit_transitions_total',
+                              'Переходы выключателя команды облака', ('command', 'state'))
+CIRCUIT_REJECTIONS = Counter('sz3dp_circuit_rejections_total',
+                             'Запросы, отклоненные разомкнутым выключателем', ('command',))
+
+# Планировщик: задержка запуска задач, пропуски и наложения запусков,
+# задержка опроса принтера относительно его расписания
+SCHEDULER_LAG_SECONDS = Histogram('sz3dp_scheduler_job_lag_seconds',
+                                  'Задержка запуска задачи планировщика', ('job',))
+SCHEDULER_OVERRUNS = Counter('sz3dp_scheduler_job_overruns_total',
+                             'Пропущенные запуски задач планировщика', ('job', 'reason'))
+POLL_LAG_SECONDS = Histogram('sz3dp_poll_lag_seconds',
+                             'Задержка опроса принтера относительно расписания', ('printer',))
+
+SNAPSHOT_BYTES = Histogram('sz3dp_snapshot_bytes', 'Размер полученного снепшота камеры',
+                           ('printer',), buckets=SIZE_BUCKETS)
+# События принтеров (events.py): обнаруженные события и доставка получателям
+EVENTS_TOTAL = Counter('sz3dp_events_total', 'Обнаруженные события принтеров', ('type',))
+EVENT_DELIVERIES = Counter('sz3dp_event_deliveries_total',
+                           'Доставка событий получателям (sent, error, rate_limited)', ('sink', 'result'))
+
+HTTP_SECONDS = Histogram('sz3dp_http_request_seconds',
+                         'Время обработки запроса веб-приложения', ('endpoint',))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = '0.0.0.0',
+                      registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """Отдельный HTTP сервер /metrics для процесса без веб-приложения (опросчика)"""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    logger.info("Метрики доступны по адресу http://%s:%s/metrics", host, server.server_port)
+    return server
@@ -0,0 +1,145 @@
+import json
+import logging
+from typing import Any, Dict, Iterator, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него ответы разбираются модулем json
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Имя используемого декодера JSON (для логов и бенчмарков)
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    """Разбор JSON ответа облака: orjson, если установлен, иначе стандартный json"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def format_time(minutes: float) -> str:
+    """Форматирование времени из минут в читаемый вид"""
+    if minutes <= 0:
+        return "0 мин"
+
+    hours = int(minutes // 60)
+    mins = int(minutes % 60)
+
+    if hours > 0:
+        return f"{hours} ч {mins} мин"
+    else:
+        return f"{mins} мин"
+
+
+def _number(value: Any) -> float:
+    return value if isinstance(value, (int, float)) else 0
+
+
+class PrinterStatus:
+    """Статус принтера из ответа GetPrinterStatus в компактном виде.
+
+    Хранятся только исходные значения из Detail; строковые поля для интерфейса
+    (оставшееся время, состояние корпуса и филамента) вычисляются при обращении.
+    Доступ через get() и [] с прежними ключами словаря статуса, поэтому запись
+    принимают все потребители статуса. Полный ответ облака (raw_data) сохраняется,
+    только если он запрошен при разборе.
+    """
+
+    __slots__ = ('registration_code', 'printer_name', 'printer_type', 'firmware_version', 'measure',
+                 'gcode_name', 'job_status', 'progress', 'estimate_minutes', 'duration',
+                 'extruder_current', 'extruder_target', 'bed_current', 'bed_target',
+                 'door', 'filament', 'raw_data')
+
+    # Ключи словаря статуса в порядке прежнего результата parse_printer_status
+    KEYS = ('model_name', 'progress_percent', 'time_remaining', 'estimate_minutes', 'extruder_temp',
+            'bed_temp', 'enclosure_status', 'filament_status', 'printer_name', 'registration_code',
+            'firmware_version', 'printer_type', 'measure', 'job_status', 'duration')
+    _KEY_SET = frozenset(KEYS)
+
+    def __init__(self, detail: Dict[str, Any], raw_data: Optional[Dict[str, Any]] = None):
+        cur_temps = detail.get('CurTemps') or ()
+        target_temps = detail.get('TargetTemps') or ()
+        self.registration_code = detail.get('RegistrationCode', '')
+        self.printer_name = detail.get('PrinterName', '')
+        self.printer_type = detail.get('PrinterType', '')
+        self.firmware_version = detail.get('FirmwareVersion', '')
+        self.measure = detail.get('Measure', '')
+        self.gcode_name = detail.get('GcodeName', '')
+        self.job_status = detail.get('JobStatus', '')
+        self.progress = _number(detail.get('PrintProgress', 0))
+        self.estimate_minutes = _number(detail.get('EstimateTime', 0))
+        self.duration = _number(detail.get('Duration', 0))
+        self.extruder_current = _number(cur_temps[0]) if cur_temps else 0
+        self.extruder_target = _number(target_temps[0]) if target_temps else 0
+        self.bed_current = _number(detail.get('PlatformCurTemp', 0))
+        self.bed_target = _number(detail.get('PlatformTargetTemp', 0))
+        self.door = detail.get('Door', 0)
+        self.filament = detail.get('Filament', 0)
+        self.raw_data = raw_data
+
+    # Вычисляемые поля
+
+    @property
+    def model_name(self) -> str:
+        return self.gcode_name.replace('.gcode', '')
+
+    @property
+    def progress_percent(self) -> float:
+        # Прогресс печати в процентах, округленный для отображения
+        return round(self.progress * 100, 2)
+
+    @property
+    def time_remaining(self) -> str:
+        return format_time(self.estimate_minutes)
+
+    @property
+    def extruder_temp(self) -> Dict[str, float]:
+        return {'current': self.extruder_current, 'target': self.extruder_target}
+
+    @property
+    def bed_temp(self) -> Dict[str, float]:
+        return {'current': self.bed_current, 'target': self.bed_target}
+
+    @property
+    def enclosure_status(self) -> str:
+        # Door: 0 = закрыт, 1 = открыт
+        return "закрыт" if self.door == 0 else "открыт"
+
+    @property
+    def filament_status(self) -> str:
+        return "нормальный" if self.filament == 0 else "проблема"
+
+    # Совместимость со словарем статуса
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._KEY_SET or (key == 'raw_data' and self.raw_data is not None):
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._KEY_SET or (key == 'raw_data' and self.raw_data is not None):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._KEY_SET or (key == 'raw_data' and self.raw_data is not None)
+
+    def keys(self) -> Iterator[str]:
+        yield from self.KEYS
+        if self.raw_data is not None:
+            yield 'raw_data'
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Статус в виде словаря (формат прежнего parse_printer_status)"""
+        return {key: self[key] for key in self.keys()}
+
+    def __repr__(self) -> str:
+        return f'PrinterStatus({self.registration_code!r}, {self.job_status!r}, {self.progress_percent}%)'
+
+
+def parse_printer_status(api_data: Dict[str, Any], keep_raw: bool = False) -> PrinterStatus:
+    """Парсинг данных статуса принтера из API ответа; keep_raw - сохранить полный ответ"""
+    return PrinterStatus(api_data.get('Detail') or {}, api_data if keep_raw else None)
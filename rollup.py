@@ -0,0 +1,258 @@
+import math
+import os
+import struct
+import threading
+import logging
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from telemetry import TelemetryStore, RecordFile, TELEMETRY_FIELDS, RECORD, safe_code
+
+try:
+    import numpy
+except ImportError:  # numpy входит в зависимости; если он не установлен, агрегаты считаются циклом на Python
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# Разрешения агрегатов: метка -> длина интервала (сек)
+RESOLUTIONS = {'1m': 60, '15m': 900, '1h': 3600}
+
+FIELD_COUNT = len(TELEMETRY_FIELDS)
+
+# Запись агрегата: начало интервала (float64), число замеров (uint32),
+# затем min, max и mean по каждому полю телеметрии (float32)
+ROLLUP_RECORD = struct.Struct('<dI' + 'f' * FIELD_COUNT * 3)
+ROLLUP_MAGIC = b'SZ3DPRLP'
+
+# С какого числа замеров агрегация выполняется через numpy
+NUMPY_MIN_RECORDS = 512
+
+if numpy is not None:
+    RAW_DTYPE = numpy.dtype([
+        ('timestamp', '<f8'),
+        ('values', '<f4', (FIELD_COUNT - 1,)),
+        ('duration', '<u4'),
+    ])
+
+
+class Bucket:
+    """Накапливаемый агрегат одного интервала"""
+
+    __slots__ = ('start', 'count', 'mins', 'maxs', 'sums')
+
+    def __init__(self, start: float):
+        self.start = start
+        self.count = 0
+        self.mins = [math.inf] * FIELD_COUNT
+        self.maxs = [-math.inf] * FIELD_COUNT
+        self.sums = [0.0] * FIELD_COUNT
+
+    def add(self, values: Sequence[float]):
+        self.count += 1
+        for i, value in enumerate(values):
+            if value < self.mins[i]:
+                self.mins[i] = value
+            if value > self.maxs[i]:
+                self.maxs[i] = value
+            self.sums[i] += value
+
+    def summary(self) -> Tuple:
+        """Агрегат в порядке полей ROLLUP_RECORD"""
+        means = [total / self.count for total in self.sums]
+        return (self.start, self.count, *self.mins, *self.maxs, *means)
+
+
+def bucket_start(timestamp: float, resolution: int) -> float:
+    return timestamp - timestamp % resolution
+
+
+def aggregate(block: bytes, resolution: int) -> List[Tuple]:
+    """Агрегаты по интервалам для блока замеров телеметрии (упорядоченных по времени)"""
+    if numpy is not None and len(block) >= NUMPY_MIN_RECORDS * RECORD.size:
+        return _aggregate_numpy(block, resolution)
+
+    summaries = []
+    current: Optional[Bucket] = None
+    for record in RECORD.iter_unpack(block):
+        start = bucket_start(record[0], resolution)
+        if current is None or current.start != start:
+            if current is not None:
+                summaries.append(current.summary())
+            current = Bucket(start)
+        current.add(record[1:])
+    if current is not None:
+        summaries.append(current.summary())
+    return summaries
+
+
+def _aggregate_numpy(block: bytes, resolution: int) -> List[Tuple]:
+    """Векторная агрегация: границы интервалов и reduceat по колонкам"""
+    raw = numpy.frombuffer(block, dtype=RAW_DTYPE, count=len(block) // RECORD.size)
+    values = numpy.column_stack((raw['values'].astype(numpy.float64), raw['duration'].astype(numpy.float64)))
+    starts = raw['timestamp'] - numpy.mod(raw['timestamp'], resolution)
+    index = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(starts)) + 1))
+    counts = numpy.diff(numpy.append(index, len(raw)))
+    mins = numpy.minimum.reduceat(values, index, axis=0)
+    maxs = numpy.maximum.reduceat(values, index, axis=0)
+    means = numpy.add.reduceat(values, index, axis=0) / counts[:, None]
+    return [
+        (start, count, *minimum, *maximum, *mean)
+        for start, count, minimum, maximum, mean in zip(
+            starts[index].tolist(), counts.tolist(), mins.tolist(), maxs.tolist(), means.tolist()
+        )
+    ]
+
+
+class RollupSeries:
+    """Агрегаты одного принтера за интервал: min/max/mean по полям"""
+
+    __slots__ = ('resolution', 'timestamps', 'counts', 'columns')
+
+    def __init__(self, resolution: str, summaries: List[Tuple], fields: Sequence[str]):
+        self.resolution = resolution
+        self.timestamps = [summary[0] for summary in summaries]
+        self.counts = [summary[1] for summary in summaries]
+        self.columns: Dict[str, Dict[str, List[float]]] = {}
+        for field in fields:
+            index = TELEMETRY_FIELDS.index(field)
+            self.columns[field] = {
+                'min': [summary[2 + index] for summary in summaries],
+                'max': [summary[2 + FIELD_COUNT + index] for summary in summaries],
+                'mean': [summary[2 + 2 * FIELD_COUNT + index] for summary in summaries],
+            }
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def to_dict(self, precision: int = 3) -> Dict[str, Any]:
+        return {
+            'count': len(self.timestamps),
+            'timestamps': self.timestamps,
+            'samples': self.counts,
+            'values': {field: {name: [round(value, precision) for value in values]
+                               for name, values in stats.items()}
+                       for field, stats in self.columns.items()},
+        }
+
+
+class RollupStore:
+    """Агрегаты телеметрии с шагом 1 мин, 15 мин и 1 ч.
+
+    Агрегаты считаются инкрементально по мере записи замеров: закрытый интервал
+    дописывается в файл <код>.<метка>.rlp рядом с файлом телеметрии. Текущий
+    незакрытый интервал при чтении досчитывается по сырым замерам, поэтому
+    чтение одинаково работает в опросчике и в веб-воркерах.
+    """
+
+    def __init__(self, telemetry: TelemetryStore, resolutions: Optional[Dict[str, int]] = None):
+        self.telemetry = telemetry
+        self.resolutions = dict(resolutions or RESOLUTIONS)
+        self._lock = threading.Lock()
+        self._open: Dict[str, Dict[str, Optional[Bucket]]] = {}
+
+    def file(self, registration_code: str, label: str) -> RecordFile:
+        path = os.path.join(self.telemetry.directory, f'{safe_code(registration_code)}.{label}.rlp')
+        return RecordFile(path, ROLLUP_RECORD, ROLLUP_MAGIC)
+
+    def add_sample(self, registration_code: str, timestamp: float, values: Sequence[float]):
+        """Обработчик новых замеров телеметрии"""
+        with self._lock:
+            if registration_code not in self._open:
+                # Первый замер после запуска: догоняем агрегаты по сырым замерам,
+                # среди которых уже есть и этот
+                self._catch_up(registration_code)
+                return
+            self._add(registration_code, timestamp, values)
+
+    def _add(self, registration_code: str, timestamp: float, values: Sequence[float],
+             resume_from: Optional[Dict[str, float]] = None):
+        buckets = self._open[registration_code]
+        for label, resolution in self.resolutions.items():
+            if resume_from is not None and timestamp < resume_from[label]:
+                continue
+            start = bucket_start(timestamp, resolution)
+            bucket = buckets.get(label)
+            if bucket is not None and bucket.start != start:
+                self.file(registration_code, label).append(ROLLUP_RECORD.pack(*bucket.summary()))
+                bucket = None
+            if bucket is None:
+                bucket = buckets[label] = Bucket(start)
+            bucket.add(values)
+
+    def _catch_up(self, registration_code: str):
+        resume_from = {}
+        for label, resolution in self.resolutions.items():
+            last = self.file(registration_code, label).last_timestamp()
+            resume_from[label] = last + resolution if last is not None else -math.inf
+
+        self._open[registration_code] = {label: None for label in self.resolutions}
+        block = self.telemetry.read_block(registration_code, min(resume_from.values()), math.inf)
+        for record in RECORD.iter_unpack(block):
+            self._add(registration_code, record[0], record[1:], resume_from)
+
+    def rebuild(self, registration_code: str) -> Dict[str, int]:
+        """Полный пересчет агрегатов принтера по сырым замерам, возвращает число интервалов"""
+        block = self.telemetry.read_block(registration_code, -math.inf, math.inf)
+        counts = {}
+        with self._lock:
+            for label, resolution in self.resolutions.items():
+                summaries = aggregate(block, resolution)
+                # Последний интервал может быть незакрытым - он досчитывается при чтении
+                closed = summaries[:-1]
+                record_file = self.file(registration_code, label)
+                record_file.remove()
+                if closed:
+                    record_file.append(b''.join(ROLLUP_RECORD.pack(*summary) for summary in closed))
+                counts[label] = len(closed)
+            self._open.pop(registration_code, None)
+        return counts
+
+    def read(self, registration_code: str, label: str, start: float, end: float,
+             fields: Optional[Sequence[str]] = None) -> RollupSeries:
+        """Агрегаты с разрешением label для интервалов, пересекающих [start, end]"""
+        resolution = self.resolutions[label]
+        first_bucket = bucket_start(start, resolution)
+        record_file = self.file(registration_code, label)
+        summaries = list(ROLLUP_RECORD.iter_unpack(record_file.read_range(first_bucket, end)))
+
+        # Интервалы после последнего записанного считаем по сырым замерам
+        last = record_file.last_timestamp()
+        tail_from = max(first_bucket, last + resolution if last is not None else first_bucket)
+        if tail_from <= end:
+            summaries.extend(aggregate(self.telemetry.read_block(registration_code, tail_from, end), resolution))
+        return RollupSeries(label, summaries, fields or TELEMETRY_FIELDS)
+
+    def choose_resolution(self, registration_code: str, start: float, end: float, max_points: int) -> str:
+        """Самое подробное разрешение, укладывающееся в бюджет точек: raw или метка агрегата"""
+        if self.telemetry.count(registration_code, start, end) <= max_points:
+            return 'raw'
+        span = max(end - start, 0)
+        ordered = sorted(self.resolutions.items(), key=lambda item: item[1])
+        for label, resolution in ordered:
+            if span / resolution <= max_points:
+                return label
+        return ordered[-1][0]
+
+
+def main():
+    """Пересчет агрегатов всех принтеров: python rollup.py --rebuild [каталог]"""
+    import argparse
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Агрегаты истории телеметрии")
+    parser.add_argument('--rebuild', action='store_true', help="пересчитать агрегаты по сырым замерам")
+    parser.add_argument('directory', nargs='?', default=Config.TELEMETRY_DIR)
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    rollups = RollupStore(TelemetryStore(args.directory))
+    for name in sorted(os.listdir(args.directory)):
+        if name.endswith('.tlm'):
+            code = name[:-len('.tlm')]
+            print(f"{code}: {rollups.rebuild(code)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,46 +5,107 @@
 
 import sys
 import os
+import argparse
+import threading
 
 # Добавляем текущую директорию в путь Python
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, update_printer_data, scheduler
-import logging
+from config import Config
+from server import GUNICORN_AVAILABLE, GunicornApplication, gunicorn_options, poll_in_worker
+
+def parse_args():
+    """Аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="Мониторинг 3D принтеров SZ3DP")
+    parser.add_argument(
+        '--mode', choices=['all', 'web', 'poller'], default='all',
+        help="all - веб-интерфейс и опрос в одном процессе; web - только веб-интерфейс "
+             "(состояние из общего хранилища); poller - только опрос облака"
+    )
+    parser.add_argument(
+        '--server', choices=['dev', 'production'], default=Config.SERVER,
+        help="dev - встроенный сервер Flask; production - gunicorn (настройки SERVER_*)"
+    )
+    return parser.parse_args()
+
+def run_poller():
+    """Опрос облака без веб-сервера: состояние пишется в общее хранилище"""
+    from app import app, start_polling, state_store
+    from metrics import start_http_server
+    if not state_store.shared:
+        print("Внимание: STATE_BACKEND=memory, веб-воркеры не увидят состояние опросчика")
+    stop = threading.Event()
+    if app.config['METRICS_PORT']:
+        start_http_server(app.config['METRICS_PORT'])
+        print(f"Метрики: http://localhost:{app.config['METRICS_PORT']}/metrics")
+    print("Первоначальная загрузка данных...")
+    start_polling()
+    print("Опросчик запущен (адаптивный интервал опроса по состоянию принтеров)")
+    stop.wait()
+
+def run_production(mode):
+    """gunicorn: приложение загружается в воркерах, в режиме all опрос идет в единственном воркере"""
+    options = gunicorn_options(Config)
+    if mode == 'all' and options['workers'] > 1:
+        print("Внимание: в режиме all облако опрашивает один воркер, SERVER_WORKERS игнорируется; "
+              "для нескольких воркеров используйте --mode web и отдельный опросчик")
+        options['workers'] = 1
+    print(f"gunicorn: {options['workers']} воркер(ов) {options['worker_class']}")
+    GunicornApplication(options, poll_in_worker if mode == 'all' else None).run()
+
+def run_dev(mode):
+    """Встроенный сервер Flask"""
+    from app import app, start_polling
+    if mode == 'all':
+        # Первоначальное обновление данных и запуск планировщика
+        print("Первоначальная загрузка данных...")
+        start_polling()
+        print("Планировщик задач запущен (адаптивный интервал опроса по состоянию принтеров)")
+    
+    # Запуск Flask приложения
+    app.run(
+        host=Config.SERVER_HOST,
+        port=Config.SERVER_PORT,
+        debug=False,
+        use_reloader=False,
+        threaded=True
+    )
 
 def main():
     """Главная функция запуска"""
+    args = parse_args()
+    server = args.server
+    if server == 'production' and not GUNICORN_AVAILABLE:
+        print("gunicorn не установлен, используется встроенный сервер Flask")
+        server = 'dev'
     print("=" * 50)
     print("3D Принтер - Мониторинг статуса")
     print("=" * 50)
-    print("Запуск приложения...")
-    print("Веб-интерфейс будет доступен по адресу: http://localhost:5000")
+    print(f"Запуск приложения (режим: {args.mode}, сервер: {server})...")
+    if args.mode != 'poller':
+        print(f"Веб-интерфейс будет доступен по адресу: http://localhost:{Config.SERVER_PORT}")
     print("Нажмите Ctrl+C для остановки")
     print("=" * 50)
     
+    if server == 'production' and args.mode != 'poller':
+        # Приложение работает в воркерах gunicorn и останавливается ими (хук worker_exit)
+        run_production(args.mode)
+        return
+    
     try:
-        # Первоначальное обновление данных
-        print("Первоначальная загрузка данных...")
-        update_printer_data()
-        
-        # Запуск планировщика
-        scheduler.start()
-        print("Планировщик задач запущен (обновление каждые 30 секунд)")
-        
-        # Запуск Flask приложения
-        app.run(
-            host='0.0.0.0',
-            port=5000,
-            debug=False,
-            use_reloader=False
-        )
+        if args.mode == 'poller':
+            run_poller()
+        else:
+            run_dev(args.mode)
         
     except KeyboardInterrupt:
         print("\nОстановка приложения...")
     except Exception as e:
         print(f"Ошибка при запуске: {e}")
     finally:
-        scheduler.shutdown()
+        app_module = sys.modules.get('app')
+        if app_module is not None:
+            app_module.shutdown()
         print("Приложение остановлено")
 
 if __name__ == "__main__":
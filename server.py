@@ -0,0 +1,72 @@
+import sys
+import logging
+from importlib.util import find_spec
+from typing import Any, Callable, Dict, Optional
+
+try:
+    from gunicorn.app.base import BaseApplication
+    GUNICORN_AVAILABLE = True
+except ImportError:  # gunicorn необязателен (не работает под Windows): без него - сервер Flask
+    BaseApplication = object
+    GUNICORN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_worker_class(name: str) -> str:
+    """Класс воркеров gunicorn: auto - gevent, если установлен, иначе gthread"""
+    if name == 'auto':
+        return 'gevent' if find_spec('gevent') is not None else 'gthread'
+    return name
+
+
+def gunicorn_options(config, workers: Optional[int] = None) -> Dict[str, Any]:
+    """Настройки gunicorn из класса Config"""
+    return {
+        'bind': f'{config.SERVER_HOST}:{config.SERVER_PORT}',
+        'workers': workers or config.SERVER_WORKERS,
+        'worker_class': resolve_worker_class(config.SERVER_WORKER_CLASS),
+        'threads': config.SERVER_THREADS,
+        'worker_connections': config.SERVER_WORKER_CONNECTIONS,
+        'timeout': config.SERVER_TIMEOUT,
+        'keepalive': config.SERVER_KEEPALIVE,
+        # Открытые потоки SSE не закрываются сами, поэтому остановка воркера не ждет их долго
+        'graceful_timeout': 5,
+        # Приложение загружается в воркере: gevent подменяет модули до импорта app,
+        # а потоки приложения (рассылка событий, наблюдатель хранилища) создаются после fork
+        'preload_app': False,
+    }
+
+
+def poll_in_worker(worker):
+    """Хук post_worker_init режима all: опрос облака в единственном воркере"""
+    from app import start_polling
+    start_polling()
+    logger.info("Опрос облака запущен в воркере %s", worker.pid)
+
+
+def shutdown_worker(server, worker):
+    """Хук worker_exit: остановка планировщика, потоков SSE и хранилища воркера"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.shutdown()
+
+
+class GunicornApplication(BaseApplication):
+    """gunicorn, запускаемый из run.py: настройки из Config, приложение app:app"""
+
+    def __init__(self, options: Dict[str, Any], post_worker_init: Optional[Callable] = None):
+        self.options = options
+        self.post_worker_init = post_worker_init
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set('worker_exit', shutdown_worker)
+        if self.post_worker_init is not None:
+            self.cfg.set('post_worker_init', self.post_worker_init)
+
+    def load(self):
+        from app import app
+        return app
@@ -0,0 +1,66 @@
+import json
+import os
+import time
+import logging
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCache:
+    """Файловый кеш авторизованной сессии: cookies и сработавший способ входа.
+
+    Позволяет после перезапуска процесса продолжить работу с прежней сессией
+    без повторной авторизации, пока не истек срок ttl или облако не отклонило запрос.
+    """
+
+    def __init__(self, path: str, ttl: float = 12 * 3600):
+        self.path = path
+        self.ttl = ttl
+
+    def load(self, base_url: str, email: str) -> Optional[Dict[str, Any]]:
+        """Загрузка сохраненной сессии для данного сервера и пользователя"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Не удалось прочитать кеш сессии %s: %s", self.path, e)
+            return None
+
+        if entry.get('base_url') != base_url or entry.get('email') != email:
+            return None
+        if entry.get('expires_at', 0) <= time.time():
+            logger.info("Сохраненная сессия истекла")
+            return None
+        return entry
+
+    def save(self, base_url: str, email: str, cookies: List[Dict[str, Any]], login_method: str):
+        """Сохранение cookies сессии и способа входа со сроком действия"""
+        entry = {
+            'base_url': base_url,
+            'email': email,
+            'login_method': login_method,
+            'cookies': cookies,
+            'saved_at': time.time(),
+            'expires_at': time.time() + self.ttl,
+        }
+        tmp_path = f'{self.path}.tmp'
+        try:
+            # Файл содержит cookies сессии - доступ только владельцу
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Не удалось сохранить кеш сессии %s: %s", self.path, e)
+
+    def clear(self):
+        """Удаление сохраненной сессии"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Не удалось удалить кеш сессии %s: %s", self.path, e)
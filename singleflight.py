@@ -0,0 +1,118 @@
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Источник результата: свежий кеш, чужой запрос в работе или собственный запрос
+SOURCE_CACHE = 'cache'
+SOURCE_SHARED = 'shared'
+SOURCE_FETCHED = 'fetched'
+
+
+class _Call:
+    """Выполняющийся запрос по одному ключу"""
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Объединение одновременных запросов к облаку по ключу (принтер + ресурс).
+
+    Пока запрос по ключу выполняется, повторные вызовы ждут его результата
+    вместо нового обращения к облаку. Успешный результат запоминается, и вызов
+    с min_age получает его сразу, если он моложе min_age секунд.
+    """
+
+    def __init__(self, name: str = ''):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._results: Dict[Hashable, Tuple[float, Any]] = {}
+        self.counters = {SOURCE_CACHE: 0, SOURCE_SHARED: 0, SOURCE_FETCHED: 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], min_age: float = 0.0,
+           timeout: Optional[float] = None) -> Tuple[Any, str]:
+        """Результат fn() для ключа и его источник"""
+        return self.do_many([key], lambda keys: {key: fn()}, min_age, timeout)[key]
+
+    def do_many(self, keys: Iterable[Hashable], fetch: Callable[[List[Hashable]], Dict[Hashable, Any]],
+                min_age: float = 0.0, timeout: Optional[float] = None) -> Dict[Hashable, Tuple[Any, str]]:
+        """Пакетный вариант: fetch(ключи) вызывается только для ключей без свежего
+        результата и без запроса в работе; возвращает {ключ: (результат, источник)}.
+
+        Ожидание чужого запроса ограничено timeout; по его истечении возникает TimeoutError.
+        """
+        now = time.time()
+        results: Dict[Hashable, Tuple[Any, str]] = {}
+        waiting: Dict[Hashable, _Call] = {}
+        leading: Dict[Hashable, _Call] = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                cached = self._results.get(key)
+                if min_age > 0 and cached is not None and now - cached[0] < min_age:
+                    results[key] = (cached[1], SOURCE_CACHE)
+                elif key in self._calls:
+                    waiting[key] = self._calls[key]
+                else:
+                    leading[key] = self._calls[key] = _Call()
+            self.counters[SOURCE_CACHE] += len(results)
+            self.counters[SOURCE_SHARED] += len(waiting)
+            self.counters[SOURCE_FETCHED] += len(leading)
+
+        if leading:
+            self._lead(leading, fetch)
+            for key, call in leading.items():
+                if call.error is not None:
+                    raise call.error
+                results[key] = (call.result, SOURCE_FETCHED)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for key, call in waiting.items():
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not call.event.wait(remaining):
+                raise TimeoutError(f"Запрос {self.name} {key} не завершился за {timeout} с")
+            if call.error is not None:
+                raise call.error
+            results[key] = (call.result, SOURCE_SHARED)
+        return results
+
+    def _lead(self, calls: Dict[Hashable, _Call], fetch: Callable[[List[Hashable]], Dict[Hashable, Any]]):
+        error: Optional[BaseException] = None
+        fetched: Dict[Hashable, Any] = {}
+        try:
+            fetched = fetch(list(calls))
+        except BaseException as e:
+            error = e
+
+        finished = time.time()
+        with self._lock:
+            for key, call in calls.items():
+                call.error = error
+                call.result = fetched.get(key)
+                # Запоминаем только успешные результаты, неудачный запрос можно повторить сразу
+                if error is None and call.result is not None:
+                    self._results[key] = (finished, call.result)
+                del self._calls[key]
+        for call in calls.values():
+            call.event.set()
+
+    def age(self, key: Hashable) -> Optional[float]:
+        """Возраст последнего успешного результата (сек) или None"""
+        with self._lock:
+            cached = self._results.get(key)
+        return time.time() - cached[0] if cached else None
+
+    def forget(self, key: Hashable):
+        with self._lock:
+            self._results.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'in_flight': len(self._calls), **self.counters}
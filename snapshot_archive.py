@@ -0,0 +1,183 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+import zipfile
+import logging
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+
+from telemetry import RecordFile, safe_code
+
+logger = logging.getLogger(__name__)
+
+# Запись индекса архива: время кадра (float64) и sha256 содержимого
+INDEX_RECORD = struct.Struct('<d32s')
+INDEX_MAGIC = b'SZ3DPARC'
+
+MJPEG_BOUNDARY = 'frame'
+
+
+class _StreamBuffer:
+    """Приемник для zipfile без seek: накопленные байты забираются генератором"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class SnapshotArchive:
+    """Архив снепшотов камер с адресацией по содержимому.
+
+    Кадр хранится один раз в objects/<sha256[:2]>/<sha256>.jpg независимо от того,
+    сколько раз и на каких принтерах он встречался. Для каждого принтера ведется
+    индекс index/<код>.idx из записей (время, sha256); кадр, совпадающий с
+    предыдущим кадром принтера (простаивающий принтер), в индекс не добавляется.
+    """
+
+    def __init__(self, directory: str, retention_days: float = 7.0):
+        self.directory = directory
+        self.retention = retention_days * 24 * 3600
+        self._lock = threading.Lock()
+        # Время и sha256 последнего кадра в индексе каждого принтера
+        self._last: Dict[str, Tuple[float, bytes]] = {}
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'index'), exist_ok=True)
+
+    def _object_path(self, digest: bytes) -> str:
+        name = digest.hex()
+        return os.path.join(self.directory, 'objects', name[:2], f'{name}.jpg')
+
+    def _index(self, registration_code: str) -> RecordFile:
+        path = os.path.join(self.directory, 'index', f'{safe_code(registration_code)}.idx')
+        return RecordFile(path, INDEX_RECORD, INDEX_MAGIC)
+
+    def add(self, registration_code: str, data: bytes, timestamp: Optional[float] = None) -> bool:
+        """Архивирование кадра; возвращает False, если кадр совпадает с предыдущим"""
+        timestamp = time.time() if timestamp is None else timestamp
+        digest = hashlib.sha256(data).digest()
+        index = self._index(registration_code)
+        with self._lock:
+            last = self._last.get(registration_code)
+            if last is None:
+                record = index.last_record()
+                last = INDEX_RECORD.unpack(record) if record else (float('-inf'), b'')
+            last_timestamp, last_digest = last
+            if digest == last_digest or timestamp <= last_timestamp:
+                return False
+
+            path = self._object_path(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f'{path}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            index.append(INDEX_RECORD.pack(timestamp, digest))
+            self._last[registration_code] = (timestamp, digest)
+            return True
+
+    def frames(self, registration_code: str, start: float, end: float) -> List[Tuple[float, bytes]]:
+        """Записи индекса (время, sha256) за интервал"""
+        block = self._index(registration_code).read_range(start, end)
+        return list(INDEX_RECORD.iter_unpack(block))
+
+    def read_frame(self, digest: bytes) -> Optional[bytes]:
+        try:
+            with open(self._object_path(digest), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            # Объект мог быть удален очисткой между чтением индекса и кадра
+            return None
+
+    def iter_mjpeg(self, registration_code: str, start: float, end: float, fps: float = 10.0) -> Iterator[bytes]:
+        """Таймлапс в виде потока multipart/x-mixed-replace; кадры читаются с диска по одному"""
+        delay = 1.0 / fps if fps > 0 else 0
+        for _, digest in self.frames(registration_code, start, end):
+            data = self.read_frame(digest)
+            if data is None:
+                continue
+            yield (f'--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\n'
+                   f'Content-Length: {len(data)}\r\n\r\n').encode() + data + b'\r\n'
+            if delay:
+                time.sleep(delay)
+
+    def iter_zip(self, registration_code: str, start: float, end: float) -> Iterator[bytes]:
+        """Таймлапс в виде zip архива, формируемого на лету без загрузки всех кадров"""
+        buffer = _StreamBuffer()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for number, (timestamp, digest) in enumerate(self.frames(registration_code, start, end)):
+                data = self.read_frame(digest)
+                if data is None:
+                    continue
+                moment = datetime.fromtimestamp(timestamp)
+                info = zipfile.ZipInfo(f'{number:06d}_{moment:%Y%m%d_%H%M%S}.jpg', moment.timetuple()[:6])
+                archive.writestr(info, data)
+                yield buffer.take()
+        yield buffer.take()
+
+    def prune(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Удаление записей индекса старше срока хранения и объектов без ссылок"""
+        cutoff = (time.time() if now is None else now) - self.retention
+        index_dir = os.path.join(self.directory, 'index')
+        removed_entries = 0
+        removed_objects = 0
+        with self._lock:
+            referenced: Set[bytes] = set()
+            for name in os.listdir(index_dir):
+                if not name.endswith('.idx'):
+                    continue
+                index = RecordFile(os.path.join(index_dir, name), INDEX_RECORD, INDEX_MAGIC)
+                removed_entries += index.truncate_before(cutoff)
+                referenced.update(digest for _, digest in INDEX_RECORD.iter_unpack(
+                    index.read_range(cutoff, float('inf'))))
+            # Последний кадр принтера мог быть удален: следующий такой же кадр снова попадает в архив
+            for code, (timestamp, _) in list(self._last.items()):
+                if timestamp < cutoff:
+                    del self._last[code]
+
+            objects_dir = os.path.join(self.directory, 'objects')
+            for prefix in os.listdir(objects_dir):
+                prefix_dir = os.path.join(objects_dir, prefix)
+                for name in os.listdir(prefix_dir):
+                    try:
+                        digest = bytes.fromhex(name.split('.', 1)[0])
+                    except ValueError:
+                        continue
+                    if digest not in referenced:
+                        os.remove(os.path.join(prefix_dir, name))
+                        removed_objects += 1
+
+        if removed_entries or removed_objects:
+            logger.info("Очистка архива снепшотов: записей %s, кадров %s", removed_entries, removed_objects)
+        return {'entries': removed_entries, 'objects': removed_objects}
+
+    def stats(self, registration_code: str) -> Dict[str, Any]:
+        """Число кадров в индексе принтера, уникальных кадров и их объем"""
+        entries = self.frames(registration_code, float('-inf'), float('inf'))
+        digests = {digest for _, digest in entries}
+        size = 0
+        for digest in digests:
+            try:
+                size += os.path.getsize(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+        return {
+            'frames': len(entries),
+            'unique_frames': len(digests),
+            'bytes': size,
+            'first': entries[0][0] if entries else None,
+            'last': entries[-1][0] if entries else None,
+        }
@@ -0,0 +1,146 @@
+import base64
+import binascii
+import hashlib
+import io
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow необязателен: без него отдаются только исходные кадры
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Варианты снепшота по умолчанию: имя -> наибольшая сторона (пикселей)
+VARIANT_SIZES = {'thumb': 160, 'medium': 640}
+
+
+class SnapshotFrame:
+    """Декодированный JPEG снепшот камеры с метаданными для HTTP кеширования"""
+
+    __slots__ = ('data', 'etag', 'updated_at')
+
+    def __init__(self, data: bytes, etag: str, updated_at: float):
+        self.data = data
+        self.etag = etag
+        self.updated_at = updated_at
+
+    @property
+    def last_modified(self) -> datetime:
+        return datetime.fromtimestamp(int(self.updated_at), tz=timezone.utc)
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+def decode_snapshot(snapshot_data: str) -> Optional[bytes]:
+    """Декодирование base64 снепшота из ответа GetPrinterSnapshot"""
+    if snapshot_data.startswith('data:'):
+        # Формат data URI: data:image/jpeg;base64,....
+        snapshot_data = snapshot_data.split(',', 1)[-1]
+    try:
+        return base64.b64decode(snapshot_data, validate=False)
+    except (binascii.Error, ValueError) as e:
+        logger.error("Ошибка декодирования снепшота: %s", e)
+        return None
+
+
+def parse_variant_sizes(value: str) -> Dict[str, int]:
+    """Разбор настройки вида 'thumb:160,medium:640'"""
+    sizes = {}
+    for item in value.split(','):
+        name, _, size = item.strip().partition(':')
+        if name and size.strip().isdigit():
+            sizes[name] = int(size)
+    return sizes
+
+
+def render_variants(data: bytes, sizes: Dict[str, int], quality: int = 70) -> Dict[str, bytes]:
+    """Уменьшенные и пережатые JPEG варианты кадра.
+
+    Вариант, который не меньше исходного кадра, не создается: по его имени
+    отдается исходный кадр.
+    """
+    if Image is None or not sizes:
+        return {}
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            variants = {}
+            for name, size in sorted(sizes.items(), key=lambda item: item[1]):
+                if max(image.size) <= size:
+                    continue
+                resized = image.copy()
+                resized.thumbnail((size, size), Image.LANCZOS)
+                output = io.BytesIO()
+                resized.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+                if output.tell() < len(data):
+                    variants[name] = output.getvalue()
+            return variants
+    except Exception as e:
+        logger.error("Ошибка подготовки вариантов снепшота: %s", e)
+        return {}
+
+
+class SnapshotStore:
+    """Последние снепшоты камер по принтерам, декодированные один раз на сервере.
+
+    Кадры хранятся в StateStore, поэтому при общем хранилище снепшот, полученный
+    процессом-опросчиком, отдают все веб-воркеры. Уменьшенные варианты (миниатюра,
+    средний размер) готовятся один раз при получении нового кадра и хранятся вместе с ним.
+    """
+
+    def __init__(self, store=None, variant_sizes: Optional[Dict[str, int]] = None, quality: int = 70):
+        if store is None:
+            from state_store import MemoryStateStore
+            store = MemoryStateStore()
+        self.store = store
+        self.variant_sizes = dict(VARIANT_SIZES if variant_sizes is None else variant_sizes)
+        self.quality = quality
+        self._lock = threading.Lock()
+
+    def put(self, registration_code: str, snapshot_data: str) -> Optional[SnapshotFrame]:
+        """Сохранение base64 снепшота; повторный одинаковый кадр не меняет ETag и время"""
+        data = decode_snapshot(snapshot_data)
+        if not data:
+            return None
+
+        etag = hashlib.sha256(data).hexdigest()[:16]
+        frame = self.store.get_snapshot(registration_code)
+        if frame is not None and frame.etag == etag:
+            return frame
+        # Варианты готовятся без блокировки: подготовка кадра одного принтера не
+        # задерживает снепшоты остальных, под блокировкой кадр только заменяется
+        variants = render_variants(data, self.variant_sizes, self.quality)
+        with self._lock:
+            frame = self.store.get_snapshot(registration_code)
+            if frame is not None and frame.etag == etag:
+                return frame
+            frame = SnapshotFrame(data, etag, time.time())
+            self.store.put_snapshot(registration_code, frame, variants)
+            return frame
+
+    def get(self, registration_code: str, size: Optional[str] = None) -> Optional[SnapshotFrame]:
+        """Кадр принтера; для size - его вариант, а если варианта нет, исходный кадр"""
+        if size:
+            frame = self.store.get_snapshot_variant(registration_code, size)
+            if frame is not None:
+                return frame
+        return self.store.get_snapshot(registration_code)
+
+    def evict(self, registration_code: str) -> bool:
+        """Освобождение кадра принтера, который никто не смотрит"""
+        with self._lock:
+            return self.store.delete_snapshot(registration_code)
+
+
+def snapshot_url(registration_code: str, frame: SnapshotFrame) -> str:
+    """URL бинарного снепшота; версия в запросе меняется вместе с кадром"""
+    return f'/api/camera/{registration_code}/snapshot.jpg?v={frame.etag}'
@@ -0,0 +1,560 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Callable, Iterator
+
+from snapshots import SnapshotFrame
+
+logger = logging.getLogger(__name__)
+
+# Изменения одной версии: (код принтера, {поле: значение}, версия)
+ChangeSet = Tuple[str, Dict[str, Any], int]
+
+_MISSING = object()
+
+
+class StateStore(ABC):
+    """Хранилище состояния парка: записи принтеров с версиями полей и снепшоты камер.
+
+    Версия состояния растет при каждом изменении; для каждого поля хранится версия,
+    в которой оно изменилось последний раз, что позволяет отдавать дельты.
+    """
+
+    # Разделяется ли состояние между процессами (веб-воркеры и отдельный опросчик)
+    shared = False
+
+    @abstractmethod
+    def add_printer(self, registration_code: str, record: Dict[str, Any]):
+        """Добавление принтера с начальной записью, если его еще нет"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def codes(self) -> List[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, registration_code: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, registration_code: str, fields: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+        """Запись полей; возвращает реально изменившиеся поля и новую версию"""
+        raise NotImplementedError
+
+    @property
+    @abstractmethod
+    def version(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def printer_version(self, registration_code: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def changes_since(self, registration_code: str, since: int) -> Dict[str, Any]:
+        """Поля принтера, изменившиеся после версии since"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def changes_after(self, since: int) -> List[ChangeSet]:
+        """Все изменения после версии since, сгруппированные по принтеру и версии"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_snapshot(self, registration_code: str, frame: SnapshotFrame,
+                     variants: Optional[Dict[str, bytes]] = None):
+        """Сохранение кадра вместе с его уменьшенными вариантами (заменяет прежние)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_watch(self, registration_code: str, until: float):
+        """Отметка о том, что камеру принтера смотрят до момента until (без версии)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def watch_until(self, registration_code: str) -> float:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_snapshot(self, registration_code: str) -> Optional[SnapshotFrame]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_snapshot_variant(self, registration_code: str, size: str) -> Optional[SnapshotFrame]:
+        """Вариант кадра размера size (ETag и время - от исходного кадра) или None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_snapshot(self, registration_code: str) -> bool:
+        """Удаление кадра принтера и его вариантов; возвращает False, если кадра не было"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def request_refresh(self, registration_code: str, action: str):
+        """Запрос обновления у опрашивающего процесса (повторный запрос того же не копится)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def take_refresh_requests(self) -> List[Tuple[str, str]]:
+        """Накопленные запросы обновления (код, действие); возвращенные запросы удаляются"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_event(self, event: Dict[str, Any], keep: int):
+        """Запись события принтера (Event.to_dict()); хранятся последние keep событий"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def recent_events(self, limit: int, registration_code: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Последние события (всех принтеров или одного), новые первыми"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """Состояние в памяти процесса (один процесс с веб-сервером и опросчиком)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._field_versions: Dict[str, Dict[str, int]] = {}
+        self._snapshots: Dict[str, SnapshotFrame] = {}
+        self._variants: Dict[str, Dict[str, bytes]] = {}
+        self._watches: Dict[str, float] = {}
+        self._events: List[Dict[str, Any]] = []
+        self._refresh_requests: Dict[Tuple[str, str], None] = {}
+        self._version = 0
+
+    def add_printer(self, registration_code: str, record: Dict[str, Any]):
+        with self._lock:
+            if registration_code not in self._records:
+                self._records[registration_code] = dict(record)
+                self._field_versions[registration_code] = {}
+                self._version += 1
+
+    def codes(self) -> List[str]:
+        with self._lock:
+            return list(self._records)
+
+    def get(self, registration_code: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._records.get(registration_code)
+            return dict(record) if record is not None else None
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {code: dict(record) for code, record in self._records.items()}
+
+    def update(self, registration_code: str, fields: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+        with self._lock:
+            record = self._records.get(registration_code)
+            if record is None:
+                return {}, self._version
+            changes = {key: value for key, value in fields.items() if record.get(key, _MISSING) != value}
+            if not changes:
+                return {}, self._version
+            record.update(changes)
+            self._version += 1
+            field_versions = self._field_versions[registration_code]
+            for key in changes:
+                field_versions[key] = self._version
+            return changes, self._version
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            return self._version
+
+    def printer_version(self, registration_code: str) -> int:
+        with self._lock:
+            return max(self._field_versions.get(registration_code, {}).values(), default=0)
+
+    def changes_since(self, registration_code: str, since: int) -> Dict[str, Any]:
+        with self._lock:
+            record = self._records.get(registration_code, {})
+            field_versions = self._field_versions.get(registration_code, {})
+            return {key: record[key] for key, version in field_versions.items()
+                    if version > since and key in record}
+
+    def changes_after(self, since: int) -> List[ChangeSet]:
+        grouped: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        with self._lock:
+            for code, field_versions in self._field_versions.items():
+                record = self._records[code]
+                for key, version in field_versions.items():
+                    if version > since:
+                        grouped.setdefault((code, version), {})[key] = record[key]
+        return [(code, changes, version) for (code, version), changes in sorted(grouped.items(), key=lambda i: i[0][1])]
+
+    def put_snapshot(self, registration_code: str, frame: SnapshotFrame,
+                     variants: Optional[Dict[str, bytes]] = None):
+        with self._lock:
+            self._snapshots[registration_code] = frame
+            self._variants[registration_code] = dict(variants or {})
+
+    def get_snapshot(self, registration_code: str) -> Optional[SnapshotFrame]:
+        with self._lock:
+            return self._snapshots.get(registration_code)
+
+    def get_snapshot_variant(self, registration_code: str, size: str) -> Optional[SnapshotFrame]:
+        with self._lock:
+            frame = self._snapshots.get(registration_code)
+            data = self._variants.get(registration_code, {}).get(size)
+        if frame is None or data is None:
+            return None
+        return SnapshotFrame(data, f'{frame.etag}-{size}', frame.updated_at)
+
+    def delete_snapshot(self, registration_code: str) -> bool:
+        with self._lock:
+            self._variants.pop(registration_code, None)
+            return self._snapshots.pop(registration_code, None) is not None
+
+    def set_watch(self, registration_code: str, until: float):
+        with self._lock:
+            self._watches[registration_code] = max(until, self._watches.get(registration_code, 0.0))
+
+    def watch_until(self, registration_code: str) -> float:
+        with self._lock:
+            return self._watches.get(registration_code, 0.0)
+
+    def request_refresh(self, registration_code: str, action: str):
+        with self._lock:
+            self._refresh_requests[(registration_code, action)] = None
+
+    def take_refresh_requests(self) -> List[Tuple[str, str]]:
+        with self._lock:
+            requests = list(self._refresh_requests)
+            self._refresh_requests.clear()
+        return requests
+
+    def add_event(self, event: Dict[str, Any], keep: int):
+        with self._lock:
+            self._events.append(event)
+            del self._events[:-keep]
+
+    def recent_events(self, limit: int, registration_code: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            events = self._events[::-1]
+        if registration_code:
+            events = [event for event in events if event.get('printer') == registration_code]
+        return events[:limit]
+
+
+class SQLiteStateStore(StateStore):
+    """Состояние в файле SQLite, общее для нескольких процессов.
+
+    Один процесс-опросчик пишет изменения, веб-воркеры читают их. Каждое поле
+    записи хранится отдельной строкой с версией изменения, поэтому дельты
+    (?since=, поток событий) выбираются запросом без чтения всех записей.
+    """
+
+    shared = True
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS printers (code TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS fields (
+            code TEXT NOT NULL,
+            field TEXT NOT NULL,
+            value TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (code, field)
+        );
+        CREATE INDEX IF NOT EXISTS fields_version ON fields (version);
+        CREATE TABLE IF NOT EXISTS snapshots (
+            code TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            etag TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS snapshot_variants (
+            code TEXT NOT NULL,
+            size TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (code, size)
+        );
+        CREATE TABLE IF NOT EXISTS watches (code TEXT PRIMARY KEY, until REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            printer TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS events_printer ON events (printer, id);
+        CREATE TABLE IF NOT EXISTS refresh_requests (
+            code TEXT NOT NULL,
+            action TEXT NOT NULL,
+            PRIMARY KEY (code, action)
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+    '''
+
+    def __init__(self, path: str, timeout: float = 5.0, pool_size: int = 8):
+        self.path = path
+        self.timeout = timeout
+        self.pool_size = pool_size
+        # Пул соединений процесса: соединение берется на время одной операции, поэтому
+        # запросы веб-сервера (поток или greenlet на запрос) не открывают новых соединений
+        self._pool_lock = threading.Lock()
+        self._idle: List[sqlite3.Connection] = []
+        self._closed = False
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение используется разными потоками по очереди, но никогда одновременно
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """Соединение из пула на время операции; новое открывается, только если все заняты"""
+        with self._pool_lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            with self._pool_lock:
+                if not self._closed and len(self._idle) < self.pool_size:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Транзакция записи (BEGIN IMMEDIATE): COMMIT при выходе, ROLLBACK при исключении"""
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def _bump_version(self, conn: sqlite3.Connection) -> int:
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def _fetchall(self, sql: str, parameters: tuple = ()) -> List[tuple]:
+        with self._connection() as conn:
+            return conn.execute(sql, parameters).fetchall()
+
+    def _fetchone(self, sql: str, parameters: tuple = ()) -> Optional[tuple]:
+        with self._connection() as conn:
+            return conn.execute(sql, parameters).fetchone()
+
+    def _execute(self, sql: str, parameters: tuple = ()):
+        with self._connection() as conn:
+            conn.execute(sql, parameters)
+
+    def add_printer(self, registration_code: str, record: Dict[str, Any]):
+        with self._transaction() as conn:
+            inserted = conn.execute('INSERT OR IGNORE INTO printers (code) VALUES (?)',
+                                    (registration_code,)).rowcount
+            if inserted:
+                self._bump_version(conn)
+                conn.executemany(
+                    'INSERT OR IGNORE INTO fields (code, field, value, version) VALUES (?, ?, ?, 0)',
+                    [(registration_code, key, json.dumps(value, ensure_ascii=False)) for key, value in record.items()]
+                )
+
+    def codes(self) -> List[str]:
+        return [row[0] for row in self._fetchall('SELECT code FROM printers ORDER BY rowid')]
+
+    def get(self, registration_code: str) -> Optional[Dict[str, Any]]:
+        with self._connection() as conn:
+            if conn.execute('SELECT 1 FROM printers WHERE code = ?', (registration_code,)).fetchone() is None:
+                return None
+            rows = conn.execute('SELECT field, value FROM fields WHERE code = ?', (registration_code,)).fetchall()
+        return {field: json.loads(value) for field, value in rows}
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        with self._connection() as conn:
+            codes = conn.execute('SELECT code FROM printers ORDER BY rowid').fetchall()
+            rows = conn.execute('SELECT code, field, value FROM fields').fetchall()
+        records: Dict[str, Dict[str, Any]] = {code: {} for code, in codes}
+        for code, field, value in rows:
+            if code in records:
+                records[code][field] = json.loads(value)
+        return records
+
+    def update(self, registration_code: str, fields: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+        encoded = {key: json.dumps(value, ensure_ascii=False) for key, value in fields.items()}
+        with self._transaction() as conn:
+            if conn.execute('SELECT 1 FROM printers WHERE code = ?', (registration_code,)).fetchone() is None:
+                return {}, conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            current = dict(conn.execute('SELECT field, value FROM fields WHERE code = ?',
+                                        (registration_code,)).fetchall())
+            changed = [key for key, value in encoded.items() if current.get(key) != value]
+            if not changed:
+                return {}, conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            version = self._bump_version(conn)
+            conn.executemany(
+                'INSERT OR REPLACE INTO fields (code, field, value, version) VALUES (?, ?, ?, ?)',
+                [(registration_code, key, encoded[key], version) for key in changed]
+            )
+        return {key: fields[key] for key in changed}, version
+
+    @property
+    def version(self) -> int:
+        return self._fetchone("SELECT value FROM meta WHERE key = 'version'")[0]
+
+    def printer_version(self, registration_code: str) -> int:
+        row = self._fetchone('SELECT MAX(version) FROM fields WHERE code = ?', (registration_code,))
+        return row[0] or 0
+
+    def changes_since(self, registration_code: str, since: int) -> Dict[str, Any]:
+        rows = self._fetchall('SELECT field, value FROM fields WHERE code = ? AND version > ?',
+                              (registration_code, since))
+        return {field: json.loads(value) for field, value in rows}
+
+    def changes_after(self, since: int) -> List[ChangeSet]:
+        rows = self._fetchall(
+            'SELECT code, field, value, version FROM fields WHERE version > ? ORDER BY version', (since,)
+        )
+        grouped: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        for code, field, value, version in rows:
+            grouped.setdefault((code, version), {})[field] = json.loads(value)
+        return [(code, changes, version) for (code, version), changes in grouped.items()]
+
+    def put_snapshot(self, registration_code: str, frame: SnapshotFrame,
+                     variants: Optional[Dict[str, bytes]] = None):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO snapshots (code, data, etag, updated_at) VALUES (?, ?, ?, ?)',
+                (registration_code, frame.data, frame.etag, frame.updated_at)
+            )
+            conn.execute('DELETE FROM snapshot_variants WHERE code = ?', (registration_code,))
+            conn.executemany(
+                'INSERT INTO snapshot_variants (code, size, data) VALUES (?, ?, ?)',
+                [(registration_code, size, data) for size, data in (variants or {}).items()]
+            )
+
+    def get_snapshot(self, registration_code: str) -> Optional[SnapshotFrame]:
+        row = self._fetchone('SELECT data, etag, updated_at FROM snapshots WHERE code = ?', (registration_code,))
+        return SnapshotFrame(row[0], row[1], row[2]) if row else None
+
+    def get_snapshot_variant(self, registration_code: str, size: str) -> Optional[SnapshotFrame]:
+        row = self._fetchone(
+            'SELECT v.data, s.etag, s.updated_at FROM snapshot_variants v '
+            'JOIN snapshots s ON s.code = v.code WHERE v.code = ? AND v.size = ?',
+            (registration_code, size)
+        )
+        return SnapshotFrame(row[0], f'{row[1]}-{size}', row[2]) if row else None
+
+    def delete_snapshot(self, registration_code: str) -> bool:
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM snapshot_variants WHERE code = ?', (registration_code,))
+            cursor = conn.execute('DELETE FROM snapshots WHERE code = ?', (registration_code,))
+        return cursor.rowcount > 0
+
+    def set_watch(self, registration_code: str, until: float):
+        self._execute(
+            'INSERT INTO watches (code, until) VALUES (?, ?) '
+            'ON CONFLICT(code) DO UPDATE SET until = MAX(until, excluded.until)',
+            (registration_code, until)
+        )
+
+    def watch_until(self, registration_code: str) -> float:
+        row = self._fetchone('SELECT until FROM watches WHERE code = ?', (registration_code,))
+        return row[0] if row else 0.0
+
+    def request_refresh(self, registration_code: str, action: str):
+        self._execute('INSERT OR IGNORE INTO refresh_requests (code, action) VALUES (?, ?)',
+                      (registration_code, action))
+
+    def take_refresh_requests(self) -> List[Tuple[str, str]]:
+        with self._transaction() as conn:
+            rows = conn.execute('SELECT code, action FROM refresh_requests ORDER BY rowid').fetchall()
+            conn.execute('DELETE FROM refresh_requests')
+        return [(code, action) for code, action in rows]
+
+    def add_event(self, event: Dict[str, Any], keep: int):
+        with self._transaction() as conn:
+            cursor = conn.execute('INSERT INTO events (printer, data) VALUES (?, ?)',
+                                  (event.get('printer', ''), json.dumps(event, ensure_ascii=False)))
+            conn.execute('DELETE FROM events WHERE id <= ?', (cursor.lastrowid - keep,))
+
+    def recent_events(self, limit: int, registration_code: Optional[str] = None) -> List[Dict[str, Any]]:
+        if registration_code:
+            rows = self._fetchall('SELECT data FROM events WHERE printer = ? ORDER BY id DESC LIMIT ?',
+                                  (registration_code, limit))
+        else:
+            rows = self._fetchall('SELECT data FROM events ORDER BY id DESC LIMIT ?', (limit,))
+        return [json.loads(row[0]) for row in rows]
+
+    def close(self):
+        """Закрытие соединений пула; занятые закрываются при возврате"""
+        with self._pool_lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+def create_state_store(backend: str, path: str) -> StateStore:
+    """Создание хранилища по имени backend из конфигурации: memory или sqlite"""
+    if backend == 'memory':
+        return MemoryStateStore()
+    if backend == 'sqlite':
+        return SQLiteStateStore(path)
+    raise ValueError(f"Неизвестный backend хранилища состояния: {backend}")
+
+
+class StoreWatcher:
+    """Фоновое отслеживание изменений общего хранилища в процессах без опросчика.
+
+    Раз в interval секунд сравнивает версию хранилища с последней увиденной и
+    передает новые изменения в callback(код, изменения, версия).
+    """
+
+    def __init__(self, store: StateStore, callback: Callable[[str, Dict[str, Any], int], None],
+                 interval: float = 1.0):
+        self.store = store
+        self.callback = callback
+        self.interval = interval
+        self._seen_version = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                # Подписчики получают текущее состояние при подключении, история не нужна
+                self._seen_version = self.store.version
+                self._thread = threading.Thread(target=self._run, name='state-store-watcher', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self.store.version == self._seen_version:
+                    continue
+                for code, changes, version in self.store.changes_after(self._seen_version):
+                    self.callback(code, changes, version)
+                    self._seen_version = max(self._seen_version, version)
+            except Exception as e:
+                logger.error("Ошибка отслеживания изменений хранилища: %s", e)
+                time.sleep(self.interval)
@@ -11,6 +11,11 @@ document.addEventListener('DOMContentLoaded', function() {
         document.body.classList.add('mobile-device');
     }
     
+    // На мобильных устройствах загружается уменьшенный вариант снепшота
+    function snapshotSrc(url) {
+        return isMobile ? `${url}&size=medium` : url;
+    }
+    
     // Предотвращаем зум при двойном тапе на мобильных
     let lastTouchEnd = 0;
     document.addEventListener('touchend', function(event) {
@@ -21,11 +26,16 @@ document.addEventListener('DOMContentLoaded', function() {
         lastTouchEnd = now;
     }, false);
     
+    // Текущее состояние принтера (изменения из потока применяются к нему)
+    let currentData = null;
+    let pollTimer = null;
+    
     // Функция для обновления данных через AJAX
     function refreshData() {
         fetch('/api/status')
             .then(response => response.json())
             .then(data => {
+                currentData = data;
                 updateDisplay(data);
             })
             .catch(error => {
@@ -33,12 +43,21 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
     
+    // Возраст устаревших данных: облако не отвечает, показан последний полученный статус
+    function staleAge(data) {
+        if (!data.stale || !data.status_updated_at) {
+            return '';
+        }
+        const minutes = Math.max(0, Math.floor(Date.now() / 1000 - data.status_updated_at) / 60);
+        return minutes < 1 ? ' (меньше минуты назад)' : ` (${Math.floor(minutes)} мин назад)`;
+    }
+    
     // Функция для обновления отображения
     function updateDisplay(data) {
         // Обновляем статус подключения
         const statusElement = document.querySelector('.connection-status');
         if (statusElement) {
-            statusElement.textContent = data.connection_status;
+            statusElement.textContent = data.connection_status + staleAge(data);
             statusElement.className = `connection-status ${data.connection_status === 'Подключено' ? 'connected' : 'disconnected'}`;
         }
         
@@ -114,8 +133,7 @@ document.addEventListener('DOMContentLoaded', function() {
         console.log('=== ОБНОВЛЕНИЕ ОТОБРАЖЕНИЯ КАМЕРЫ ===');
         console.log('Данные камеры:', data);
         console.log('Статус камеры:', data.camera_enabled);
-        console.log('Наличие снепшота:', !!data.camera_snapshot);
-        console.log('Размер снепшота:', data.camera_snapshot ? data.camera_snapshot.length : 0);
+        console.log('URL снепшота:', data.snapshot_url);
         
         // Обновляем статус камеры
         const cameraStatus = document.querySelector('.camera-status');
@@ -139,12 +157,13 @@ document.addEventListener('DOMContentLoaded', function() {
         console.log('- cameraPlaceholder:', cameraPlaceholder);
         console.log('- placeholderText:', placeholderText);
         
-        if (data.camera_snapshot && cameraImage) {
-            // Обновляем существующее изображение
-            console.log('Обновляем существующее изображение');
-            const imageSrc = `data:image/jpeg;base64,${data.camera_snapshot}`;
-            cameraImage.src = imageSrc;
-            console.log('Новый src изображения установлен');
+        if (data.snapshot_url && cameraImage) {
+            // Обновляем изображение только при смене версии снепшота
+            if (cameraImage.getAttribute('src') !== snapshotSrc(data.snapshot_url)) {
+                console.log('Обновляем существующее изображение');
+                cameraImage.src = snapshotSrc(data.snapshot_url);
+                console.log('Новый src изображения установлен');
+            }
             
             if (cameraSnapshot) {
                 cameraSnapshot.style.display = 'flex';
@@ -154,12 +173,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 cameraPlaceholder.style.display = 'none';
                 console.log('cameraPlaceholder скрыт');
             }
-        } else if (data.camera_snapshot && cameraSnapshot && cameraPlaceholder) {
+        } else if (data.snapshot_url && cameraSnapshot && cameraPlaceholder) {
             // Создаем новое изображение если его нет
             console.log('Создаем новое изображение');
-            const imageSrc = `data:image/jpeg;base64,${data.camera_snapshot}`;
             cameraSnapshot.innerHTML = `
-                <img src="${imageSrc}" 
+                <img src="${snapshotSrc(data.snapshot_url)}" 
                      alt="Снепшот с камеры принтера" 
                      class="snapshot-image"
                      id="camera-image">
@@ -260,11 +278,13 @@ document.addEventListener('DOMContentLoaded', function() {
     updateButton.textContent = 'Обновить сейчас';
     updateButton.className = 'refresh-button';
     updateButton.onclick = function() {
-        fetch('/api/refresh')
+        const container = document.querySelector('.container');
+        const regcode = container ? container.dataset.regcode : '';
+        fetch(regcode ? `/api/refresh?regcode=${encodeURIComponent(regcode)}` : '/api/refresh')
             .then(response => response.json())
             .then(data => {
-                if (data.status === 'success') {
-                    console.log('Данные обновлены');
+                if (data.status === 'success' || data.status === 'stale' || data.status === 'queued') {
+                    console.log(data.message);
                     // Небольшая задержка для обновления данных
                     setTimeout(refreshData, 1000);
                 }
@@ -419,9 +439,9 @@ document.addEventListener('DOMContentLoaded', function() {
         fetch('/api/camera/enable')
             .then(response => response.json())
             .then(data => {
-                if (data.status === 'success') {
-                    console.log('Камера включена');
-                    showCameraIndicator('✓ Камера включена');
+                if (data.status === 'success' || data.status === 'queued') {
+                    console.log(data.message);
+                    showCameraIndicator('✓ ' + data.message);
                     // Обновляем данные через небольшую задержку
                     setTimeout(refreshData, 2000);
                 } else {
@@ -440,9 +460,9 @@ document.addEventListener('DOMContentLoaded', function() {
         fetch('/api/camera/refresh')
             .then(response => response.json())
             .then(data => {
-                if (data.status === 'success') {
-                    console.log('Снепшот камеры обновлен');
-                    showCameraIndicator('✓ Снепшот обновлен');
+                if (data.status === 'success' || data.status === 'queued') {
+                    console.log(data.message);
+                    showCameraIndicator(data.status === 'queued' ? '✓ ' + data.message : '✓ Снепшот обновлен');
                     // Обновляем данные через небольшую задержку
                     setTimeout(refreshData, 1000);
                 } else {
@@ -515,8 +535,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 console.log('=== ТЕКУЩИЙ СТАТУС ===');
                 console.log('Текущий статус:', data);
                 console.log('Статус камеры:', data.camera_enabled);
-                console.log('Наличие снепшота:', !!data.camera_snapshot);
-                console.log('Размер снепшота:', data.camera_snapshot ? data.camera_snapshot.length : 0);
+                console.log('URL снепшота:', data.snapshot_url);
                 
                 if (!data.camera_enabled) {
                     console.log('Камера отключена, пробуем включить...');
@@ -551,24 +570,59 @@ document.addEventListener('DOMContentLoaded', function() {
     // Инициализируем полноэкранный режим
     initFullscreen();
     
-    // Автоматическое обновление каждые 10 секунд
-    setInterval(refreshData, 10000);
+    // Опрос /api/status каждые 10 секунд - только если поток недоступен
+    function startPolling() {
+        if (!pollTimer) {
+            pollTimer = setInterval(refreshData, 10000);
+        }
+    }
     
-    // Автоматическое обновление снепшота камеры каждые 60 секунд
-    setInterval(() => {
-        // Обновляем снепшот только если камера включена
-        fetch('/api/status')
-            .then(response => response.json())
-            .then(data => {
-                if (data.camera_enabled) {
-                    refreshCameraSnapshot();
-                }
-            })
-            .catch(error => {
-                console.error('Ошибка при проверке статуса камеры:', error);
-            });
-    }, 60000);
+    function stopPolling() {
+        if (pollTimer) {
+            clearInterval(pollTimer);
+            pollTimer = null;
+        }
+    }
+    
+    // Подписка на поток изменений сервера (Server-Sent Events)
+    function subscribeToStream() {
+        if (!window.EventSource) {
+            refreshData();
+            startPolling();
+            return;
+        }
+        
+        const container = document.querySelector('.container');
+        const regcode = container ? container.dataset.regcode : '';
+        const url = regcode ? `/api/stream?regcode=${encodeURIComponent(regcode)}` : '/api/stream';
+        const source = new EventSource(url);
+        
+        // Полный статус приходит при каждом (пере)подключении
+        source.addEventListener('status', event => {
+            const message = JSON.parse(event.data);
+            if (regcode && message.regcode !== regcode) return;
+            currentData = message.data;
+            updateDisplay(currentData);
+            stopPolling();
+        });
+        
+        // Далее приходят только изменившиеся поля
+        source.addEventListener('diff', event => {
+            const message = JSON.parse(event.data);
+            if (!currentData || (regcode && message.regcode !== regcode)) return;
+            Object.assign(currentData, message.changes);
+            updateDisplay(currentData);
+        });
+        
+        // EventSource переподключается сам; пока соединения нет, опрашиваем /api/status
+        source.onerror = () => {
+            console.warn('Поток обновлений недоступен, временно используем опрос');
+            startPolling();
+        };
+    }
+    
+    // Снепшот камеры обновляется сервером; новый кадр подгружается при смене snapshot_url
     
-    // Первоначальная загрузка данных
-    refreshData();
+    // Обновления данных приходят с сервера по мере их появления
+    subscribeToStream();
 });
@@ -0,0 +1,102 @@
+import json
+import queue
+import threading
+import logging
+from typing import Any, Iterable, Iterator, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event: str, data: Any) -> str:
+    """Сообщение в формате Server-Sent Events"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'event: {event}\ndata: {payload}\n\n'
+
+
+class Subscription:
+    """Подписка одного клиента на поток изменений (все принтеры или один)"""
+
+    def __init__(self, registration_code: Optional[str], max_queue: int):
+        self.registration_code = registration_code
+        self.queue: 'queue.Queue[Optional[str]]' = queue.Queue(maxsize=max_queue)
+        self.closed = False
+
+    def wants(self, registration_code: str) -> bool:
+        return self.registration_code is None or self.registration_code == registration_code
+
+
+class StatusBroadcaster:
+    """Рассылка изменений статусов принтеров подписчикам /api/stream.
+
+    Сообщение сериализуется один раз и раскладывается в очереди подписчиков,
+    поэтому стоимость публикации не зависит от размера данных на клиента.
+    Подписчик, который не успевает читать поток, отключается.
+    """
+
+    def __init__(self, keepalive: float = 15.0, max_queue: int = 100):
+        self.keepalive = keepalive
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers: Set[Subscription] = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def subscribe(self, registration_code: Optional[str] = None) -> Subscription:
+        subscription = Subscription(registration_code, self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, registration_code: str, event: str, data: Any):
+        """Отправка события всем подписчикам данного принтера"""
+        with self._lock:
+            subscribers = [s for s in self._subscribers if s.wants(registration_code)]
+        if not subscribers:
+            return
+
+        message = format_event(event, data)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                logger.warning("Подписчик потока не успевает читать события, отключаем")
+                subscription.closed = True
+                self.unsubscribe(subscription)
+
+    def events(self, subscription: Subscription,
+               initial: Iterable[Tuple[str, Any]] = ()) -> Iterator[str]:
+        """Генератор SSE сообщений для ответа Flask: начальное состояние, затем изменения"""
+        try:
+            yield f'retry: {int(self.keepalive * 1000)}\n\n'
+            for event, data in initial:
+                yield format_event(event, data)
+            while not subscription.closed:
+                try:
+                    message = subscription.queue.get(timeout=self.keepalive)
+                except queue.Empty:
+                    # Комментарий поддерживает соединение через прокси
+                    yield ': keepalive\n\n'
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(subscription)
+
+    def close(self):
+        """Завершение всех открытых потоков"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(None)
+            except queue.Full:
+                pass
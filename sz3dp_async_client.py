@@ -0,0 +1,325 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Any, Optional, Iterable
+
+import aiohttp
+from yarl import URL
+
+from sz3dp_client import (
+    PRINTER_ENDPOINT,
+    LOGIN_ENDPOINT,
+    USER_AGENT,
+    command_body,
+    command_headers,
+    login_body,
+    login_headers,
+    session_cookies,
+    check_login_response,
+    response_code,
+    is_transient_status,
+    is_auth_failure,
+    backoff_delay,
+)
+from printer_status import PrinterStatus, parse_printer_status, json_loads
+from log_utils import Excerpt, error_limiter
+from metrics import UPSTREAM_SECONDS, UPSTREAM_RESPONSES, LOGIN_ATTEMPTS
+from circuit_breaker import CircuitBreakers, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSZ3DPCloudClient:
+    """Асинхронный клиент для работы с API cloud.sz3dp.com.
+
+    Повторяет операции SZ3DPCloudClient (login, get_printer_status, open_camera,
+    get_printer_snapshot, logout) поверх одной aiohttp.ClientSession с общим
+    пулом соединений, поэтому один event loop может опрашивать сотни принтеров.
+    Отказы в авторизации и повторы временных сбоев обрабатываются так же, как в
+    SZ3DPCloudClient.
+    """
+
+    def __init__(self, email: str, password: str, base_url: str = "https://cloud.sz3dp.com",
+                 connection_limit: int = 100, timeout: float = 10.0, keep_raw_status: bool = False,
+                 breaker_threshold: int = 5, breaker_recovery: float = 30.0, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.email = email
+        self.password = password
+        self.base_url = base_url.rstrip('/')
+        self.connection_limit = connection_limit
+        self.timeout = timeout
+        self.keep_raw_status = keep_raw_status
+        self.is_authenticated = False
+        # Повторы чтений и выключатели по командам, как в SZ3DPCloudClient
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breakers = CircuitBreakers(breaker_threshold, breaker_recovery)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._login_lock: Optional[asyncio.Lock] = None
+        # Номер поколения меняется при каждом успешном входе
+        self._session_generation = 0
+
+    async def __aenter__(self) -> 'AsyncSZ3DPCloudClient':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Общая сессия с пулом соединений (создается при первом обращении)"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connection_limit),
+                # unsafe=True разрешает cookies для IP-адресов (локальная заглушка)
+                cookie_jar=aiohttp.CookieJar(unsafe=True),
+                headers={'User-Agent': USER_AGENT},
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    @property
+    def login_lock(self) -> asyncio.Lock:
+        """Блокировка входа (создается в работающем event loop)"""
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+        return self._login_lock
+
+    async def login(self) -> bool:
+        """Авторизация на сайте (одновременные вызовы выполняют один вход);
+        пока выключатель входа разомкнут - CircuitOpenError"""
+        async with self.login_lock:
+            if self.is_authenticated:
+                return True
+            return await self._login_once()
+
+    async def _reauthenticate(self, failed_generation: int) -> bool:
+        """Повторный вход после отказа в авторизации (один вход на все задачи)"""
+        async with self.login_lock:
+            if self.is_authenticated and self._session_generation != failed_generation:
+                # Другая задача уже обновила сессию, пока мы ждали блокировку
+                return True
+            logger.info("Сессия истекла, выполняем повторную авторизацию")
+            self.is_authenticated = False
+            return await self._login_once()
+
+    async def _login_once(self) -> bool:
+        """Вход под блокировкой входа с учетом выключателя 'login'"""
+        breaker = self.breakers.get('login')
+        breaker.check()
+        success = await self._login()
+        LOGIN_ATTEMPTS.inc('success' if success else 'failure')
+        if success:
+            self._session_generation += 1
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        return success
+
+    async def _login(self) -> bool:
+        try:
+            # Устанавливаем cookies из curl запроса для имитации авторизованной сессии
+            self.session.cookie_jar.update_cookies(session_cookies(self.email), URL(self.base_url))
+
+            async with self.session.get(f"{self.base_url}/") as response:
+                response.raise_for_status()
+                text = await response.text()
+                if check_login_response(response.status, response.headers, text):
+                    self.is_authenticated = True
+                    logger.info("Успешная авторизация с cookies")
+                    return True
+
+            logger.info("Cookies не работают, пробуем стандартную авторизацию")
+            return await self._try_standard_login()
+
+        except Exception as e:
+            logger.error("Ошибка при авторизации: %s", e)
+            return False
+
+    async def _try_standard_login(self) -> bool:
+        """Стандартная попытка авторизации"""
+        try:
+            logger.info("Попытка авторизации через %s", LOGIN_ENDPOINT)
+            async with self.session.post(
+                f"{self.base_url}{LOGIN_ENDPOINT}",
+                data=login_body(self.email, self.password),
+                headers=login_headers(self.base_url)
+            ) as response:
+                logger.info("Ответ авторизации: %s", response.status)
+                if response.status != 200:
+                    return False
+                text = await response.text()
+
+            try:
+                response_data = json.loads(text)
+            except ValueError:
+                if check_login_response(response.status, response.headers, text):
+                    self.is_authenticated = True
+                    logger.info("Успешная авторизация (HTML ответ)")
+                    return True
+                return False
+
+            if response_data.get('ErrorCode') == 200 or response_data.get('success'):
+                self.is_authenticated = True
+                logger.info("Успешная авторизация")
+                return True
+
+            logger.error("Ошибка авторизации: %s", response_data.get('Message', 'Unknown error'))
+            return False
+
+        except Exception as e:
+            logger.error("Ошибка при стандартной авторизации: %s", e)
+            return False
+
+    async def _command(self, cmd: str, registration_code: str,
+                       retry: bool = True) -> Optional[Dict[str, Any]]:
+        """Выполнение команды /user/printer.
+
+        При отказе в авторизации сессия обновляется один раз и запрос повторяется.
+        Временные сбои (ошибки соединения, таймауты, HTTP 429/5xx) повторяются
+        до max_retries раз, если retry=True - только для команд чтения. Пока
+        выключатель команды разомкнут, возникает CircuitOpenError. Возвращает
+        JSON ответа при ErrorCode == 200, иначе None.
+        """
+        attempts = self.max_retries + 1 if retry else 1
+        attempt = 0
+        reauthenticated = False
+        breaker = self.breakers.get(cmd)
+
+        while True:
+            breaker.check()
+            if not self.is_authenticated and not await self.login():
+                breaker.record_failure()
+                logger.error("Не удалось авторизоваться для %s", cmd)
+                return None
+            generation = self._session_generation
+
+            started = time.perf_counter()
+            try:
+                async with self.session.post(
+                    f"{self.base_url}{PRINTER_ENDPOINT}",
+                    data=command_body(cmd, registration_code),
+                    headers=command_headers(self.base_url, registration_code)
+                ) as response:
+                    content = await response.read()
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, cmd, registration_code)
+                UPSTREAM_RESPONSES.inc(cmd, registration_code, 'network')
+                breaker.record_failure()
+                error = str(e) or 'таймаут'
+            else:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, cmd, registration_code)
+                try:
+                    api_data = json_loads(content)
+                except ValueError:
+                    api_data = None
+                UPSTREAM_RESPONSES.inc(cmd, registration_code, response_code(response.status, api_data))
+                if is_transient_status(response.status):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+
+                if is_auth_failure(response.status, str(response.url) if response.history else None,
+                                   response.headers.get('Content-Type', ''), api_data):
+                    if reauthenticated or not await self._reauthenticate(generation):
+                        logger.error("%s %s: сервер отклонил авторизацию", cmd, registration_code)
+                        self.is_authenticated = False
+                        return None
+                    reauthenticated = True
+                    continue
+
+                if response.status == 200 and isinstance(api_data, dict):
+                    if api_data.get('ErrorCode') == 200:
+                        error_limiter.reset((cmd, registration_code))
+                        return api_data
+                    error_limiter.log(logger, logging.ERROR, (cmd, registration_code),
+                                      "%s %s: API вернул ошибку: %s", cmd, registration_code,
+                                      api_data.get('Message', 'Unknown error'))
+                    logger.debug("Полный ответ: %s", Excerpt(api_data))
+                    return None
+
+                if not is_transient_status(response.status):
+                    error_limiter.log(logger, logging.ERROR, (cmd, registration_code),
+                                      "%s %s: HTTP ошибка %s", cmd, registration_code, response.status)
+                    logger.debug("Ответ сервера: %s", Excerpt(content))
+                    return None
+                error = f"HTTP {response.status}"
+
+            attempt += 1
+            if attempt >= attempts:
+                error_limiter.log(logger, logging.ERROR, (cmd, registration_code),
+                                  "%s %s: %s", cmd, registration_code, error)
+                return None
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+            error_limiter.log(logger, logging.WARNING, (cmd, registration_code, 'retry'),
+                              "%s %s: %s, повтор %s/%s через %.2f с",
+                              cmd, registration_code, error, attempt, attempts - 1, delay)
+            await asyncio.sleep(delay)
+
+    async def get_printer_status(self, registration_code: str) -> Optional[PrinterStatus]:
+        """Получение статуса принтера"""
+        api_data = await self._command("GetPrinterStatus", registration_code)
+        return parse_printer_status(api_data, keep_raw=self.keep_raw_status) if api_data else None
+
+    async def get_printer_statuses(self, registration_codes: Iterable[str],
+                                   concurrency: int = 50) -> Dict[str, Optional[PrinterStatus]]:
+        """Одновременное получение статусов нескольких принтеров.
+
+        Не более concurrency запросов выполняются одновременно; для принтеров,
+        по которым запрос не удался, значение равно None. Принтеры, запрос по
+        которым пропущен разомкнутым выключателем, в словарь не входят.
+        """
+        codes = list(dict.fromkeys(registration_codes))
+        if not codes:
+            return {}
+        try:
+            if not self.is_authenticated and not await self.login():
+                return {code: None for code in codes}
+        except CircuitOpenError:
+            return {}
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        statuses: Dict[str, Optional[PrinterStatus]] = {}
+
+        async def fetch(code: str):
+            async with semaphore:
+                try:
+                    statuses[code] = await self.get_printer_status(code)
+                except CircuitOpenError:
+                    pass
+
+        await asyncio.gather(*(fetch(code) for code in codes))
+        return {code: statuses[code] for code in codes if code in statuses}
+
+    async def open_camera(self, registration_code: str) -> bool:
+        """Включение камеры принтера"""
+        return await self._command("OpenCamera", registration_code, retry=False) is not None
+
+    async def get_printer_snapshot(self, registration_code: str) -> Optional[str]:
+        """Получение снепшота с камеры принтера (base64 JPEG)"""
+        api_data = await self._command("GetPrinterSnapshot", registration_code)
+        if not api_data:
+            return None
+        snapshot_data = api_data.get('Snapshot', '')
+        if not snapshot_data:
+            error_limiter.log(logger, logging.WARNING, ("GetPrinterSnapshot", registration_code, 'empty'),
+                              "Пустой снепшот от сервера для %s", registration_code)
+            return None
+        return snapshot_data
+
+    async def logout(self):
+        """Выход из системы"""
+        try:
+            async with self.session.post(f"{self.base_url}/logout"):
+                pass
+        except Exception:
+            pass
+        self.is_authenticated = False
+
+    async def close(self):
+        """Закрытие сессии и пула соединений"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
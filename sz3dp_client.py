@@ -1,52 +1,392 @@
 import requests
 import json
+import random
+import threading
 import time
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Optional, Iterable
 from bs4 import BeautifulSoup
 import logging
+from session_cache import SessionCache
+from http_pool import PooledHTTPAdapter, connect_retry_policy
+from printer_status import PrinterStatus, parse_printer_status, format_time, json_loads
+from log_utils import Excerpt, error_limiter
+from metrics import UPSTREAM_SECONDS, UPSTREAM_RESPONSES, LOGIN_ATTEMPTS
+from circuit_breaker import CircuitBreakers, CircuitOpenError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PRINTER_ENDPOINT = "/user/printer"
+LOGIN_ENDPOINT = "/user/login"
+
+# Значения ErrorCode, которыми облако сообщает о недействительной сессии
+AUTH_ERROR_CODES = {401, 403}
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+
+def login_body(email: str, password: str) -> str:
+    """Тело запроса авторизации (JSON, отправляемый как raw data)"""
+    return f'{{"UserID":"{email}","Password":"{password}"}}'
+
+
+def command_body(cmd: str, registration_code: str) -> str:
+    """Тело команды для endpoint /user/printer"""
+    return f'{{"Cmd":"{cmd}","Parameters":{{"RegistrationCode":"{registration_code}"}}}}'
+
+
+def response_code(status_code: int, api_data: Any) -> str:
+    """Код ответа для метрик: ErrorCode ответа API или http_<статус>"""
+    if isinstance(api_data, dict) and 'ErrorCode' in api_data:
+        return str(api_data['ErrorCode'])
+    return f'http_{status_code}'
+
+
+def command_headers(base_url: str, registration_code: str) -> Dict[str, str]:
+    """Заголовки запроса команды к принтеру"""
+    return {
+        'accept': 'application/json, text/javascript, */*; q=0.01',
+        'content-type': 'application/x-www-form-urlencoded;charset=UTF-8',
+        'x-requested-with': 'XMLHttpRequest',
+        'origin': base_url,
+        'referer': f'{base_url}/printerDetail.html?regcode={registration_code}'
+    }
+
+
+def login_headers(base_url: str) -> Dict[str, str]:
+    """Заголовки запроса авторизации через /user/login"""
+    return {
+        'accept': 'application/json, text/javascript, */*; q=0.01',
+        'accept-language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+        'cache-control': 'no-cache',
+        'content-type': 'application/x-www-form-urlencoded;charset=UTF-8',
+        'dnt': '1',
+        'origin': base_url,
+        'pragma': 'no-cache',
+        'referer': f'{base_url}/login.html',
+        'sec-ch-ua': '"Chromium";v="140", "Not=A?Brand";v="24", "Google Chrome";v="140"',
+        'sec-ch-ua-mobile': '?0',
+        'sec-ch-ua-platform': '"Windows"',
+        'sec-fetch-dest': 'empty',
+        'sec-fetch-mode': 'cors',
+        'sec-fetch-site': 'same-origin',
+        'x-requested-with': 'XMLHttpRequest'
+    }
+
+
+def session_cookies(email: str) -> Dict[str, str]:
+    """Cookies для имитации авторизованной сессии (получены из реального запроса)"""
+    return {
+        'langcookie': 'ru-RU',
+        'login_code': email,
+        'goSessionid': 'QNzsJwfiyiae8r5o_zl_4DTn_0j32Gap1tfe-S6je8o=',  # Временная сессия
+        'autoLogin': 'false',
+        'pwd': '',
+        'menuclass': ".sidemenu1[name='menuMyPrinter']",
+        'iframcookie': 'printerDetail.html?regcode=ULJMGV&name=Flashforge%205m&measure=220x220x220'
+    }
+
+
+def is_transient_status(status_code: int) -> bool:
+    """Временный сбой облака (HTTP 429/5xx): запрос чтения повторяется, выключатель считает сбой"""
+    return status_code == 429 or status_code >= 500
+
+
+def is_auth_failure(status_code: int, redirected_to: Optional[str], content_type: str, api_data: Any) -> bool:
+    """Признаки недействительной сессии: 401/403, редирект на вход или ErrorCode.
+
+    redirected_to - адрес, на который перенаправлен запрос (None без редиректа).
+    Временный сбой (429/5xx) сессию не отменяет, даже если прокси вернул HTML страницу ошибки.
+    """
+    if is_transient_status(status_code):
+        return False
+    if status_code in (401, 403):
+        return True
+    if redirected_to and 'login' in redirected_to.lower():
+        return True
+    if isinstance(api_data, dict) and api_data.get('ErrorCode') in AUTH_ERROR_CODES:
+        return True
+    # Вместо JSON пришла HTML страница - как правило, это форма входа
+    if api_data is None and content_type.startswith('text/html'):
+        return True
+    return False
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Задержка перед повтором: экспонента с полным случайным разбросом"""
+    return random.uniform(0, min(maximum, base * (2 ** (attempt - 1))))
+
+
+def check_login_response(status_code: int, headers, text: str) -> bool:
+    """Проверка успешности авторизации по коду, заголовкам и телу ответа"""
+    # Проверяем редирект на главную страницу
+    if status_code == 302:
+        location = headers.get('Location', '')
+        if '/dashboard' in location or '/main' in location or '/' == location:
+            return True
+
+    # Проверяем содержимое ответа
+    try:
+        if headers.get('Content-Type', '').startswith('application/json'):
+            data = json.loads(text)
+            return data.get('success', False) or data.get('status') == 'success'
+    except:
+        pass
+
+    # Проверяем HTML ответ на наличие признаков успешной авторизации
+    if headers.get('Content-Type', '').startswith('text/html'):
+        soup = BeautifulSoup(text, 'html.parser')
+
+        # Ищем признаки успешной авторизации
+        success_indicators = [
+            'dashboard', 'main', 'home', 'welcome', 'logout'
+        ]
+
+        page_text = soup.get_text().lower()
+        for indicator in success_indicators:
+            if indicator in page_text:
+                return True
+
+        # Проверяем отсутствие формы логина
+        login_form = soup.find('form')
+        if not login_form:
+            return True
+
+    return False
+
+
 class SZ3DPCloudClient:
     """Клиент для работы с API cloud.sz3dp.com"""
     
-    def __init__(self, email: str, password: str, base_url: str = "https://cloud.sz3dp.com"):
+    def __init__(self, email: str, password: str, base_url: str = "https://cloud.sz3dp.com",
+                 session_cache: Optional[SessionCache] = None, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 pool_connections: int = 10, pool_maxsize: int = 16, pool_block: bool = False,
+                 connect_timeout: float = 5.0, read_timeout: float = 15.0,
+                 connect_retries: int = 2, tcp_keepalive: bool = True,
+                 keep_raw_status: bool = False, breaker_threshold: int = 5,
+                 breaker_recovery: float = 30.0):
         self.email = email
         self.password = password
         self.base_url = base_url.rstrip('/')
+        # Таймауты по умолчанию для всех запросов: (соединение, чтение)
+        self.timeout = (connect_timeout, read_timeout)
+        # Сохранять ли полный ответ облака в статусе (raw_data) - нужно только для отладки
+        self.keep_raw_status = keep_raw_status
         self.session = requests.Session()
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            'User-Agent': USER_AGENT,
+            'Connection': 'keep-alive'
         })
+        # Пул соединений на хост ограничен pool_maxsize; при pool_block=True потоки ждут
+        # свободное соединение, иначе лишние соединения открываются и закрываются после запроса
+        self.adapter = PooledHTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=connect_retry_policy(connect_retries),
+            pool_block=pool_block,
+            tcp_keepalive=tcp_keepalive
+        )
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.is_authenticated = False
+        # Способ входа, сработавший последним: 'cookies', 'standard' или 'ajax:<endpoint>'
+        self.login_method: Optional[str] = None
+        self.session_cache = session_cache
+        # Повторы чтений при временных сбоях: экспоненциальная задержка со случайным разбросом
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Вход выполняется одним потоком; номер поколения меняется при каждом успешном входе
+        self._login_lock = threading.Lock()
+        self._session_generation = 0
+        # Выключатели по командам: после breaker_threshold сбоев подряд запросы к команде
+        # отклоняются без обращения к облаку, через breaker_recovery секунд - пробный запрос
+        self.breakers = CircuitBreakers(breaker_threshold, breaker_recovery)
+        self._restore_session()
+        
+    def _restore_session(self):
+        """Восстановление сохраненной сессии из кеша без обращения к серверу"""
+        if not self.session_cache:
+            return
+        entry = self.session_cache.load(self.base_url, self.email)
+        if not entry:
+            return
+        
+        for cookie in entry.get('cookies', []):
+            self.session.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain', ''), path=cookie.get('path', '/')
+            )
+        self.login_method = entry.get('login_method')
+        self.is_authenticated = True
+        logger.info("Восстановлена сохраненная сессия (способ входа: %s)", self.login_method)
+    
+    def _session_established(self, login_method: str):
+        """Фиксация успешного входа и сохранение сессии в кеш"""
+        self.is_authenticated = True
+        self.login_method = login_method
+        self._session_generation += 1
+        if self.session_cache:
+            cookies = [
+                {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path}
+                for c in self.session.cookies
+            ]
+            self.session_cache.save(self.base_url, self.email, cookies, login_method)
+    
+    def invalidate_session(self):
+        """Сброс сессии, отклоненной сервером; следующий запрос выполнит вход заново"""
         self.is_authenticated = False
+        if self.session_cache:
+            self.session_cache.clear()
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """Метрики использования пула HTTP соединений"""
+        stats = self.adapter.pool_stats()
+        stats['connect_timeout'], stats['read_timeout'] = self.timeout
+        return stats
+    
+    def _ensure_authenticated(self) -> bool:
+        """Вход, если сессии нет; параллельные потоки дожидаются одного входа"""
+        if self.is_authenticated:
+            return True
+        with self._login_lock:
+            if self.is_authenticated:
+                return True
+            return self.login()
+    
+    def _reauthenticate(self, failed_generation: int) -> bool:
+        """Повторный вход после отказа в авторизации (один вход на все потоки)"""
+        with self._login_lock:
+            if self.is_authenticated and self._session_generation != failed_generation:
+                # Другой поток уже обновил сессию, пока мы ждали блокировку
+                return True
+            logger.info("Сессия истекла, выполняем повторную авторизацию")
+            self.invalidate_session()
+            return self.login()
+    
+    def _command(self, cmd: str, registration_code: str, timeout: Optional[float] = None,
+                 retry: bool = True) -> Optional[Dict[str, Any]]:
+        """Выполнение команды /user/printer.
+
+        При отказе в авторизации сессия обновляется один раз и запрос повторяется.
+        Временные сбои (ошибки соединения, таймауты, HTTP 429/5xx) повторяются
+        до max_retries раз, если retry=True - только для команд чтения. Они же
+        размыкают выключатель команды: пока он разомкнут, запрос не выполняется и
+        возникает CircuitOpenError. Возвращает JSON ответа при ErrorCode == 200, иначе None.
+        """
+        attempts = self.max_retries + 1 if retry else 1
+        attempt = 0
+        reauthenticated = False
+        breaker = self.breakers.get(cmd)
         
+        while True:
+            breaker.check()
+            if not self._ensure_authenticated():
+                breaker.record_failure()
+                logger.error("Не удалось авторизоваться для %s", cmd)
+                return None
+            generation = self._session_generation
+            
+            started = time.perf_counter()
+            try:
+                response = self.session.post(
+                    f"{self.base_url}{PRINTER_ENDPOINT}",
+                    data=command_body(cmd, registration_code),
+                    headers=command_headers(self.base_url, registration_code),
+                    timeout=timeout if timeout is not None else self.timeout
+                )
+            except requests.RequestException as e:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, cmd, registration_code)
+                UPSTREAM_RESPONSES.inc(cmd, registration_code, 'network')
+                breaker.record_failure()
+                error = str(e)
+            else:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, cmd, registration_code)
+                try:
+                    api_data = json_loads(response.content)
+                except ValueError:
+                    api_data = None
+                UPSTREAM_RESPONSES.inc(cmd, registration_code, response_code(response.status_code, api_data))
+                if is_transient_status(response.status_code):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                
+                if is_auth_failure(response.status_code, response.url if response.history else None,
+                                   response.headers.get('Content-Type', ''), api_data):
+                    if reauthenticated or not self._reauthenticate(generation):
+                        logger.error("%s %s: сервер отклонил авторизацию", cmd, registration_code)
+                        self.invalidate_session()
+                        return None
+                    reauthenticated = True
+                    continue
+                
+                if response.status_code == 200 and isinstance(api_data, dict):
+                    if api_data.get('ErrorCode') == 200:
+                        error_limiter.reset((cmd, registration_code))
+                        return api_data
+                    error_limiter.log(logger, logging.ERROR, (cmd, registration_code),
+                                      "%s %s: API вернул ошибку: %s", cmd, registration_code,
+                                      api_data.get('Message', 'Unknown error'))
+                    logger.debug("Полный ответ: %s", Excerpt(api_data))
+                    return None
+                
+                if not is_transient_status(response.status_code):
+                    error_limiter.log(logger, logging.ERROR, (cmd, registration_code),
+                                      "%s %s: HTTP ошибка %s", cmd, registration_code, response.status_code)
+                    logger.debug("Ответ сервера: %s", Excerpt(lambda: response.text))
+                    return None
+                error = f"HTTP {response.status_code}"
+            
+            attempt += 1
+            if attempt >= attempts:
+                error_limiter.log(logger, logging.ERROR, (cmd, registration_code),
+                                  "%s %s: %s", cmd, registration_code, error)
+                return None
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+            error_limiter.log(logger, logging.WARNING, (cmd, registration_code, 'retry'),
+                              "%s %s: %s, повтор %s/%s через %.2f с",
+                              cmd, registration_code, error, attempt, attempts - 1, delay)
+            time.sleep(delay)
+    
     def login(self) -> bool:
-        """Авторизация на сайте"""
+        """Авторизация на сайте; пока выключатель входа разомкнут - CircuitOpenError"""
+        breaker = self.breakers.get('login')
+        breaker.check()
+        success = self._login()
+        LOGIN_ATTEMPTS.inc('success' if success else 'failure')
+        if success:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        return success
+    
+    def _login(self) -> bool:
+        # Сначала пробуем способ входа, сработавший в прошлый раз
+        if self.login_method == 'standard':
+            if self._try_standard_login():
+                return True
+        elif self.login_method and self.login_method.startswith('ajax:'):
+            if self._try_ajax_login([self.login_method[len('ajax:'):]]):
+                return True
+        
         try:
             # Устанавливаем cookies из curl запроса для имитации авторизованной сессии
-            # Эти cookies получены из реального запроса
-            cookies = {
-                'langcookie': 'ru-RU',
-                'login_code': self.email,
-                'goSessionid': 'QNzsJwfiyiae8r5o_zl_4DTn_0j32Gap1tfe-S6je8o=',  # Временная сессия
-                'autoLogin': 'false',
-                'pwd': '',
-                'menuclass': ".sidemenu1[name='menuMyPrinter']",
-                'iframcookie': 'printerDetail.html?regcode=ULJMGV&name=Flashforge%205m&measure=220x220x220'
-            }
+            cookies = session_cookies(self.email)
             
             # Устанавливаем cookies в сессию
             for name, value in cookies.items():
                 self.session.cookies.set(name, value, domain='.sz3dp.com')
             
             # Пробуем получить главную страницу для проверки авторизации
-            response = self.session.get(f"{self.base_url}/")
+            response = self.session.get(f"{self.base_url}/", timeout=self.timeout)
             response.raise_for_status()
             
             # Проверяем, авторизованы ли мы
             if self._check_login_success(response):
-                self.is_authenticated = True
+                self._session_established('cookies')
                 logger.info("Успешная авторизация с cookies")
                 return True
             
@@ -55,81 +395,60 @@ class SZ3DPCloudClient:
             return self._try_standard_login()
             
         except Exception as e:
-            logger.error(f"Ошибка при авторизации: {e}")
+            logger.error("Ошибка при авторизации: %s", e)
             return False
     
     def _try_standard_login(self) -> bool:
         """Стандартная попытка авторизации"""
         try:
             # Используем правильный endpoint для авторизации
-            endpoint = "/user/login"
-            
-            # Подготавливаем данные в правильном формате
-            data = {
-                "UserID": self.email,
-                "Password": self.password
-            }
+            endpoint = LOGIN_ENDPOINT
             
-            headers = {
-                'accept': 'application/json, text/javascript, */*; q=0.01',
-                'accept-language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-                'cache-control': 'no-cache',
-                'content-type': 'application/x-www-form-urlencoded;charset=UTF-8',
-                'dnt': '1',
-                'origin': self.base_url,
-                'pragma': 'no-cache',
-                'referer': f'{self.base_url}/login.html',
-                'sec-ch-ua': '"Chromium";v="140", "Not=A?Brand";v="24", "Google Chrome";v="140"',
-                'sec-ch-ua-mobile': '?0',
-                'sec-ch-ua-platform': '"Windows"',
-                'sec-fetch-dest': 'empty',
-                'sec-fetch-mode': 'cors',
-                'sec-fetch-site': 'same-origin',
-                'x-requested-with': 'XMLHttpRequest'
-            }
+            headers = login_headers(self.base_url)
             
             # Отправляем данные в формате JSON как raw data
-            json_data = f'{{"UserID":"{self.email}","Password":"{self.password}"}}'
+            json_data = login_body(self.email, self.password)
             
-            logger.info(f"Попытка авторизации через {endpoint}")
+            logger.info("Попытка авторизации через %s", endpoint)
             response = self.session.post(
                 f"{self.base_url}{endpoint}",
                 data=json_data,
-                headers=headers
+                headers=headers,
+                timeout=self.timeout
             )
             
-            logger.info(f"Ответ авторизации: {response.status_code}")
+            logger.info("Ответ авторизации: %s", response.status_code)
             
             if response.status_code == 200:
                 try:
                     response_data = response.json()
-                    logger.info(f"Ответ сервера: {response_data}")
+                    logger.debug("Ответ сервера: %s", Excerpt(response_data))
                     
                     # Проверяем успешность авторизации
                     if response_data.get('ErrorCode') == 200 or response_data.get('success'):
-                        self.is_authenticated = True
+                        self._session_established('standard')
                         logger.info("Успешная авторизация")
                         return True
                     else:
-                        logger.error(f"Ошибка авторизации: {response_data.get('Message', 'Unknown error')}")
+                        logger.error("Ошибка авторизации: %s", response_data.get('Message', 'Unknown error'))
                         
                 except Exception as e:
-                    logger.error(f"Ошибка парсинга ответа авторизации: {e}")
+                    logger.error("Ошибка парсинга ответа авторизации: %s", e)
                     # Если не JSON, проверяем HTML
                     if self._check_login_success(response):
-                        self.is_authenticated = True
+                        self._session_established('standard')
                         logger.info("Успешная авторизация (HTML ответ)")
                         return True
             
             return False
             
         except Exception as e:
-            logger.error(f"Ошибка при стандартной авторизации: {e}")
+            logger.error("Ошибка при стандартной авторизации: %s", e)
             return False
     
-    def _try_ajax_login(self) -> bool:
+    def _try_ajax_login(self, ajax_endpoints: Optional[list] = None) -> bool:
         """Попытка авторизации через AJAX endpoints"""
-        ajax_endpoints = [
+        ajax_endpoints = ajax_endpoints or [
             '/api/login',
             '/api/auth/login',
             '/login',
@@ -159,171 +478,86 @@ class SZ3DPCloudClient:
                     response = self.session.post(
                         f"{self.base_url}{endpoint}",
                         json=data,
-                        headers=headers
+                        headers=headers,
+                        timeout=self.timeout
                     )
                     
                     if response.status_code in [200, 201, 302]:
                         if self._check_login_success(response):
-                            self.is_authenticated = True
-                            logger.info(f"Успешная авторизация через {endpoint}")
+                            self._session_established(f'ajax:{endpoint}')
+                            logger.info("Успешная авторизация через %s", endpoint)
                             return True
                             
             except Exception as e:
-                logger.debug(f"Ошибка при попытке входа через {endpoint}: {e}")
+                logger.debug("Ошибка при попытке входа через %s: %s", endpoint, e)
                 continue
                 
         return False
     
     def _check_login_success(self, response) -> bool:
         """Проверка успешности авторизации по ответу"""
-        # Проверяем редирект на главную страницу
-        if response.status_code == 302:
-            location = response.headers.get('Location', '')
-            if '/dashboard' in location or '/main' in location or '/' == location:
-                return True
-        
-        # Проверяем содержимое ответа
+        return check_login_response(response.status_code, response.headers, response.text)
+    
+    def get_printer_status(self, registration_code: str = "ULJMGV", timeout: Optional[float] = None) -> Optional[PrinterStatus]:
+        """Получение статуса принтера; CircuitOpenError, если запрос пропущен выключателем"""
         try:
-            if response.headers.get('Content-Type', '').startswith('application/json'):
-                data = response.json()
-                return data.get('success', False) or data.get('status') == 'success'
-        except:
-            pass
-        
-        # Проверяем HTML ответ на наличие признаков успешной авторизации
-        if response.headers.get('Content-Type', '').startswith('text/html'):
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Ищем признаки успешной авторизации
-            success_indicators = [
-                'dashboard', 'main', 'home', 'welcome', 'logout'
-            ]
-            
-            page_text = soup.get_text().lower()
-            for indicator in success_indicators:
-                if indicator in page_text:
-                    return True
+            logger.debug("Запрос статуса принтера %s", registration_code)
+            api_data = self._command("GetPrinterStatus", registration_code, timeout=timeout)
+            if api_data:
+                return self._parse_printer_status(api_data)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            error_limiter.log(logger, logging.ERROR, ("GetPrinterStatus", registration_code),
+                              "Ошибка при получении статуса принтера %s: %s", registration_code, e)
+            logger.debug("Трассировка ошибки статуса %s", registration_code, exc_info=True)
             
-            # Проверяем отсутствие формы логина
-            login_form = soup.find('form')
-            if not login_form:
-                return True
-        
-        return False
+        return None
     
-    def get_printer_status(self, registration_code: str = "ULJMGV") -> Optional[Dict[str, Any]]:
-        """Получение статуса принтера"""
-        if not self.is_authenticated:
-            if not self.login():
-                return None
-                
+    def get_printer_statuses(self, registration_codes: Iterable[str], max_workers: int = 8,
+                             timeout: Optional[float] = 10.0) -> Dict[str, Optional[PrinterStatus]]:
+        """Параллельное получение статусов нескольких принтеров через общую сессию.
+
+        Запросы GetPrinterStatus выполняются пулом из max_workers потоков, каждый
+        с таймаутом timeout секунд. Возвращает словарь {код: статус}; для принтеров,
+        по которым запрос не удался, значение равно None. Принтеры, запрос по которым
+        пропущен разомкнутым выключателем, в словарь не входят.
+        """
+        codes = list(dict.fromkeys(registration_codes))
+        results: Dict[str, Optional[PrinterStatus]] = {code: None for code in codes}
+        if not codes:
+            return results
+
+        # Авторизуемся один раз до запуска потоков, чтобы они не логинились параллельно
         try:
-            # Используем правильный API endpoint для получения статуса принтера
-            endpoint = "/user/printer"
-            
-            # Подготавливаем данные запроса в правильном формате
-            data = {
-                "Cmd": "GetPrinterStatus",
-                "Parameters": {
-                    "RegistrationCode": registration_code
-                }
-            }
-            
-            headers = {
-                'accept': 'application/json, text/javascript, */*; q=0.01',
-                'content-type': 'application/x-www-form-urlencoded;charset=UTF-8',
-                'x-requested-with': 'XMLHttpRequest',
-                'origin': self.base_url,
-                'referer': f'{self.base_url}/printerDetail.html?regcode={registration_code}'
-            }
-            
-            logger.info(f"Запрос статуса принтера {registration_code}")
-            response = self.session.post(
-                f"{self.base_url}{endpoint}",
-                data=f'{{"Cmd":"GetPrinterStatus","Parameters":{{"RegistrationCode":"{registration_code}"}}}}',
-                headers=headers
-            )
-            
-            if response.status_code == 200:
+            if not self._ensure_authenticated():
+                return results
+        except CircuitOpenError:
+            return {}
+
+        workers = max(1, min(max_workers, len(codes)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sz3dp-status') as executor:
+            futures = {executor.submit(self.get_printer_status, code, timeout): code for code in codes}
+            for future in as_completed(futures):
+                code = futures[future]
                 try:
-                    api_data = response.json()
-                    if api_data.get('ErrorCode') == 200:
-                        return self._parse_printer_status(api_data)
-                    else:
-                        logger.error(f"API вернул ошибку: {api_data.get('Message', 'Unknown error')}")
+                    results[code] = future.result()
+                except CircuitOpenError:
+                    del results[code]
                 except Exception as e:
-                    logger.error(f"Ошибка парсинга JSON ответа: {e}")
-            else:
-                logger.error(f"HTTP ошибка: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при получении статуса принтера: {e}")
-            
-        return None
+                    logger.error("Ошибка при получении статуса принтера %s: %s", code, e)
+
+        received = sum(1 for status in results.values() if status)
+        logger.debug("Получено статусов: %s из %s, пропущено: %s", received, len(codes), len(codes) - len(results))
+        return results
     
-    def _parse_printer_status(self, api_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _parse_printer_status(self, api_data: Dict[str, Any]) -> PrinterStatus:
         """Парсинг данных статуса принтера из API ответа"""
-        detail = api_data.get('Detail', {})
-        
-        # Извлекаем температуры экструдера
-        cur_temps = detail.get('CurTemps', [0, 0])
-        target_temps = detail.get('TargetTemps', [0, 0])
-        
-        extruder_temp = {
-            'current': cur_temps[0] if len(cur_temps) > 0 else 0,
-            'target': target_temps[0] if len(target_temps) > 0 else 0
-        }
-        
-        # Температура стола
-        bed_temp = {
-            'current': detail.get('PlatformCurTemp', 0),
-            'target': detail.get('PlatformTargetTemp', 0)
-        }
-        
-        # Прогресс печати (умножаем на 100 для отображения в процентах и округляем)
-        progress_percent = round(detail.get('PrintProgress', 0) * 100, 2)
-        
-        # Время оставшееся (в минутах)
-        estimate_time = detail.get('EstimateTime', 0)
-        time_remaining = self._format_time(estimate_time)
-        
-        # Статус корпуса (Door: 0 = закрыт, 1 = открыт)
-        door_status = detail.get('Door', 0)
-        enclosure_status = "закрыт" if door_status == 0 else "открыт"
-        
-        # Статус филамента
-        filament_status = "нормальный" if detail.get('Filament', 0) == 0 else "проблема"
-        
-        return {
-            'model_name': detail.get('GcodeName', '').replace('.gcode', ''),
-            'progress_percent': progress_percent,
-            'time_remaining': time_remaining,
-            'extruder_temp': extruder_temp,
-            'bed_temp': bed_temp,
-            'enclosure_status': enclosure_status,
-            'filament_status': filament_status,
-            'printer_name': detail.get('PrinterName', ''),
-            'registration_code': detail.get('RegistrationCode', ''),
-            'firmware_version': detail.get('FirmwareVersion', ''),
-            'printer_type': detail.get('PrinterType', ''),
-            'measure': detail.get('Measure', ''),
-            'job_status': detail.get('JobStatus', ''),
-            'duration': detail.get('Duration', 0),
-            'raw_data': api_data
-        }
+        return parse_printer_status(api_data, keep_raw=self.keep_raw_status)
     
     def _format_time(self, minutes: float) -> str:
         """Форматирование времени из минут в читаемый вид"""
-        if minutes <= 0:
-            return "0 мин"
-        
-        hours = int(minutes // 60)
-        mins = int(minutes % 60)
-        
-        if hours > 0:
-            return f"{hours} ч {mins} мин"
-        else:
-            return f"{mins} мин"
+        return format_time(minutes)
     
     def _parse_status_html(self, html: str) -> Dict[str, Any]:
         """Парсинг HTML для извлечения статуса принтера"""
@@ -403,9 +637,11 @@ class SZ3DPCloudClient:
     
     def get_printers_list(self) -> Optional[list]:
         """Получение списка принтеров"""
-        if not self.is_authenticated:
-            if not self.login():
+        try:
+            if not self._ensure_authenticated():
                 return None
+        except CircuitOpenError:
+            return None
                 
         try:
             endpoints = [
@@ -418,7 +654,7 @@ class SZ3DPCloudClient:
             
             for endpoint in endpoints:
                 try:
-                    response = self.session.get(f"{self.base_url}{endpoint}")
+                    response = self.session.get(f"{self.base_url}{endpoint}", timeout=self.timeout)
                     if response.status_code == 200:
                         try:
                             return response.json()
@@ -429,157 +665,61 @@ class SZ3DPCloudClient:
                             # Логика парсинга списка принтеров из HTML
                             return printers
                 except Exception as e:
-                    logger.debug(f"Ошибка при запросе {endpoint}: {e}")
+                    logger.debug("Ошибка при запросе %s: %s", endpoint, e)
                     continue
                     
         except Exception as e:
-            logger.error(f"Ошибка при получении списка принтеров: {e}")
+            logger.error("Ошибка при получении списка принтеров: %s", e)
             
         return []
     
-    def open_camera(self, registration_code: str = "ULJMGV") -> bool:
+    def open_camera(self, registration_code: str = "ULJMGV", timeout: Optional[float] = None) -> bool:
         """Включение камеры принтера"""
-        if not self.is_authenticated:
-            logger.info("Не авторизован, пробуем авторизоваться...")
-            if not self.login():
-                logger.error("Не удалось авторизоваться для включения камеры")
-                return False
-                
         try:
-            endpoint = "/user/printer"
-            
-            data = {
-                "Cmd": "OpenCamera",
-                "Parameters": {
-                    "RegistrationCode": registration_code
-                }
-            }
-            
-            headers = {
-                'accept': 'application/json, text/javascript, */*; q=0.01',
-                'content-type': 'application/x-www-form-urlencoded;charset=UTF-8',
-                'x-requested-with': 'XMLHttpRequest',
-                'origin': self.base_url,
-                'referer': f'{self.base_url}/printerDetail.html?regcode={registration_code}'
-            }
-            
-            request_data = f'{{"Cmd":"OpenCamera","Parameters":{{"RegistrationCode":"{registration_code}"}}}}'
-            logger.info(f"=== ВКЛЮЧЕНИЕ КАМЕРЫ ===")
-            logger.info(f"Принтер: {registration_code}")
-            logger.info(f"URL: {self.base_url}{endpoint}")
-            logger.info(f"Данные запроса: {request_data}")
-            
-            response = self.session.post(
-                f"{self.base_url}{endpoint}",
-                data=request_data,
-                headers=headers
-            )
-            
-            logger.info(f"Статус ответа: {response.status_code}")
-            logger.info(f"Заголовки ответа: {dict(response.headers)}")
-            logger.info(f"Текст ответа: {response.text[:500]}...")
-            
-            if response.status_code == 200:
-                try:
-                    api_data = response.json()
-                    logger.info(f"JSON ответ: {api_data}")
-                    
-                    if api_data.get('ErrorCode') == 200:
-                        logger.info("✅ Камера успешно включена")
-                        return True
-                    else:
-                        logger.error(f"❌ Ошибка включения камеры: {api_data.get('Message', 'Unknown error')}")
-                except Exception as e:
-                    logger.error(f"❌ Ошибка парсинга JSON ответа включения камеры: {e}")
-                    logger.error(f"Ответ сервера: {response.text}")
-            else:
-                logger.error(f"❌ HTTP ошибка при включении камеры: {response.status_code}")
-                logger.error(f"Ответ сервера: {response.text}")
+            logger.debug("Включение камеры принтера %s", registration_code)
+            # Включение камеры не является чтением, поэтому не повторяется при сбоях сети
+            api_data = self._command("OpenCamera", registration_code, timeout=timeout, retry=False)
+            if api_data:
+                logger.debug("✅ Камера принтера %s включена", registration_code)
+                return True
+            error_limiter.log(logger, logging.ERROR, ("OpenCamera", registration_code, 'failed'),
+                              "❌ Не удалось включить камеру принтера %s", registration_code)
                 
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            logger.error(f"❌ Ошибка при включении камеры: {e}")
-            import traceback
-            logger.error(f"Трассировка: {traceback.format_exc()}")
+            error_limiter.log(logger, logging.ERROR, ("OpenCamera", registration_code, 'failed'),
+                              "❌ Ошибка при включении камеры %s: %s", registration_code, e)
+            logger.debug("Трассировка ошибки камеры %s", registration_code, exc_info=True)
             
         return False
     
-    def get_printer_snapshot(self, registration_code: str = "ULJMGV") -> Optional[str]:
+    def get_printer_snapshot(self, registration_code: str = "ULJMGV", timeout: Optional[float] = None) -> Optional[str]:
         """Получение снепшота с камеры принтера"""
-        if not self.is_authenticated:
-            logger.info("Не авторизован, пробуем авторизоваться...")
-            if not self.login():
-                logger.error("Не удалось авторизоваться для получения снепшота")
-                return None
-                
         try:
-            endpoint = "/user/printer"
-            
-            data = {
-                "Cmd": "GetPrinterSnapshot",
-                "Parameters": {
-                    "RegistrationCode": registration_code
-                }
-            }
-            
-            headers = {
-                'accept': 'application/json, text/javascript, */*; q=0.01',
-                'content-type': 'application/x-www-form-urlencoded;charset=UTF-8',
-                'x-requested-with': 'XMLHttpRequest',
-                'origin': self.base_url,
-                'referer': f'{self.base_url}/printerDetail.html?regcode={registration_code}'
-            }
-            
-            request_data = f'{{"Cmd":"GetPrinterSnapshot","Parameters":{{"RegistrationCode":"{registration_code}"}}}}'
-            logger.info(f"=== ПОЛУЧЕНИЕ СНЕПШОТА ===")
-            logger.info(f"Принтер: {registration_code}")
-            logger.info(f"URL: {self.base_url}{endpoint}")
-            logger.info(f"Данные запроса: {request_data}")
-            
-            response = self.session.post(
-                f"{self.base_url}{endpoint}",
-                data=request_data,
-                headers=headers
-            )
-            
-            logger.info(f"Статус ответа: {response.status_code}")
-            logger.info(f"Размер ответа: {len(response.text)} символов")
-            
-            if response.status_code == 200:
-                try:
-                    api_data = response.json()
-                    logger.info(f"JSON структура ответа: {list(api_data.keys()) if isinstance(api_data, dict) else 'Не словарь'}")
-                    
-                    if api_data.get('ErrorCode') == 200:
-                        snapshot_data = api_data.get('Snapshot', '')
-                        if snapshot_data:
-                            data_size = len(snapshot_data)
-                            logger.info(f"✅ Снепшот успешно получен, размер: {data_size} символов")
-                            logger.info(f"Начало данных: {snapshot_data[:50]}...")
-                            return snapshot_data
-                        else:
-                            logger.warning("❌ Пустой снепшот от сервера")
-                            logger.info(f"Полный ответ: {api_data}")
-                    else:
-                        logger.error(f"❌ API вернул ошибку: {api_data.get('Message', 'Unknown error')}")
-                        logger.info(f"Полный ответ: {api_data}")
-                except Exception as e:
-                    logger.error(f"❌ Ошибка парсинга JSON ответа снепшота: {e}")
-                    logger.error(f"Ответ сервера (первые 1000 символов): {response.text[:1000]}")
-            else:
-                logger.error(f"❌ HTTP ошибка при получении снепшота: {response.status_code}")
-                logger.error(f"Ответ сервера: {response.text[:500]}")
+            logger.debug("Запрос снепшота принтера %s", registration_code)
+            api_data = self._command("GetPrinterSnapshot", registration_code, timeout=timeout)
+            if api_data:
+                snapshot_data = api_data.get('Snapshot', '')
+                if snapshot_data:
+                    logger.debug("✅ Снепшот принтера %s получен, размер: %s символов", registration_code, len(snapshot_data))
+                    return snapshot_data
+                error_limiter.log(logger, logging.WARNING, ("GetPrinterSnapshot", registration_code, 'empty'),
+                                  "❌ Пустой снепшот от сервера для принтера %s", registration_code)
                 
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            logger.error(f"❌ Ошибка при получении снепшота: {e}")
-            import traceback
-            logger.error(f"Трассировка: {traceback.format_exc()}")
+            error_limiter.log(logger, logging.ERROR, ("GetPrinterSnapshot", registration_code, 'failed'),
+                              "❌ Ошибка при получении снепшота %s: %s", registration_code, e)
+            logger.debug("Трассировка ошибки снепшота %s", registration_code, exc_info=True)
             
         return None
-
+    
     def logout(self):
         """Выход из системы"""
         try:
-            self.session.post(f"{self.base_url}/logout")
+            self.session.post(f"{self.base_url}/logout", timeout=self.timeout)
         except:
             pass
-        self.is_authenticated = False
+        self.invalidate_session()
@@ -0,0 +1,284 @@
+import os
+import re
+import struct
+import threading
+import time
+import logging
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Callable
+
+from log_utils import error_limiter
+
+logger = logging.getLogger(__name__)
+
+# Числовые поля телеметрии в порядке колонок записи
+TELEMETRY_FIELDS = (
+    'extruder_temp',
+    'extruder_target',
+    'bed_temp',
+    'bed_target',
+    'progress_percent',
+    'duration',
+)
+
+# Запись фиксированной длины: время (float64), температуры и прогресс (float32),
+# длительность печати в секундах, как поле duration облака (uint32) - 32 байта на замер
+RECORD = struct.Struct('<d5fI')
+RECORD_SIZE = RECORD.size
+
+# Заголовок файла: сигнатура, версия формата и размер записи
+HEADER = struct.Struct('<8sHH4x')
+MAGIC = b'SZ3DPTLM'
+FORMAT_VERSION = 1
+
+_SAFE_CODE = re.compile(r'[^A-Za-z0-9_-]')
+
+
+def safe_code(registration_code: str) -> str:
+    """Код принтера, пригодный для имени файла"""
+    return _SAFE_CODE.sub('_', registration_code)
+
+
+def status_sample(status: Dict[str, Any]) -> Tuple[float, ...]:
+    """Значения колонок телеметрии из результата parse_printer_status()"""
+    extruder = status.get('extruder_temp') or {}
+    bed = status.get('bed_temp') or {}
+    return (
+        float(extruder.get('current') or 0),
+        float(extruder.get('target') or 0),
+        float(bed.get('current') or 0),
+        float(bed.get('target') or 0),
+        float(status.get('progress_percent') or 0),
+        float(status.get('duration') or 0),
+    )
+
+
+class TelemetrySeries:
+    """Замеры одного принтера за интервал в виде колонок"""
+
+    __slots__ = ('timestamps', 'columns')
+
+    def __init__(self, timestamps: List[float], columns: Dict[str, List[float]]):
+        self.timestamps = timestamps
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def to_dict(self, precision: int = 3) -> Dict[str, Any]:
+        return {
+            'count': len(self.timestamps),
+            'timestamps': [round(timestamp, 3) for timestamp in self.timestamps],
+            'values': {field: [round(value, precision) for value in values]
+                       for field, values in self.columns.items()},
+        }
+
+
+class RecordFile:
+    """Файл записей фиксированной длины, упорядоченных по времени.
+
+    Первое поле каждой записи - время (float64), поэтому интервал находится
+    бинарным поиском по файлу и читается одним блоком.
+    """
+
+    def __init__(self, path: str, record: struct.Struct, magic: bytes = MAGIC):
+        self.path = path
+        self.record = record
+        self.magic = magic
+
+    def _count(self, f) -> int:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size < HEADER.size:
+            return 0
+        f.seek(0)
+        magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != self.magic or version != FORMAT_VERSION or record_size != self.record.size:
+            raise ValueError(f"Неподдерживаемый формат файла {self.path}")
+        return (size - HEADER.size) // self.record.size
+
+    def _timestamp_at(self, f, index: int) -> float:
+        f.seek(HEADER.size + index * self.record.size)
+        return struct.unpack('<d', f.read(8))[0]
+
+    def _lower_bound(self, f, count: int, timestamp: float) -> int:
+        """Индекс первой записи со временем не меньше timestamp"""
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._timestamp_at(f, middle) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def append(self, payload: bytes):
+        """Дозапись одной или нескольких упакованных записей"""
+        with open(self.path, 'ab') as f:
+            if f.tell() == 0:
+                f.write(HEADER.pack(self.magic, FORMAT_VERSION, self.record.size))
+            else:
+                # Обрезаем недописанную запись после аварийной остановки
+                partial = (f.tell() - HEADER.size) % self.record.size
+                if partial:
+                    f.truncate(f.tell() - partial)
+                    f.seek(0, os.SEEK_END)
+            f.write(payload)
+
+    def last_record(self) -> Optional[bytes]:
+        """Последняя полная запись файла"""
+        try:
+            with open(self.path, 'rb') as f:
+                count = self._count(f)
+                if not count:
+                    return None
+                f.seek(HEADER.size + (count - 1) * self.record.size)
+                return f.read(self.record.size)
+        except FileNotFoundError:
+            return None
+
+    def last_timestamp(self) -> Optional[float]:
+        record = self.last_record()
+        return struct.unpack_from('<d', record)[0] if record else None
+
+    def truncate_before(self, timestamp: float) -> int:
+        """Удаление записей старше timestamp (перезапись файла), возвращает число удаленных"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return 0
+        with f:
+            count = self._count(f)
+            first = self._lower_bound(f, count, timestamp)
+            if not first:
+                return 0
+            f.seek(HEADER.size + first * self.record.size)
+            tail = f.read((count - first) * self.record.size)
+
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as out:
+            out.write(HEADER.pack(self.magic, FORMAT_VERSION, self.record.size))
+            out.write(tail)
+        os.replace(tmp_path, self.path)
+        return first
+
+    def count_range(self, start: float, end: float) -> int:
+        """Число записей в интервале [start, end] без чтения самих записей"""
+        try:
+            with open(self.path, 'rb') as f:
+                count = self._count(f)
+                return self._lower_bound(f, count, end + 1e-6) - self._lower_bound(f, count, start)
+        except FileNotFoundError:
+            return 0
+
+    def read_range(self, start: float, end: float) -> bytes:
+        """Блок записей в интервале [start, end]"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return b''
+        with f:
+            count = self._count(f)
+            first = self._lower_bound(f, count, start)
+            last = self._lower_bound(f, count, end + 1e-6)
+            if last <= first:
+                return b''
+            f.seek(HEADER.size + first * self.record.size)
+            return f.read((last - first) * self.record.size)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    @property
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+
+class TelemetryStore:
+    """Append-only хранилище телеметрии: отдельный файл на принтер, записи фиксированной длины"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._last_timestamps: Dict[str, float] = {}
+        self._listeners: List[Callable[[str, float, Tuple[float, ...]], None]] = []
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, registration_code: str) -> str:
+        return os.path.join(self.directory, f'{safe_code(registration_code)}.tlm')
+
+    def file(self, registration_code: str) -> RecordFile:
+        return RecordFile(self.path(registration_code), RECORD)
+
+    def _lock(self, registration_code: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(registration_code, threading.Lock())
+
+    def add_listener(self, callback: Callable[[str, float, Tuple[float, ...]], None]):
+        """Подписка на записанные замеры: callback(код, время, значения колонок)"""
+        self._listeners.append(callback)
+
+    def append(self, registration_code: str, values: Sequence[float], timestamp: Optional[float] = None) -> bool:
+        """Добавление замера; замер не новее последнего записанного пропускается"""
+        timestamp = time.time() if timestamp is None else timestamp
+        record_file = self.file(registration_code)
+        with self._lock(registration_code):
+            last = self._last_timestamps.get(registration_code)
+            if last is None:
+                last = record_file.last_timestamp()
+            if last is not None and timestamp <= last:
+                return False
+
+            duration = max(0, min(int(values[5]), 0xFFFFFFFF))
+            record = RECORD.pack(timestamp, *values[:5], duration)
+            record_file.append(record)
+            self._last_timestamps[registration_code] = timestamp
+
+        # Обработчики получают значения в том виде, в каком они записаны (float32)
+        values = RECORD.unpack(record)[1:]
+        for callback in self._listeners:
+            try:
+                callback(registration_code, timestamp, values)
+            except Exception as e:
+                logger.error("Ошибка обработчика телеметрии принтера %s: %s", registration_code, e)
+        return True
+
+    def record_status(self, registration_code: str, status: Optional[Dict[str, Any]]):
+        """Обработчик статусов парка: сохраняет каждый успешно полученный статус"""
+        if not status:
+            return
+        try:
+            self.append(registration_code, status_sample(status))
+        except (OSError, ValueError) as e:
+            error_limiter.log(logger, logging.ERROR, ('telemetry', registration_code),
+                              "Не удалось записать телеметрию принтера %s: %s", registration_code, e)
+
+    def count(self, registration_code: str, start: float, end: float) -> int:
+        """Число замеров в интервале"""
+        return self.file(registration_code).count_range(start, end)
+
+    def read_block(self, registration_code: str, start: float, end: float) -> bytes:
+        """Упакованные записи RECORD за интервал"""
+        return self.file(registration_code).read_range(start, end)
+
+    def read(self, registration_code: str, start: float, end: float,
+             fields: Optional[Sequence[str]] = None) -> TelemetrySeries:
+        """Замеры в интервале [start, end] для выбранных полей"""
+        fields = list(fields or TELEMETRY_FIELDS)
+        indexes = [TELEMETRY_FIELDS.index(field) + 1 for field in fields]
+        timestamps: List[float] = []
+        columns: Dict[str, List[float]] = {field: [] for field in fields}
+        for record in RECORD.iter_unpack(self.file(registration_code).read_range(start, end)):
+            timestamps.append(record[0])
+            for field, index in zip(fields, indexes):
+                columns[field].append(record[index])
+        return TelemetrySeries(timestamps, columns)
+
+    def disk_usage(self, registration_code: str) -> int:
+        return self.file(registration_code).size
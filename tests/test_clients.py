@@ -0,0 +1,54 @@
+import asyncio
+import logging
+import unittest
+
+from cloud_stub import CloudStubServer
+from sz3dp_client import SZ3DPCloudClient, is_auth_failure
+from sz3dp_async_client import AsyncSZ3DPCloudClient
+
+logging.disable(logging.WARNING)
+
+MAX_RETRIES = 2
+
+
+class AuthFailureTest(unittest.TestCase):
+    def test_html_login_page_is_auth_failure(self):
+        self.assertTrue(is_auth_failure(200, None, 'text/html; charset=utf-8', None))
+
+    def test_html_proxy_error_is_not_auth_failure(self):
+        for status in (429, 500, 502, 503, 504):
+            self.assertFalse(is_auth_failure(status, None, 'text/html', None))
+
+
+class ProxyErrorRetryTest(unittest.TestCase):
+    """HTML страница 502 от прокси повторяется с задержкой и не вызывает повторного входа"""
+
+    def setUp(self):
+        self.stub = CloudStubServer(error_rate=1.0, proxy_errors=True).start()
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def assert_retried_without_login(self, authenticated: bool):
+        self.assertEqual(self.stub.command_counts.get('GetPrinterStatus'), MAX_RETRIES + 1)
+        self.assertEqual(self.stub.logins, 1)
+        self.assertTrue(authenticated)
+
+    def test_sync_client(self):
+        client = SZ3DPCloudClient('test@example.com', 'test', self.stub.base_url,
+                                  max_retries=MAX_RETRIES, backoff_base=0.001)
+        self.assertIsNone(client.get_printer_status('AAA'))
+        self.assert_retried_without_login(client.is_authenticated)
+
+    def test_async_client(self):
+        async def fetch():
+            async with AsyncSZ3DPCloudClient('test@example.com', 'test', self.stub.base_url,
+                                             max_retries=MAX_RETRIES, backoff_base=0.001) as client:
+                self.assertIsNone(await client.get_printer_status('AAA'))
+                return client.is_authenticated
+
+        self.assert_retried_without_login(asyncio.run(fetch()))
+
+
+if __name__ == '__main__':
+    unittest.main()
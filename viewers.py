@@ -0,0 +1,88 @@
+import threading
+import time
+import logging
+from typing import Dict, Any, Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ViewerTracker:
+    """Зрители принтеров: подписки на поток изменений и недавние запросы снепшотов.
+
+    Открытые подписки считаются в памяти процесса. Кроме того, каждое обращение
+    зрителя отмечается в StateStore (set_watch) и действует еще grace секунд,
+    поэтому зрителей веб-воркеров видит и отдельный процесс-опросчик, а короткий
+    перерыв (перезагрузка страницы, переподключение потока) не закрывает камеру.
+    """
+
+    def __init__(self, store, grace: float = 120.0):
+        self.store = store
+        self.grace = grace
+        self._lock = threading.Lock()
+        self._streams: Dict[str, int] = {}
+        # Последняя записанная в хранилище отметка по принтерам
+        self._written: Dict[str, float] = {}
+
+    def touch(self, registration_code: str):
+        """Обращение зрителя; запись в хранилище не чаще раза в четверть grace"""
+        until = time.time() + self.grace
+        with self._lock:
+            if until - self._written.get(registration_code, 0.0) < self.grace / 4:
+                return
+            self._written[registration_code] = until
+        self.store.set_watch(registration_code, until)
+
+    def subscribe(self, codes: Iterable[str]):
+        codes = list(codes)
+        with self._lock:
+            for code in codes:
+                self._streams[code] = self._streams.get(code, 0) + 1
+        for code in codes:
+            self.touch(code)
+
+    def unsubscribe(self, codes: Iterable[str]):
+        with self._lock:
+            for code in codes:
+                count = self._streams.get(code, 0) - 1
+                if count > 0:
+                    self._streams[code] = count
+                else:
+                    self._streams.pop(code, None)
+
+    def watching(self, messages: Iterator[str], codes: Iterable[str]) -> Iterator[str]:
+        """Поток сообщений подписчика: зритель учитывается, пока клиент подключен"""
+        codes = list(codes)
+        self.subscribe(codes)
+        try:
+            for message in messages:
+                # Поток регулярно отправляет keepalive, поэтому отметка не истекает
+                for code in codes:
+                    self.touch(code)
+                yield message
+        finally:
+            self.unsubscribe(codes)
+            close = getattr(messages, 'close', None)
+            if close:
+                close()
+
+    def streams(self, registration_code: str) -> int:
+        with self._lock:
+            return self._streams.get(registration_code, 0)
+
+    def active(self, registration_code: str) -> bool:
+        """Есть ли у принтера зрители в этом или другом процессе"""
+        return self.streams(registration_code) > 0 or self.store.watch_until(registration_code) > time.time()
+
+    def stats(self, codes: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            streams = dict(self._streams)
+        result = {}
+        for code in dict.fromkeys([*(codes or []), *streams]):
+            until = self.store.watch_until(code)
+            result[code] = {
+                'active': streams.get(code, 0) > 0 or until > now,
+                'streams': streams.get(code, 0),
+                'expires_in': round(until - now, 1) if until > now else None,
+            }
+        return result